@@ -1,10 +1,21 @@
 import os
 import base64
+import hashlib
 import tempfile
 import streamlit as st
 import PyPDF2
 import uuid
 
+from cache import LRUCache
+from chunk_store import ChunkStore, DocumentRecord, SearchHit
+from extractive_qa import SentenceIndex
+from ollama_client import OllamaClient
+from ollama_dispatcher import PRIORITY_HIGH, OllamaDispatcher, OverloadedError
+from metrics import PAGES_EXTRACTED, configure_logging, start_metrics_server, timed
+from profiler import profiled
+from query_router import QueryRouter
+from reranker import Reranker, load_cross_encoder
+
 # Create a simple PDF QA app without dependencies on external APIs
 
 class SimpleVectorStore:
@@ -12,8 +23,14 @@ class SimpleVectorStore:
     
     def __init__(self):
         self.documents = {}
+        self.chunk_store = ChunkStore()
+        self.sentence_index = SentenceIndex()
+        
+        # Streamlit reruns repeat searches; results are valid until a write
+        self.version = 0
+        self.result_cache = LRUCache(256, name="search_results")
     
-    def add_document(self, text, metadata=None):
+    def add_document(self, text, metadata=None, pages=None):
         """Add a document to the store"""
         if not text:
             return None
@@ -25,16 +42,30 @@ class SimpleVectorStore:
         doc_metadata = metadata or {}
         doc_metadata['doc_id'] = doc_id
         
-        # Store document
-        self.documents[doc_id] = {
-            'text': text,
-            'metadata': doc_metadata
-        }
+        # Store document, keeping its text in the shared chunk buffer
+        chunk = self.chunk_store.append(text)
+        self.documents[doc_id] = DocumentRecord(self.chunk_store, chunk, doc_metadata)
+        
+        # Index sentences for extractive answers
+        self.sentence_index.add_document(doc_id, pages or text, doc_metadata)
+        self.version += 1
         
         return doc_id
     
     def search(self, query, k=5):
         """Basic search for documents containing the query terms"""
+        with timed("retrieval") as log:
+            matches = self.result_cache.get((query, k), self.version)
+            if matches is not None:
+                log["cache"] = "hit"
+            else:
+                matches = tuple(self._search(query, k))
+                self.result_cache.put((query, k), matches, self.version)
+            log["results"] = len(matches)
+        return list(matches)
+    
+    def _search(self, query, k):
+        """Score documents by the number of query terms they contain"""
         if not query or not self.documents:
             return []
             
@@ -44,8 +75,8 @@ class SimpleVectorStore:
         scores = {}
         
         # Score each document based on how many query terms it contains
-        for doc_id, doc_data in self.documents.items():
-            doc_text = doc_data['text'].lower()
+        for doc_id, record in self.documents.items():
+            doc_text = record.text.lower()
             score = 0
             
             # Count matches for each query term
@@ -62,24 +93,14 @@ class SimpleVectorStore:
         
         # Return top k documents
         for doc_id, score in sorted_docs[:k]:
-            matches.append({
-                'document': self.documents[doc_id]['text'],
-                'metadata': self.documents[doc_id]['metadata'],
-                'id': doc_id,
-                'score': score
-            })
+            matches.append(SearchHit(doc_id, self.documents[doc_id], score=score))
         
         # If no matches were found with term splitting,
         # fallback to simple substring search
         if not matches:
-            for doc_id, doc_data in self.documents.items():
+            for doc_id, record in self.documents.items():
                 # Always return at least the first document as a fallback
-                matches.append({
-                    'document': doc_data['text'],
-                    'metadata': doc_data['metadata'],
-                    'id': doc_id,
-                    'score': 1  # Minimum score for fallback
-                })
+                matches.append(SearchHit(doc_id, record, score=1))  # Minimum score for fallback
                 break
         
         return matches
@@ -87,14 +108,22 @@ class SimpleVectorStore:
     def delete_document(self, doc_id):
         """Delete a document from the store"""
         if doc_id in self.documents:
-            del self.documents[doc_id]
+            record = self.documents.pop(doc_id)
+            self.chunk_store.delete(record.chunk)
+            self.sentence_index.delete_document(doc_id)
+            self.version += 1
             return True
         return False
 
 
 def extract_text_from_pdf(pdf_file):
     """Extract text from a PDF file"""
-    text = ""
+    return "".join(page + "\n\n" for page in extract_pages_from_pdf(pdf_file))
+
+
+def extract_pages_from_pdf(pdf_file):
+    """Extract the text of each page of a PDF file"""
+    pages = []
     
     # Create a temporary file to store the PDF
     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
@@ -111,13 +140,16 @@ def extract_text_from_pdf(pdf_file):
     
     try:
         # Extract text using PyPDF2
-        with open(temp_path, 'rb') as file:
+        with open(temp_path, 'rb') as file, timed("extraction") as log:
             reader = PyPDF2.PdfReader(file)
             num_pages = len(reader.pages)
+            log["pages"] = num_pages
             
             for page_num in range(num_pages):
-                page = reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
+                with timed("extract_page", page=page_num + 1):
+                    page = reader.pages[page_num]
+                    pages.append(page.extract_text())
+                PAGES_EXTRACTED.inc()
     except Exception as e:
         st.error(f"Error extracting text: {e}")
     finally:
@@ -125,7 +157,7 @@ def extract_text_from_pdf(pdf_file):
         if os.path.exists(temp_path):
             os.remove(temp_path)
     
-    return text
+    return pages
 
 
 def display_pdf(pdf_file):
@@ -155,14 +187,22 @@ def display_pdf(pdf_file):
     return pdf_display
 
 
-def generate_answer(query, documents, chat_history=None):
+def generate_answer(query, documents, chat_history=None, answer_mode="extractive", sentence_index=None):
     """
     Generate a direct answer from the PDF content
     simulating responses from Llama 3.1 on Ollama
+    
+    In extractive mode the answer is built from the best matching sentences
+    in the sentence index, with highlighted terms and page citations.
     """
     if not documents:
         return "Please upload a PDF document first so I can answer your questions."
     
+    if answer_mode == "extractive" and sentence_index is not None:
+        answer = sentence_index.answer(query)
+        if answer:
+            return answer.format()
+    
     # Extract all document text
     all_text = "\n\n".join([d['document'] for d in documents])
     
@@ -222,6 +262,21 @@ def generate_answer(query, documents, chat_history=None):
     return response
 
 
+@st.cache_resource
+def load_ollama_dispatcher(base_url):
+    """
+    Get the dispatcher for an Ollama server, shared by all sessions so that
+    their requests go through one queue
+    
+    Args:
+        base_url (str): Base URL of the Ollama server
+        
+    Returns:
+        OllamaDispatcher: Dispatcher wrapping a client for the server
+    """
+    return OllamaDispatcher(OllamaClient(base_url=base_url))
+
+
 def main():
     # Page configuration
     st.set_page_config(
@@ -230,10 +285,27 @@ def main():
         layout="wide"
     )
     
+    # Structured JSON logs on stderr
+    configure_logging(os.environ.get("LOG_LEVEL", "INFO"))
+    
+    # Export Prometheus metrics when a port is configured
+    if os.environ.get("METRICS_PORT"):
+        start_metrics_server(port=int(os.environ["METRICS_PORT"]))
+    
+    # Generate answers with Ollama when a server is configured, otherwise
+    # simulate them from the document text
+    ollama = load_ollama_dispatcher(os.environ["OLLAMA_URL"]) if os.environ.get("OLLAMA_URL") else None
+    
     # Initialize session state
     if "vector_store" not in st.session_state:
         st.session_state.vector_store = SimpleVectorStore()
     
+    if "query_router" not in st.session_state:
+        st.session_state.query_router = QueryRouter(st.session_state.vector_store.sentence_index)
+    
+    if "reranker" not in st.session_state:
+        st.session_state.reranker = Reranker(cross_encoder=load_cross_encoder())
+    
     if "current_pdf" not in st.session_state:
         st.session_state.current_pdf = None
     
@@ -244,6 +316,20 @@ def main():
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
     
+    # Answer mode selection
+    answer_modes = {
+        "Auto": "auto",
+        "Extractive (instant)": "extractive",
+        "Generative (Llama 3.1)": "generative",
+    }
+    answer_mode = answer_modes[st.sidebar.radio("Answer mode", list(answer_modes))]
+    
+    # Per-route latency of answers routed in auto mode
+    route_stats = st.session_state.query_router.stats()
+    if route_stats:
+        with st.sidebar.expander("Route latency"):
+            st.json(route_stats)
+    
     # Main title
     st.title("PDF Chat with Llama 3.1")
     st.markdown("""
@@ -266,25 +352,35 @@ def main():
             # Display file details
             st.write(f"**File:** {uploaded_file.name} ({uploaded_file.size} bytes)")
             
-            # Process the PDF
-            with st.spinner("Processing PDF..."):
-                # Extract text
-                pdf_text = extract_text_from_pdf(uploaded_file)
-                
-                # Add to vector store
-                doc_id = st.session_state.vector_store.add_document(
-                    text=pdf_text,
-                    metadata={"filename": uploaded_file.name}
-                )
-                
-                # Add to session state if not already there
-                if not any(doc["name"] == uploaded_file.name for doc in st.session_state.documents):
-                    st.session_state.documents.append({
-                        "id": doc_id,
-                        "name": uploaded_file.name
-                    })
-                
-                st.success("PDF processed successfully!")
+            # Streamlit reruns the script on every interaction; only process
+            # a file that is new or whose content changed
+            file_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            loaded = next((doc for doc in st.session_state.documents if doc["name"] == uploaded_file.name), None)
+            if loaded is None or loaded["hash"] != file_hash:
+                with st.spinner("Processing PDF..."), profiled("ingest", filename=uploaded_file.name):
+                    # Extract text
+                    pdf_pages = extract_pages_from_pdf(uploaded_file)
+                    pdf_text = "".join(page + "\n\n" for page in pdf_pages)
+                    
+                    # Add to vector store
+                    doc_id = st.session_state.vector_store.add_document(
+                        text=pdf_text,
+                        metadata={"filename": uploaded_file.name},
+                        pages=pdf_pages
+                    )
+                    
+                    if loaded is None:
+                        st.session_state.documents.append({
+                            "id": doc_id,
+                            "name": uploaded_file.name,
+                            "hash": file_hash
+                        })
+                    else:
+                        # The new version replaces the old one
+                        st.session_state.vector_store.delete_document(loaded["id"])
+                        loaded.update(id=doc_id, hash=file_hash)
+                    
+                    st.success("PDF processed successfully!")
             
             # Display PDF using iframe
             st.subheader("PDF Preview")
@@ -371,17 +467,50 @@ def main():
                 "content": user_input
             })
             
-            with st.spinner("Processing..."):
-                # Search for relevant documents
-                results = st.session_state.vector_store.search(user_input)
+            with st.spinner("Processing..."), profiled("answer_question"):
+                # Over-fetch, then keep the best few after reranking
+                reranker = st.session_state.reranker
+                results = reranker.rerank(
+                    user_input,
+                    st.session_state.vector_store.search(user_input, k=reranker.candidates),
+                    k=5
+                )
                 
                 if results:
-                    # Generate answer directly from document content
-                    answer = generate_answer(
-                        user_input, 
-                        results, 
-                        st.session_state.chat_history
-                    )
+                    def generate():
+                        if ollama is not None:
+                            # Interactive questions go ahead of queued ingestion work
+                            return ollama.answer_with_context(
+                                user_input,
+                                [result['document'] for result in results],
+                                priority=PRIORITY_HIGH
+                            )
+                        return generate_answer(
+                            user_input,
+                            results,
+                            st.session_state.chat_history,
+                            answer_mode="generative"
+                        )
+                    
+                    try:
+                        # Generate answer directly from document content
+                        if answer_mode == "auto":
+                            # Falls back to an extractive answer when Ollama is overloaded
+                            answer, _ = st.session_state.query_router.answer(user_input, generate)
+                        elif answer_mode == "generative":
+                            answer = generate()
+                        else:
+                            answer = generate_answer(
+                                user_input, 
+                                results, 
+                                st.session_state.chat_history,
+                                answer_mode=answer_mode,
+                                sentence_index=st.session_state.vector_store.sentence_index
+                            )
+                    except OverloadedError as e:
+                        st.warning(f"The model is busy, please try again in {e.retry_after} seconds.")
+                        st.session_state.chat_history.pop()
+                        return
                     
                     # Add assistant response to chat history
                     st.session_state.chat_history.append({
@@ -0,0 +1,664 @@
+"""
+End-to-end benchmark for ingestion and question answering
+
+Generates a synthetic PDF corpus, ingests it through PDFProcessor and
+VectorStore, then runs a query workload against VectorStore.search and
+Chatbot.answer_question backed by a local stub Ollama server. Throughput,
+latency percentiles and peak RSS are printed and can be written as JSON and
+compared against a previous run:
+
+    python benchmark.py --documents 20 --pages 10 --output baseline.json
+    python benchmark.py --documents 20 --pages 10 --compare baseline.json
+
+--vector-recall instead measures memory and recall@k of each VectorIndex
+storage mode (float32, int8, product quantization) on synthetic vectors:
+
+    python benchmark.py --vector-recall --vectors 100000 --dim 384
+
+--stress runs ingestion, deletion and search concurrently for the given
+number of seconds and fails if any search saw inconsistent state:
+
+    python benchmark.py --stress 10 --concurrency 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chatbot import Chatbot
+from ollama_client import OllamaClient
+from pdf_processor import PDFProcessor
+from reranker import Reranker
+from vector_index import benchmark_recall
+from vector_store import VectorStore
+
+WORDS = (
+    "system pressure valve pump filter motor sensor controller cable housing bearing seal "
+    "temperature voltage current flow rate cycle maintenance inspection warranty service "
+    "operator manual safety procedure install replace check clean adjust calibrate monitor "
+    "module panel switch relay circuit board firmware display alarm signal output input"
+).split()
+
+COMPONENTS = ("pump", "valve", "motor", "sensor", "filter", "relay", "controller", "bearing")
+UNITS = ("psi", "volts", "rpm", "hours", "degrees", "amps")
+
+
+def make_fact(rng, index):
+    """Return a (sentence, question) pair about a uniquely numbered component"""
+    component = rng.choice(COMPONENTS)
+    unit = rng.choice(UNITS)
+    value = rng.randint(1, 999)
+    sentence = f"The {component} model X{index} is rated at {value} {unit}."
+    question = f"What is the {component} model X{index} rated at?"
+    return sentence, question
+
+
+def _escape_pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """
+    Write a minimal PDF with one Helvetica text block per page
+
+    Args:
+        path (str): Output path
+        pages (list): List of pages, each a list of text lines
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for lines in pages:
+        stream = ["BT", "/F1 10 Tf", "12 TL", "50 750 Td"]
+        for line in lines:
+            stream.append(f"({_escape_pdf_text(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1", "replace")
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+
+    kids = " ".join(f"{number} 0 R" for number in page_numbers)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_numbers)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def generate_corpus(directory, documents, pages, lines_per_page=40, words_per_line=12, seed=0):
+    """
+    Generate a synthetic PDF corpus with one known fact per page
+
+    Args:
+        directory (str): Directory to write the PDFs to
+        documents (int): Number of PDFs
+        pages (int): Pages per PDF
+        lines_per_page (int): Text lines per page
+        words_per_line (int): Words per filler line
+        seed (int): Random seed, so runs are reproducible
+
+    Returns:
+        tuple: (list of PDF paths, list of questions answerable from the corpus)
+    """
+    rng = random.Random(seed)
+    paths = []
+    questions = []
+    fact_index = 0
+
+    for doc_number in range(documents):
+        doc_pages = []
+        for _ in range(pages):
+            lines = [
+                " ".join(rng.choice(WORDS) for _ in range(words_per_line)).capitalize() + "."
+                for _ in range(lines_per_page - 1)
+            ]
+            sentence, question = make_fact(rng, fact_index)
+            fact_index += 1
+            lines.insert(rng.randrange(len(lines) + 1), sentence)
+            questions.append(question)
+            doc_pages.append(lines)
+
+        path = os.path.join(directory, f"synthetic_{doc_number:05d}.pdf")
+        write_pdf(path, doc_pages)
+        paths.append(path)
+
+    return paths, questions
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers the Ollama endpoints used by OllamaClient with canned data"""
+
+    # Overridden per server by StubOllamaServer
+    first_token_delay = 0.0
+    token_delay = 0.0
+    tokens = 20
+    dimensions = 64
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3.1:latest"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/api/embed":
+            texts = payload.get("input", [])
+            if isinstance(texts, str):
+                texts = [texts]
+            self._send_json({"embeddings": [self._embedding(text) for text in texts]})
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._stream_answer(payload, chat=self.path == "/api/chat")
+        else:
+            self.send_error(404)
+
+    def _stream_answer(self, payload, chat):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        time.sleep(self.first_token_delay)
+        for i in range(self.tokens):
+            if i:
+                time.sleep(self.token_delay)
+            text = f"token{i} "
+            chunk = {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+            chunk.update(model=payload.get("model"), done=False)
+            self.wfile.write(json.dumps(chunk).encode() + b"\n")
+            self.wfile.flush()
+
+        final = {"model": payload.get("model"), "done": True, "eval_count": self.tokens}
+        if chat:
+            final["message"] = {"role": "assistant", "content": ""}
+        else:
+            final["response"] = ""
+            final["context"] = [1, 2, 3]
+        self.wfile.write(json.dumps(final).encode() + b"\n")
+
+    def _embedding(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [(digest[i % len(digest)] - 128) / 128 for i in range(self.dimensions)]
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOllamaServer:
+    """Local HTTP server imitating Ollama with configurable latency"""
+
+    def __init__(self, first_token_delay=0.05, token_delay=0.002, tokens=20):
+        handler = type("ConfiguredStubOllamaHandler", (StubOllamaHandler,), {
+            "first_token_delay": first_token_delay,
+            "token_delay": token_delay,
+            "tokens": tokens,
+        })
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-ollama", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(samples, q):
+    """Return the q-th percentile (0-100) of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, unit_count=None):
+    """Summarize a list of latencies measured over a wall-clock interval"""
+    count = len(latencies) if unit_count is None else unit_count
+    return {
+        "count": count,
+        "seconds": round(elapsed, 4),
+        "throughput_per_s": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def run_workload(function, items, concurrency):
+    """Call function on every item, returning per-call latencies and wall time"""
+    def call(item):
+        start = time.perf_counter()
+        function(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(call, items))
+    else:
+        latencies = [call(item) for item in items]
+    return latencies, time.perf_counter() - start
+
+
+def extract_chunks(processor, path, chunk_size=1000, chunk_overlap=200):
+    """Extract a PDF and return (chunk texts, metadata per chunk)"""
+    with open(path, "rb") as f:
+        pages = processor.extract_pages(f)
+    texts, metadatas = [], []
+    for page_number, page_text in enumerate(pages, start=1):
+        for chunk in processor.chunk_text(page_text, chunk_size, chunk_overlap):
+            texts.append(chunk)
+            metadatas.append({"filename": os.path.basename(path), "page": page_number})
+    return texts, metadatas
+
+
+def ingest(paths, vector_store, chunk_size=1000, chunk_overlap=200):
+    """
+    Ingest PDFs page by page into a vector store
+
+    Returns:
+        tuple: (per-document latencies, wall time, number of pages, number of chunks)
+    """
+    processor = PDFProcessor()
+    totals = {"pages": 0, "chunks": 0}
+
+    def ingest_one(path):
+        texts, metadatas = extract_chunks(processor, path, chunk_size, chunk_overlap)
+        totals["pages"] += len({metadata["page"] for metadata in metadatas})
+        vector_store.add_documents(texts, metadatas)
+        totals["chunks"] += len(texts)
+
+    latencies, elapsed = run_workload(ingest_one, paths, concurrency=1)
+    return latencies, elapsed, totals["pages"], totals["chunks"]
+
+
+def cache_sizes(args):
+    """VectorStore cache sizes: the defaults with --cache, else caching disabled"""
+    if args.cache:
+        return {}
+    return {"cache_size": 0, "embedding_cache_size": 0}
+
+
+def run_benchmark(args):
+    """Run the full benchmark and return the results dict"""
+    results = {
+        "config": {
+            "documents": args.documents,
+            "pages": args.pages,
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "answer_mode": args.answer_mode,
+            "embeddings": args.embeddings,
+            "quantization": args.quantization,
+            "rerank": args.rerank,
+            "shards": args.shards,
+            "cache": args.cache,
+            "seed": args.seed,
+        },
+        "phases": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+
+        start = time.perf_counter()
+        paths, questions = generate_corpus(corpus_dir, args.documents, args.pages, seed=args.seed)
+        results["corpus"] = {
+            "generation_seconds": round(time.perf_counter() - start, 4),
+            "bytes": sum(os.path.getsize(path) for path in paths),
+        }
+
+        with StubOllamaServer(first_token_delay=args.first_token_delay, token_delay=args.token_delay) as stub:
+            client = OllamaClient(base_url=stub.base_url)
+
+            embedding_function = None
+            if args.embeddings == "stub":
+                embedding_function = lambda texts: client.embed(texts)["embeddings"]
+
+            vector_store = VectorStore(
+                collection_name=f"benchmark_{os.getpid()}",
+                persist_directory=os.path.join(workdir, "chroma_db"),
+                embedding_function=embedding_function,
+                quantization=args.quantization,
+                shards=args.shards,
+                extractive=args.answer_mode != "generative",
+                **cache_sizes(args)
+            )
+
+            latencies, elapsed, pages, chunks = ingest(paths, vector_store)
+            results["phases"]["ingest"] = summarize(latencies, elapsed)
+            results["phases"]["ingest"]["pages_per_s"] = round(pages / elapsed, 2) if elapsed else 0.0
+            results["phases"]["ingest"]["chunks"] = chunks
+
+            rng = random.Random(args.seed)
+            workload = [rng.choice(questions) for _ in range(args.queries)]
+
+            hits = []
+            latencies, elapsed = run_workload(
+                lambda question: hits.append(bool(vector_store.search(question, k=5))),
+                workload,
+                args.concurrency
+            )
+            results["phases"]["search"] = summarize(latencies, elapsed)
+            # Searches that returned nothing make the answer phase meaningless
+            results["phases"]["search"]["hit_rate"] = round(sum(hits) / len(hits), 3) if hits else 0.0
+
+            chatbot = Chatbot(vector_store, ollama_client=client, reranker=Reranker() if args.rerank else None)
+            latencies, elapsed = run_workload(
+                lambda question: chatbot.answer_question(question, mode=args.answer_mode),
+                workload,
+                args.concurrency
+            )
+            results["phases"]["answer"] = summarize(latencies, elapsed)
+            results["phases"]["answer"]["routes"] = chatbot.router.stats()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def run_stress(args):
+    """
+    Ingest, search and delete concurrently against one VectorStore
+
+    Searches run alone first and then while a writer thread ingests and a
+    second one deletes, so their latency percentiles show whether writes
+    stall reads. Every hit must come from the snapshot the search read;
+    a plain dict hit means search saw an ID the snapshot lacked.
+
+    Returns:
+        dict: Results, with "errors" and "inconsistent" counts that must be 0
+    """
+    results = {"config": {"documents": args.documents, "pages": args.pages, "seconds": args.stress,
+                          "readers": args.concurrency, "quantization": args.quantization,
+                          "shards": args.shards, "cache": args.cache}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+        paths, questions = generate_corpus(corpus_dir, args.documents, args.pages, seed=args.seed)
+        processor = PDFProcessor()
+        chunks = [extract_chunks(processor, path) for path in paths]
+
+        with StubOllamaServer() as stub:
+            client = OllamaClient(base_url=stub.base_url)
+            vector_store = VectorStore(
+                collection_name=f"stress_{os.getpid()}",
+                persist_directory=os.path.join(workdir, "chroma_db"),
+                embedding_function=lambda texts: client.embed(texts)["embeddings"],
+                quantization=args.quantization,
+                shards=args.shards,
+                **cache_sizes(args)
+            )
+            # Half the corpus is loaded up front so there is something to delete
+            added = []
+            for texts, metadatas in chunks[:len(chunks) // 2 or 1]:
+                added.extend(vector_store.add_documents(texts, metadatas))
+
+            counts = {"errors": 0, "inconsistent": 0, "writes": 0, "deletes": 0}
+            lock = threading.Lock()
+            stop = threading.Event()
+
+            def fail(error):
+                with lock:
+                    counts["errors"] += 1
+                print(f"stress error: {error!r}", file=sys.stderr)
+
+            def reader(latencies, seed):
+                rng = random.Random(seed)
+                while not stop.is_set():
+                    try:
+                        start = time.perf_counter()
+                        hits = vector_store.search(rng.choice(questions), k=5)
+                        latencies.append(time.perf_counter() - start)
+                        for hit in hits:
+                            if isinstance(hit, dict):
+                                with lock:
+                                    counts["inconsistent"] += 1
+                            hit["document"]
+                        vector_store.get_all_documents()
+                    except Exception as e:
+                        fail(e)
+
+            def writer():
+                rng = random.Random(args.seed)
+                while not stop.is_set():
+                    try:
+                        texts, metadatas = rng.choice(chunks)
+                        ids = vector_store.add_documents(texts, [dict(metadata) for metadata in metadatas])
+                        with lock:
+                            added.extend(ids)
+                            counts["writes"] += 1
+                    except Exception as e:
+                        fail(e)
+
+            def deleter():
+                rng = random.Random(args.seed + 1)
+                while not stop.is_set():
+                    try:
+                        with lock:
+                            victims = [added.pop(rng.randrange(len(added))) for _ in range(min(8, len(added)))]
+                        vector_store.delete_documents(victims)
+                        with lock:
+                            counts["deletes"] += 1
+                        time.sleep(0.001)
+                    except Exception as e:
+                        fail(e)
+
+            def run_phase(seconds, with_writers):
+                latencies = []
+                threads = [threading.Thread(target=reader, args=(latencies, args.seed + i))
+                           for i in range(args.concurrency)]
+                if with_writers:
+                    threads += [threading.Thread(target=writer), threading.Thread(target=deleter)]
+                stop.clear()
+                for thread in threads:
+                    thread.start()
+                time.sleep(seconds)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                return summarize(latencies, seconds)
+
+            results["phases"] = {
+                "search_idle": run_phase(args.stress / 4, with_writers=False),
+                "search_under_writes": run_phase(args.stress, with_writers=True),
+            }
+
+    results.update(counts)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {
+    "throughput_per_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline run
+
+    Args:
+        results (dict): Current results
+        baseline (dict): Results loaded from a previous --output file
+        tolerance (float): Allowed relative regression, e.g. 0.1 for 10%
+
+    Returns:
+        list: Human-readable descriptions of regressions
+    """
+    regressions = []
+    for phase, current in results["phases"].items():
+        previous = baseline.get("phases", {}).get(phase)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{phase}.{metric}: {old} -> {new} ({change:+.1%})")
+
+    old_rss, new_rss = baseline.get("peak_rss_mb"), results.get("peak_rss_mb")
+    if old_rss and new_rss and (new_rss - old_rss) / old_rss > tolerance:
+        regressions.append(f"peak_rss_mb: {old_rss} -> {new_rss} ({(new_rss - old_rss) / old_rss:+.1%})")
+    return regressions
+
+
+def print_report(results):
+    print(f"Corpus: {results['config']['documents']} PDFs x {results['config']['pages']} pages, "
+          f"{results['corpus']['bytes']} bytes")
+    print(f"{'phase':<10}{'count':>8}{'ops/s':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for phase, stats in results["phases"].items():
+        print(f"{phase:<10}{stats['count']:>8}{stats['throughput_per_s']:>12}"
+              f"{stats['p50_ms']:>12}{stats['p95_ms']:>12}{stats['p99_ms']:>12}")
+    print(f"Peak RSS: {results['peak_rss_mb']} MiB")
+
+
+def print_recall_report(results):
+    print(f"{'mode':<8}{'heap MiB':>10}{'RSS MiB':>10}{'disk MiB':>10}{'bytes/vec':>12}{'recall@k':>10}{'query ms':>10}")
+    for row in results:
+        rss = "n/a" if row["rss_mb"] is None else row["rss_mb"]
+        print(f"{row['mode']:<8}{row['heap_mb']:>10}{rss:>10}{row['disk_mb']:>10}{row['bytes_per_vector']:>12}"
+              f"{row['recall_at_k']:>10}{row['query_ms']:>10}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark PDF ingestion and question answering")
+    parser.add_argument("--documents", type=int, default=10, help="number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=5, help="pages per PDF")
+    parser.add_argument("--queries", type=int, default=200, help="number of questions to ask")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent query threads")
+    parser.add_argument("--answer-mode", default="generative", choices=("auto", "generative", "extractive"),
+                        help="mode passed to Chatbot.answer_question")
+    parser.add_argument("--embeddings", default="stub", choices=("stub", "default"),
+                        help="embed with the stub Ollama server, or the vector store's default model")
+    parser.add_argument("--quantization", choices=("none", "int8", "pq"),
+                        help="serve search from the in-process vector index with this storage mode")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="spread documents over this many collections, searched in parallel")
+    parser.add_argument("--cache", action="store_true",
+                        help="keep the search result and query embedding caches enabled; off by default "
+                             "so repeated questions measure retrieval rather than cache hits")
+    parser.add_argument("--rerank", action="store_true",
+                        help="over-fetch and rerank search results before generation")
+    parser.add_argument("--first-token-delay", type=float, default=0.05,
+                        help="stub Ollama delay before the first token, in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.002,
+                        help="stub Ollama delay between tokens, in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for corpus and workload")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative regression when comparing (default 0.1)")
+    parser.add_argument("--stress", type=float, metavar="SECONDS",
+                        help="only run concurrent ingest/search/delete for this long and check consistency")
+    parser.add_argument("--vector-recall", action="store_true",
+                        help="only measure recall and memory of the vector index storage modes")
+    parser.add_argument("--vectors", type=int, default=50000, help="vectors indexed by --vector-recall")
+    parser.add_argument("--dim", type=int, default=384, help="vector dimensions for --vector-recall")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query for --vector-recall")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.vector_recall:
+        results = benchmark_recall(count=args.vectors, dim=args.dim, k=args.k, queries=args.queries, seed=args.seed)
+        print_recall_report(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    if args.stress:
+        results = run_stress(args)
+        for phase, stats in results["phases"].items():
+            print(f"{phase:<22}{stats['count']:>8} searches  p50 {stats['p50_ms']} ms  "
+                  f"p99 {stats['p99_ms']} ms")
+        print(f"Writes: {results['writes']}, deletes: {results['deletes']}, "
+              f"errors: {results['errors']}, inconsistent hits: {results['inconsistent']}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return 1 if results["errors"] or results["inconsistent"] else 0
+
+    results = run_benchmark(args)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
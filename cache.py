@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with optional entry versions
+
+    An entry stored with a version is only returned to lookups passing the
+    same version, so a cache keyed on data that changes (e.g. an index) is
+    invalidated by bumping a counter instead of clearing it. Stale entries
+    are dropped when looked up or when they fall off the end of the LRU
+    order.
+    """
+
+    def __init__(self, maxsize=256, name="cache"):
+        """
+        Initialize an empty cache
+
+        Args:
+            maxsize (int): Maximum number of entries; 0 disables caching
+            name (str): Label of the cache in the lookup metrics
+        """
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+        # Key -> (version, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version=None):
+        """
+        Look up a value
+
+        Args:
+            key: Hashable key
+            version (optional): Version the entry must have been stored with
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        if self.maxsize <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                # Stored before the data changed
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        CACHE_LOOKUPS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[1]
+
+    def put(self, key, value, version=None):
+        """
+        Store a value, evicting the least recently used entries over maxsize
+
+        Args:
+            key: Hashable key
+            value: Value to cache; None is not cached
+            version (optional): Version lookups must pass to get the value
+        """
+        if self.maxsize <= 0 or value is None:
+            return
+
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
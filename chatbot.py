@@ -1,53 +1,128 @@
 import os
+import time
 import requests
 
+from chunk_store import SearchHit
+from metrics import observe
+from profiler import profiled
+from query_router import QueryRouter
+
 class Chatbot:
     """
     Class for handling the question-answering functionality using Ollama with Llama 3.1
     """
     
-    def __init__(self, vector_store):
+    def __init__(self, vector_store, ollama_client=None, router=None, warm_up=False, reranker=None):
         """
         Initialize the chatbot with a vector store
         
         Args:
             vector_store: Instance of VectorStore class
+            ollama_client (OllamaClient or OllamaDispatcher, optional): Client used for generation;
+                responses are simulated when not provided
+            router (QueryRouter, optional): Router used in "auto" mode
+            warm_up (bool): Load the model in Ollama now so the first
+                question does not wait for a cold model load
+            reranker (Reranker, optional): Reorders over-fetched search results
+                so fewer, more relevant chunks go into the prompt
         """
         # Store vector store reference
         self.vector_store = vector_store
         
+        self.ollama_client = ollama_client
+        self.router = router or QueryRouter(vector_store.sentence_index)
+        self.reranker = reranker
+        
+        if warm_up and ollama_client is not None:
+            ollama_client.preload()
+        
         # Ollama API endpoint - , we need to modify the connection
         # For real deployment, this would be "http://localhost:11434"
         # we need to make Ollama accessible
         self.api_base = "https://your-ollama-service.com"  # This is a placeholder that needs to be replaced
         self.model = "llama3.1"  # Llama 3.1 model
     
-    def answer_question(self, question, max_context_chunks=5):
+    def answer_question(self, question, max_context_chunks=5, mode="auto"):
         """
         Answer a question based on the content in the vector store
         
+        Args:
+            question (str): User question
+            max_context_chunks (int): Maximum number of context chunks to include
+            mode (str): "auto" to let the router pick between a cached,
+                extractive or generated answer, "generative" to always answer
+                with Llama 3.1, or "extractive" to answer instantly with
+                sentences quoted from the documents. Only "generative" works
+                with a VectorStore created without extractive=True
+            
+        Returns:
+            str: AI-generated answer
+            
+        Raises:
+            ValueError: If mode is "auto" or "extractive" and the vector store
+                has no sentence index
+        """
+        with profiled("answer_question", mode=mode):
+            if mode == "extractive":
+                return self.extractive_answer(question)
+            
+            if mode == "auto":
+                # Without a sentence index the router would generate every answer
+                if self.router.sentence_index is None:
+                    raise ValueError(
+                        'Auto mode requires a VectorStore created with extractive=True; use mode="generative" without one'
+                    )
+                answer, _ = self.router.answer(
+                    question,
+                    lambda: self.generate_answer(question, max_context_chunks)
+                )
+                return answer
+            
+            try:
+                return self.generate_answer(question, max_context_chunks)
+            except Exception as e:
+                # Fall back to quoting the documents if generation is unavailable
+                if self.vector_store.sentence_index is not None:
+                    answer = self.vector_store.sentence_index.answer(question)
+                    if answer:
+                        return answer.format()
+                return f"An error occurred: {str(e)}"
+    
+    def generate_answer(self, question, max_context_chunks=5):
+        """
+        Generate an answer with the LLM from the most relevant chunks
+        
         Args:
             question (str): User question
             max_context_chunks (int): Maximum number of context chunks to include
             
         Returns:
             str: AI-generated answer
+            
+        Raises:
+            RuntimeError: If the Ollama API returns an error
         """
         # For local development, we would check Ollama availability
         # we'll simulate a response
         # In a real deployment, you would need to ensure Ollama is accessible
         
         # Search for relevant chunks in the vector store
-        relevant_chunks = self.vector_store.search(question, k=max_context_chunks)
+        if self.reranker is not None:
+            candidates = self.vector_store.search(question, k=max(self.reranker.candidates, max_context_chunks))
+            relevant_chunks = self.reranker.rerank(question, candidates, k=max_context_chunks)
+        else:
+            relevant_chunks = self.vector_store.search(question, k=max_context_chunks)
         
         # Check if we have any relevant chunks
         if not relevant_chunks:
             return "I don't have any documents to answer your question. Please upload some PDFs first."
         
+        assembly_start = time.perf_counter()
+        
         # Extract document content
         chunks = []
         for item in relevant_chunks:
-            if isinstance(item, dict):
+            if isinstance(item, (dict, SearchHit)):
                 # Handle new vector store format
                 if 'document' in item:
                     chunks.append(item['document'])
@@ -60,7 +135,8 @@ class Chatbot:
         # Build context from chunks
         context = "\n\n".join(chunks)
         
-        # Create messages for the API call
+        # Create messages for the API call; the system prompt is identical for
+        # every question so Ollama can keep its prefix cached
         messages = [
             {
                 "role": "system",
@@ -80,30 +156,53 @@ class Chatbot:
                 {question}"""
             }
         ]
+        observe("prompt_assembly", time.perf_counter() - assembly_start)
+        
+        if self.ollama_client is not None:
+            response = self.ollama_client.chat(messages)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            return response.get("message", {}).get("content", "No response generated")
+        
+        # Without an Ollama client we simulate a response
         
-        try:
-            # In a real environment, we would connect to Ollama
-            # we'll simulate a response
+        # Extract the question from the last message
+        user_question = question
+        
+        # Generate a simple response based on the context
+        if context:
+            # Get first 500 characters of context for the simulation
+            context_preview = context[:500] + "..." if len(context) > 500 else context
             
-            # Extract the question from the last message
-            user_question = question
+            # Simple simulation of an AI response
+            simulated_response = (
+                f"Based on the document provided, I can see information about {context_preview.split()[:5]}...\n\n"
+                f"To properly answer your question about '{user_question}', I would need access to the Ollama API with Llama 3.1 model.\n\n"
+                f"In a real deployment, this would connect to Ollama running on localhost:11434. "
+                f"This is a simulation since we're running in Replit without Ollama access."
+            )
             
-            # Generate a simple response based on the context
-            if context:
-                # Get first 500 characters of context for the simulation
-                context_preview = context[:500] + "..." if len(context) > 500 else context
-                
-                # Simple simulation of an AI response
-                simulated_response = (
-                    f"Based on the document provided, I can see information about {context_preview.split()[:5]}...\n\n"
-                    f"To properly answer your question about '{user_question}', I would need access to the Ollama API with Llama 3.1 model.\n\n"
-                    f"In a real deployment, this would connect to Ollama running on localhost:11434. "
-                    f"This is a simulation since we're running in Replit without Ollama access."
-                )
-                
-                return simulated_response
-            else:
-                return "I couldn't find relevant information in the documents to answer your question."
-                
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+            return simulated_response
+        else:
+            return "I couldn't find relevant information in the documents to answer your question."
+    
+    def extractive_answer(self, question, max_sentences=3):
+        """
+        Answer a question with sentences quoted from the documents, without an LLM
+        
+        Args:
+            question (str): User question
+            max_sentences (int): Maximum number of sentences in the answer
+            
+        Returns:
+            str: Highlighted sentences with page citations
+            
+        Raises:
+            ValueError: If the vector store keeps no sentence index
+        """
+        if self.vector_store.sentence_index is None:
+            raise ValueError("Extractive answers require a VectorStore created with extractive=True")
+        answer = self.vector_store.sentence_index.answer(question, k=max_sentences)
+        if not answer:
+            return "I couldn't find relevant information in the documents to answer your question."
+        return answer.format()
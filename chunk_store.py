@@ -0,0 +1,370 @@
+import json
+import mmap
+import os
+from array import array
+from collections.abc import Mapping
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Version 2 dropped the per-chunk document numbers
+FORMAT_VERSION = 2
+
+
+class ChunkStore:
+    """
+    Append-only store keeping the text of every chunk in one UTF-8 buffer
+
+    Each chunk is described by an offset and a length held in typed int64
+    arrays, so storing a chunk costs its UTF-8 bytes plus 17 bytes instead
+    of a Python string and dict per chunk. Which document owns a chunk is
+    recorded by the caller (see DocumentRecord), not here. Text is only
+    decoded when a chunk is read. Deleted chunks are tombstoned and their
+    bytes reclaimed by compact().
+
+    A saved store can be loaded with its buffer memory-mapped, so the text
+    stays in the page cache instead of the process heap.
+
+    Appends never move existing chunks, so one writer can append while
+    other threads read; compacted() leaves the store it copies untouched.
+    """
+
+    def __init__(self):
+        """Initialize an empty store"""
+        self._buffer = bytearray()
+        self._offsets = array("q")
+        self._lengths = array("q")
+        self._alive = bytearray()
+        self._dead_bytes = 0
+        self._mmap_file = None
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def nbytes(self):
+        """Total size of the text buffer and the offset arrays in bytes"""
+        arrays = (self._offsets, self._lengths)
+        return len(self._buffer) + sum(a.itemsize * len(a) for a in arrays) + len(self._alive)
+
+    @property
+    def dead_bytes(self):
+        """Bytes held by deleted chunks until the next compact()"""
+        return self._dead_bytes
+
+    @property
+    def offsets(self):
+        """Chunk offsets as a NumPy array view (a stdlib array without NumPy)"""
+        return self._view(self._offsets)
+
+    @property
+    def lengths(self):
+        """Chunk lengths in bytes as a NumPy array view (a stdlib array without NumPy)"""
+        return self._view(self._lengths)
+
+    def append(self, text):
+        """
+        Store a chunk of text
+
+        Args:
+            text (str): Chunk text
+
+        Returns:
+            int: Index of the stored chunk
+        """
+        if not isinstance(self._buffer, bytearray):
+            # Writing to a memory-mapped store copies it into memory first.
+            # The map is closed when the last reader drops it, not here
+            self._buffer = bytearray(self._buffer)
+            self._mmap_file = None
+
+        data = text.encode("utf-8")
+        self._offsets.append(len(self._buffer))
+        self._lengths.append(len(data))
+        self._alive.append(1)
+        self._buffer += data
+        return len(self._offsets) - 1
+
+    def text(self, index):
+        """
+        Decode the text of a chunk
+
+        Args:
+            index (int): Chunk index
+
+        Returns:
+            str: Chunk text
+        """
+        offset = self._offsets[index]
+        return bytes(self._buffer[offset:offset + self._lengths[index]]).decode("utf-8")
+
+    def is_alive(self, index):
+        return bool(self._alive[index])
+
+    def delete(self, index):
+        """
+        Tombstone a chunk; its bytes are reclaimed by compact()
+
+        Args:
+            index (int): Chunk index
+
+        Returns:
+            bool: True if the chunk was alive
+        """
+        if not self._alive[index]:
+            return False
+        self._alive[index] = 0
+        self._dead_bytes += self._lengths[index]
+        return True
+
+    def should_compact(self, ratio=0.5):
+        """Whether deleted chunks hold more than ratio of the buffer"""
+        return bool(self._buffer) and self._dead_bytes > ratio * len(self._buffer)
+
+    def compact(self):
+        """
+        Rewrite the buffer without deleted chunks
+
+        Returns:
+            array: Maps each old chunk index to its new index, or -1 if deleted
+        """
+        store, remap = self.compacted()
+        self._close_mmap()
+        self._buffer = store._buffer
+        self._offsets, self._lengths = store._offsets, store._lengths
+        self._alive = store._alive
+        self._dead_bytes = 0
+        return remap
+
+    def compacted(self):
+        """
+        Copy the live chunks into a new store, leaving this one as it is
+
+        Returns:
+            tuple: (new ChunkStore, array mapping each old chunk index to its
+                new index, or -1 if deleted)
+        """
+        store = ChunkStore()
+        remap = array("q", [-1]) * len(self._offsets)
+
+        for index in range(len(self._offsets)):
+            if not self._alive[index]:
+                continue
+            offset, length = self._offsets[index], self._lengths[index]
+            remap[index] = len(store._offsets)
+            store._offsets.append(len(store._buffer))
+            store._lengths.append(length)
+            store._buffer += self._buffer[offset:offset + length]
+
+        store._alive = bytearray(b"\x01") * len(store._offsets)
+        return store, remap
+
+    def save(self, path):
+        """
+        Write the store to disk as <path>.text and <path>.index
+
+        Args:
+            path (str): Path prefix
+        """
+        with open(f"{path}.text", "wb") as f:
+            f.write(self._buffer)
+        with open(f"{path}.index", "wb") as f:
+            header = json.dumps({"version": FORMAT_VERSION, "count": len(self._offsets), "dead_bytes": self._dead_bytes})
+            f.write(header.encode("utf-8") + b"\n")
+            for values in (self._offsets, self._lengths):
+                values.tofile(f)
+            f.write(self._alive)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Load a store written by save()
+
+        Args:
+            path (str): Path prefix passed to save()
+            use_mmap (bool): Memory-map the text buffer instead of reading it
+
+        Returns:
+            ChunkStore: Loaded store
+        """
+        store = cls()
+        with open(f"{path}.index", "rb") as f:
+            header = json.loads(f.readline())
+            count = header["count"]
+            for values in (store._offsets, store._lengths):
+                values.fromfile(f, count)
+            if header.get("version", 1) < 2:
+                # Version 1 files also hold a document number per chunk
+                f.seek(count * store._offsets.itemsize, os.SEEK_CUR)
+            store._alive = bytearray(f.read(count))
+        store._dead_bytes = header["dead_bytes"]
+
+        text_path = f"{path}.text"
+        if use_mmap and os.path.getsize(text_path):
+            with open(text_path, "rb") as f:
+                store._mmap_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            store._buffer = store._mmap_file
+        else:
+            with open(text_path, "rb") as f:
+                store._buffer = bytearray(f.read())
+        return store
+
+    def _close_mmap(self):
+        if self._mmap_file is not None:
+            self._mmap_file.close()
+            self._mmap_file = None
+
+    @staticmethod
+    def _view(values):
+        if np is None:
+            return values
+        return np.frombuffer(values, dtype=np.int64) if len(values) else np.zeros(0, dtype=np.int64)
+
+
+class DocumentRecord:
+    """Metadata of a stored document plus the location of its text in a ChunkStore"""
+
+    __slots__ = ("store", "chunk", "metadata")
+
+    def __init__(self, store, chunk, metadata):
+        self.store = store
+        self.chunk = chunk
+        self.metadata = metadata
+
+    @property
+    def text(self):
+        return self.store.text(self.chunk)
+
+    def __getitem__(self, key):
+        # Dict-style access kept for code written against {'text', 'metadata'}
+        if key == "text":
+            return self.text
+        if key == "metadata":
+            return self.metadata
+        raise KeyError(key)
+
+    def to_dict(self):
+        return {"text": self.text, "metadata": self.metadata}
+
+
+class DocumentSnapshot(Mapping):
+    """
+    Mapping of document ID -> DocumentRecord that is cheap to copy
+
+    The entries are spread over a fixed number of dict buckets by key hash.
+    copy() shares every bucket, and whichever side writes to a shared
+    bucket first copies just that bucket, so a copy plus a write costs
+    O(buckets + n / buckets) rather than the O(n) of copying a dict.
+    Iteration follows bucket order, not insertion order.
+    """
+
+    __slots__ = ("_buckets", "_owned", "_len")
+
+    def __init__(self, items=(), buckets=1024):
+        """
+        Initialize the snapshot
+
+        Args:
+            items (dict or iterable, optional): Entries or (key, value) pairs
+            buckets (int): Number of buckets
+        """
+        self._buckets = [{} for _ in range(buckets)]
+        self._owned = bytearray(b"\x01") * buckets
+        self._len = 0
+        for key, value in (items.items() if isinstance(items, Mapping) else items):
+            self[key] = value
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __getitem__(self, key):
+        return self._buckets[hash(key) % len(self._buckets)][key]
+
+    def __contains__(self, key):
+        return key in self._buckets[hash(key) % len(self._buckets)]
+
+    def get(self, key, default=None):
+        return self._buckets[hash(key) % len(self._buckets)].get(key, default)
+
+    def __setitem__(self, key, value):
+        bucket = self._writable(key)
+        if key not in bucket:
+            self._len += 1
+        bucket[key] = value
+
+    def pop(self, key, default=None):
+        """Remove a key and return its value, or default if it is missing"""
+        if key not in self:
+            return default
+        self._len -= 1
+        return self._writable(key).pop(key)
+
+    def copy(self):
+        """
+        Copy the snapshot; neither side modifies buckets they now share
+
+        Returns:
+            DocumentSnapshot: The copy
+        """
+        clone = DocumentSnapshot(buckets=0)
+        clone._buckets = list(self._buckets)
+        clone._owned = bytearray(len(self._buckets))
+        clone._len = self._len
+        self._owned = bytearray(len(self._buckets))
+        return clone
+
+    def _writable(self, key):
+        """Bucket of a key, copied first if it may be shared"""
+        i = hash(key) % len(self._buckets)
+        if not self._owned[i]:
+            self._buckets[i] = dict(self._buckets[i])
+            self._owned[i] = 1
+        return self._buckets[i]
+
+
+class SearchHit:
+    """
+    Search result whose document text is only decoded when accessed
+
+    Supports the dict-style access (hit['document'], hit.get('score')) of
+    the plain dicts search used to return. references lists the IDs of
+    other documents containing the same (deduplicated) chunk.
+    """
+
+    __slots__ = ("id", "metadata", "score", "references", "_record")
+
+    KEYS = ("document", "metadata", "id", "score", "references")
+
+    def __init__(self, doc_id, record, score=None, metadata=None, references=()):
+        self.id = doc_id
+        self._record = record
+        self.score = score
+        self.metadata = record.metadata if metadata is None else metadata
+        self.references = tuple(references)
+
+    @property
+    def document(self):
+        return self._record.text
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
@@ -0,0 +1,185 @@
+import hashlib
+import random
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WORD_RE = re.compile(r"\w+")
+
+_MASK = (1 << 64) - 1
+
+
+def shingles(text, size=5):
+    """
+    Split text into overlapping word n-grams
+
+    Args:
+        text (str): Text to shingle
+        size (int): Words per shingle
+
+    Returns:
+        set: Shingles; a text shorter than size gives a single shingle
+    """
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash(shingle):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+class MinHasher:
+    """
+    MinHash signatures estimating the Jaccard similarity of shingle sets
+
+    Each permutation is the universal hash (a * h + b) mod 2**64, keeping
+    the top 32 bits, so signatures can be computed with NumPy uint64
+    arithmetic when it is available and with plain ints otherwise.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        """
+        Initialize the hash functions
+
+        Args:
+            num_perm (int): Number of permutations (signature length)
+            shingle_size (int): Words per shingle
+            seed (int): Seed for the permutation parameters
+        """
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = [rng.getrandbits(64) | 1 for _ in range(num_perm)]
+        self.b = [rng.getrandbits(64) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)[:, None]
+            self._b = np.array(self.b, dtype=np.uint64)[:, None]
+
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a text
+
+        Args:
+            text (str): Text to sign
+
+        Returns:
+            tuple: Signature, or None for text without words
+        """
+        hashes = [_hash(shingle) for shingle in shingles(text, self.shingle_size)]
+        if not hashes:
+            return None
+
+        if np is not None:
+            values = (self._a * np.array(hashes, dtype=np.uint64) + self._b) >> np.uint64(32)
+            return tuple(values.min(axis=1).tolist())
+        return tuple(
+            min(((a * h + b) & _MASK) >> 32 for h in hashes)
+            for a, b in zip(self.a, self.b)
+        )
+
+    @staticmethod
+    def similarity(first, second):
+        """Estimated Jaccard similarity of two signatures"""
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """
+    Locality-sensitive hashing index for finding near-duplicate texts
+
+    Signatures are split into bands; texts sharing any band are candidates,
+    and a candidate is a duplicate when its estimated Jaccard similarity
+    reaches the threshold. With 16 bands of 8 rows, pairs at 0.9 similarity
+    are found with over 99% probability, while pairs below 0.5 rarely
+    become candidates at all.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, bands=16, shingle_size=5):
+        """
+        Initialize an empty index
+
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity of a duplicate
+            num_perm (int): MinHash signature length
+            bands (int): LSH bands; must divide num_perm
+            shingle_size (int): Words per shingle
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.signatures = {}
+        self.buckets = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def signature(self, text):
+        return self.hasher.signature(text)
+
+    def find(self, signature):
+        """
+        Find the indexed text most similar to a signature
+
+        Args:
+            signature (tuple): Signature from signature()
+
+        Returns:
+            tuple: (key, similarity) of the best duplicate, or None
+        """
+        if signature is None:
+            return None
+
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+
+        best = None
+        for key in candidates:
+            similarity = MinHasher.similarity(signature, self.signatures[key])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def add(self, key, signature):
+        """
+        Index a signature under a key
+
+        Args:
+            key: Identifier returned by find()
+            signature (tuple): Signature from signature(); None is ignored
+        """
+        if signature is None:
+            return
+        self.remove(key)
+        self.signatures[key] = signature
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in self._bands(signature):
+            bucket = self.buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band]
+
+    def _bands(self, signature):
+        return [
+            (i, signature[i * self.rows:(i + 1) * self.rows])
+            for i in range(self.bands)
+        ]
@@ -0,0 +1,509 @@
+import json
+import math
+import re
+import threading
+
+# Words that carry no signal for lookup questions
+STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have how i if in into is it its
+me my of on or our should so than that the their them then there these they this to was we were what
+when where which who whom why will with would you your please tell about
+""".split())
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Lowercase tokens
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def query_terms(text):
+    """
+    Tokenize a query and drop stopwords, keeping order and removing repeats
+
+    Args:
+        text (str): Query text
+
+    Returns:
+        list: Distinct content terms of the query
+    """
+    terms = []
+    for token in tokenize(text):
+        if token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms
+
+
+def split_sentences(text):
+    """
+    Split extracted PDF text into sentences
+
+    PDF extraction breaks lines in the middle of sentences, so single newlines
+    are joined back together and only blank lines and sentence punctuation
+    are treated as boundaries.
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: Sentence strings
+    """
+    sentences = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.append(sentence)
+    return sentences
+
+
+class Sentence:
+    """A sentence stored in the index together with where it came from"""
+
+    __slots__ = ("doc_id", "page", "text", "length")
+
+    def __init__(self, doc_id, page, text, length):
+        self.doc_id = doc_id
+        self.page = page
+        self.text = text
+        self.length = length
+
+
+class SentenceMatch:
+    """A scored sentence returned by SentenceIndex.search"""
+
+    __slots__ = ("sentence", "score", "spans", "metadata")
+
+    def __init__(self, sentence, score, spans, metadata):
+        self.sentence = sentence
+        self.score = score
+        self.spans = spans
+        self.metadata = metadata
+
+    @property
+    def text(self):
+        return self.sentence.text
+
+    @property
+    def page(self):
+        return self.sentence.page
+
+    @property
+    def doc_id(self):
+        return self.sentence.doc_id
+
+    def highlighted(self, marker="**"):
+        """
+        Return the sentence with the matched query terms wrapped in a marker
+
+        Args:
+            marker (str): String placed on both sides of each match
+
+        Returns:
+            str: Highlighted sentence
+        """
+        text = self.sentence.text
+        parts = []
+        last = 0
+        for start, end in self.spans:
+            parts.append(text[last:start])
+            parts.append(f"{marker}{text[start:end]}{marker}")
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def citation(self):
+        """
+        Return a short citation for the sentence, e.g. "manual.pdf, p. 3"
+
+        Returns:
+            str: Citation text
+        """
+        source = self.metadata.get("filename") or self.sentence.doc_id
+        if self.sentence.page is not None:
+            return f"{source}, p. {self.sentence.page}"
+        return str(source)
+
+
+class ExtractiveAnswer:
+    """Answer made of sentences taken verbatim from the indexed documents"""
+
+    def __init__(self, question, matches):
+        self.question = question
+        self.matches = matches
+
+    def __bool__(self):
+        return bool(self.matches)
+
+    @property
+    def top_score(self):
+        return self.matches[0].score if self.matches else 0.0
+
+    @property
+    def margin(self):
+        """Relative gap between the best and second best sentence score"""
+        if not self.matches:
+            return 0.0
+        if len(self.matches) == 1:
+            return 1.0
+        return (self.matches[0].score - self.matches[1].score) / self.matches[0].score
+
+    @property
+    def coverage(self):
+        """Fraction of the query terms found in the best sentence"""
+        terms = query_terms(self.question)
+        if not self.matches or not terms:
+            return 0.0
+        best = self.matches[0]
+        found = {best.text[start:end].lower() for start, end in best.spans}
+        return len(found) / len(terms)
+
+    def format(self, marker="**"):
+        """
+        Format the answer as markdown with highlighted spans and citations
+
+        Args:
+            marker (str): Highlight marker passed to SentenceMatch.highlighted
+
+        Returns:
+            str: Formatted answer
+        """
+        return "\n\n".join(
+            f"{match.highlighted(marker)} [{match.citation()}]" for match in self.matches
+        )
+
+
+class SentenceIndex:
+    """
+    Sentence-level inverted index used to answer lookup questions without an LLM
+
+    Sentences are scored with BM25 plus a bonus for query terms that occur
+    close together, so a question is answered with a dictionary walk over the
+    postings of its terms instead of a model call.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, proximity_weight=1.0):
+        """
+        Initialize the index
+
+        Args:
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalization
+            proximity_weight (float): Weight of the term proximity bonus
+        """
+        self.k1 = k1
+        self.b = b
+        self.proximity_weight = proximity_weight
+
+        # Sentence id -> Sentence
+        self.sentences = {}
+        # Term -> {sentence id: term frequency}
+        self.postings = {}
+        # Document id -> (list of sentence ids, metadata)
+        self.doc_sentences = {}
+
+        # Bumped on every change so cached answers can be invalidated
+        self.version = 0
+
+        # Serializes writers; search takes no lock and tolerates entries
+        # disappearing while it runs
+        self._write_lock = threading.Lock()
+
+        self._next_id = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def add_document(self, doc_id, pages, metadata=None):
+        """
+        Index the sentences of a document
+
+        Args:
+            doc_id (str): Document ID
+            pages (list): Page texts in order; a single string is treated as
+                one page whose number is taken from metadata["page"] if present
+            metadata (dict, optional): Document metadata used for citations
+
+        Returns:
+            int: Number of sentences indexed
+        """
+        metadata = metadata or {}
+        if isinstance(pages, str):
+            numbered_pages = [(metadata.get("page"), pages)]
+        else:
+            numbered_pages = list(enumerate(pages, start=1))
+
+        sentence_ids = []
+        with self._write_lock:
+            for page, page_text in numbered_pages:
+                for text in split_sentences(page_text or ""):
+                    tokens = tokenize(text)
+                    if not tokens:
+                        continue
+
+                    sentence_id = self._next_id
+                    self._next_id += 1
+
+                    self.sentences[sentence_id] = Sentence(doc_id, page, text, len(tokens))
+                    self._total_length += len(tokens)
+                    sentence_ids.append(sentence_id)
+
+                    counts = {}
+                    for token in tokens:
+                        counts[token] = counts.get(token, 0) + 1
+                    for token, count in counts.items():
+                        self.postings.setdefault(token, {})[sentence_id] = count
+
+            self.doc_sentences[doc_id] = (sentence_ids, metadata)
+            self.version += 1
+        return len(sentence_ids)
+
+    def delete_document(self, doc_id):
+        """
+        Remove a document's sentences from the index
+
+        Args:
+            doc_id (str): Document ID
+
+        Returns:
+            bool: True if the document was indexed
+        """
+        with self._write_lock:
+            entry = self.doc_sentences.pop(doc_id, None)
+            if entry is None:
+                return False
+
+            for sentence_id in entry[0]:
+                sentence = self.sentences.pop(sentence_id)
+                self._total_length -= sentence.length
+                for token in set(tokenize(sentence.text)):
+                    postings = self.postings.get(token)
+                    if postings is None:
+                        continue
+                    postings.pop(sentence_id, None)
+                    if not postings:
+                        del self.postings[token]
+            self.version += 1
+        return True
+
+    def update_metadata(self, doc_id, metadata):
+        """
+        Replace the metadata cited for a document
+
+        Args:
+            doc_id (str): Document ID
+            metadata (dict): New metadata
+
+        Returns:
+            bool: True if the document was indexed
+        """
+        with self._write_lock:
+            entry = self.doc_sentences.get(doc_id)
+            if entry is None:
+                return False
+            # Sentences numbered from metadata["page"] follow a page change
+            old_page, new_page = entry[1].get("page"), metadata.get("page")
+            if new_page != old_page:
+                for sentence_id in entry[0]:
+                    sentence = self.sentences[sentence_id]
+                    if sentence.page == old_page:
+                        sentence.page = new_page
+            self.doc_sentences[doc_id] = (entry[0], metadata)
+            self.version += 1
+        return True
+
+    def search(self, query, k=3, candidates=50, doc_ids=None):
+        """
+        Find the sentences that best answer a query
+
+        Args:
+            query (str): Query text
+            k (int): Number of sentences to return
+            candidates (int): Number of BM25 candidates rescored with proximity
+            doc_ids (collection, optional): Restrict results to these documents
+
+        Returns:
+            list: SentenceMatch objects, best first
+        """
+        terms = query_terms(query)
+        if not terms or not self.sentences:
+            return []
+
+        count = len(self.sentences) or 1
+        avg_length = max(self._total_length / count, 1.0)
+
+        # BM25 over the postings of the query terms only
+        scores = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            # Copied in one step, as a writer may change the postings meanwhile
+            postings = list(postings.items())
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for sentence_id, tf in postings:
+                sentence = self.sentences.get(sentence_id)
+                if sentence is None or (doc_ids is not None and sentence.doc_id not in doc_ids):
+                    continue
+                length = sentence.length
+                norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[sentence_id] = scores.get(sentence_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        if not scores:
+            return []
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:candidates]
+
+        matches = []
+        term_set = set(terms)
+        for sentence_id, score in ranked:
+            sentence = self.sentences.get(sentence_id)
+            entry = self.doc_sentences.get(sentence.doc_id) if sentence is not None else None
+            if entry is None:
+                # Deleted while searching
+                continue
+            spans, positions = self._match_terms(sentence.text, term_set)
+            score += self.proximity_weight * self._proximity(positions)
+            matches.append(SentenceMatch(sentence, score, spans, entry[1]))
+
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return matches[:k]
+
+    def save(self, path):
+        """
+        Write the index to a JSON file
+
+        Metadata is not written; load() takes it from the document store.
+
+        Args:
+            path (str): File path
+        """
+        with self._write_lock:
+            state = {
+                "k1": self.k1,
+                "b": self.b,
+                "proximity_weight": self.proximity_weight,
+                "next_id": self._next_id,
+                "total_length": self._total_length,
+                "sentences": [
+                    [sentence_id, sentence.doc_id, sentence.page, sentence.text, sentence.length]
+                    for sentence_id, sentence in self.sentences.items()
+                ],
+                "doc_sentences": {doc_id: entry[0] for doc_id, entry in self.doc_sentences.items()},
+                # Flattened [id, tf, id, tf, ...] lists keep the file small
+                "postings": {
+                    term: [value for item in postings.items() for value in item]
+                    for term, postings in self.postings.items()
+                },
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+
+    def load(self, path, metadatas=None):
+        """
+        Replace the contents of the index with a file written by save()
+
+        Loads in place rather than returning a new index, so a QueryRouter
+        or Chatbot already holding this index sees the loaded sentences.
+
+        Args:
+            path (str): File path
+            metadatas (dict, optional): Document ID -> metadata used for citations
+        """
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+
+        metadatas = metadatas or {}
+        sentences = {
+            sentence_id: Sentence(doc_id, page, text, length)
+            for sentence_id, doc_id, page, text, length in state["sentences"]
+        }
+        doc_sentences = {
+            doc_id: (sentence_ids, metadatas.get(doc_id, {}))
+            for doc_id, sentence_ids in state["doc_sentences"].items()
+        }
+        postings = {
+            term: dict(zip(flat[::2], flat[1::2]))
+            for term, flat in state["postings"].items()
+        }
+
+        with self._write_lock:
+            self.k1, self.b, self.proximity_weight = state["k1"], state["b"], state["proximity_weight"]
+            # Sentences first, so a concurrent search never finds a posting without its sentence
+            self.sentences = sentences
+            self.doc_sentences = doc_sentences
+            self.postings = postings
+            self._next_id = state["next_id"]
+            self._total_length = state["total_length"]
+            self.version += 1
+
+    def answer(self, query, k=3, doc_ids=None):
+        """
+        Build an extractive answer for a query
+
+        Args:
+            query (str): Query text
+            k (int): Maximum number of sentences in the answer
+            doc_ids (collection, optional): Restrict the answer to these documents
+
+        Returns:
+            ExtractiveAnswer: Answer, falsy when nothing matched
+        """
+        return ExtractiveAnswer(query, self.search(query, k=k, doc_ids=doc_ids))
+
+    @staticmethod
+    def _match_terms(text, term_set):
+        """Return character spans and token positions of query terms in text"""
+        spans = []
+        positions = []
+        for position, match in enumerate(TOKEN_RE.finditer(text)):
+            token = match.group().lower()
+            if token in term_set:
+                spans.append(match.span())
+                positions.append((position, token))
+        return spans, positions
+
+    @staticmethod
+    def _proximity(positions):
+        """
+        Score how tightly the distinct query terms cluster in a sentence
+
+        The score is the number of distinct terms divided by the length of the
+        smallest token window containing all of them, so adjacent terms score
+        highest. A single distinct term gets no bonus.
+        """
+        distinct = {token for _, token in positions}
+        if len(distinct) < 2:
+            return 0.0
+
+        best = None
+        window = {}
+        left = 0
+        for right in range(len(positions)):
+            token = positions[right][1]
+            window[token] = window.get(token, 0) + 1
+            while len(window) == len(distinct):
+                span = positions[right][0] - positions[left][0] + 1
+                if best is None or span < best:
+                    best = span
+                left_token = positions[left][1]
+                window[left_token] -= 1
+                if not window[left_token]:
+                    del window[left_token]
+                left += 1
+
+        return len(distinct) / best
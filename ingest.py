@@ -0,0 +1,526 @@
+"""
+Bulk ingestion of a directory tree of PDFs into the vector store
+
+Text extraction and chunking run in a pool of worker processes; the main
+process writes the chunks to VectorStore in batches. Every ingested file is
+appended to a checkpoint file together with its content hash, so an
+interrupted run resumes where it stopped and files unchanged since their
+latest ingested revision are skipped. A file ingested before under the same
+path (relative to the ingested directory) but with other content, even that
+of an older revision, is a new revision: only its changed chunks are
+re-embedded and stale ones deleted.
+
+    python ingest.py /data/manuals --workers 8
+    python ingest.py /data/manuals --profile-dir /tmp/profiles --profile-threshold 5
+    python ingest.py /data/manuals --export-snapshot /snapshots/manuals
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+
+from metrics import configure_logging, timed
+from pdf_processor import PDFProcessor
+from profiler import PROFILER, profiled
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys that can identify a file across revisions
+REVISION_KEYS = ("relative_path", "source_path", "filename")
+
+def find_pdfs(root):
+    """
+    Find every PDF below a directory, in a stable order
+
+    Args:
+        root (str): Directory to search
+
+    Returns:
+        list: Paths of PDF files
+    """
+    paths = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".pdf"):
+                paths.append(os.path.join(directory, filename))
+    return paths
+
+
+def revision_key(path, root=None, match_key="relative_path"):
+    """
+    Value identifying a file across revisions, as stored under match_key
+
+    Args:
+        path (str): File path
+        root (str, optional): Ingested directory; without it relative_path
+            falls back to the file name
+        match_key (str): One of REVISION_KEYS
+
+    Returns:
+        str: Key value
+    """
+    if match_key == "source_path":
+        return path
+    if match_key == "relative_path" and root is not None:
+        return os.path.relpath(path, root)
+    return os.path.basename(path)
+
+
+def content_hash(data):
+    """
+    Hash file content for change and duplicate detection
+
+    Args:
+        data (bytes): File content
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_pages(pages, chunk_size=1000, chunk_overlap=200):
+    """
+    Chunk each page separately so every chunk belongs to exactly one page
+
+    Args:
+        pages (list): Page texts
+        chunk_size (int): Maximum size of each chunk
+        chunk_overlap (int): Overlap between chunks
+
+    Returns:
+        list: (page number, chunk text) tuples
+    """
+    processor = PDFProcessor()
+    chunks = []
+    for page_number, page_text in enumerate(pages, start=1):
+        for chunk in processor.chunk_text(page_text, chunk_size, chunk_overlap):
+            if chunk.strip():
+                chunks.append((page_number, chunk))
+    return chunks
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines record of ingested files
+
+    Each line is written and flushed after the file's chunks are in the
+    vector store, so a crash loses at most the file being written.
+    """
+
+    def __init__(self, path):
+        """
+        Open a checkpoint, loading the files it already records
+
+        Args:
+            path (str): Checkpoint file path
+        """
+        self.path = path
+        # Content hash -> checkpoint entry
+        self.entries = {}
+        # File path -> its latest checkpoint entry
+        self.paths = {}
+
+        if os.path.exists(path):
+            terminated = True
+            with open(path) as f:
+                for line in f:
+                    terminated = line.endswith("\n")
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by an interrupted run
+                        continue
+                    self._add(entry)
+            if not terminated:
+                # End the cut line, so the next entry is not appended to it
+                with open(path, "a") as f:
+                    f.write("\n")
+
+    def __contains__(self, file_hash):
+        return file_hash in self.entries
+
+    def record(self, entry):
+        """
+        Append an entry and flush it to disk
+
+        Args:
+            entry (dict): Must contain "hash"; usually also path and doc IDs
+        """
+        self._add(entry)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def latest(self, root=None, match_key="relative_path"):
+        """
+        Content hash of the latest ingested revision of every file
+
+        Args:
+            root (str, optional): Ingested directory, see revision_key()
+            match_key (str): One of REVISION_KEYS
+
+        Returns:
+            dict: Revision key -> content hash
+        """
+        # Paths are in the order they were last recorded, so later entries win
+        return {revision_key(path, root, match_key): entry["hash"] for path, entry in self.paths.items()}
+
+    def _add(self, entry):
+        self.entries[entry["hash"]] = entry
+        if "path" in entry:
+            # Re-inserted so self.paths stays in recording order
+            self.paths.pop(entry["path"], None)
+            self.paths[entry["path"]] = entry
+
+
+def _init_worker(profiling=None):
+    if profiling:
+        PROFILER.configure(**profiling)
+
+
+def extract_file(path, chunk_size=1000, chunk_overlap=200, skip_hash=None):
+    """
+    Read, hash, extract and chunk one PDF; runs in a worker process
+
+    Args:
+        path (str): PDF path
+        chunk_size (int): Maximum size of each chunk
+        chunk_overlap (int): Overlap between chunks
+        skip_hash (str, optional): Hash of the latest ingested revision of
+            this file; matching content is not extracted again
+
+    Returns:
+        dict: path, hash, page count and (page, text) chunks; chunks is None
+            when the content matches skip_hash
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    file_hash = content_hash(data)
+    if file_hash == skip_hash:
+        return {"path": path, "hash": file_hash, "pages": 0, "chunks": None}
+
+    with profiled("ingest_extract", path=path), timed("ingest_extract", path=path):
+        pages = PDFProcessor().extract_pages(BytesIO(data))
+        chunks = chunk_pages(pages, chunk_size, chunk_overlap)
+    return {"path": path, "hash": file_hash, "pages": len(pages), "chunks": chunks}
+
+
+def write_chunks(vector_store, result, batch_size=256):
+    """
+    Bulk-write the chunks of one extracted file to the vector store
+
+    Args:
+        vector_store (VectorStore): Destination store
+        result (dict): Output of extract_file
+        batch_size (int): Chunks per embedding and insert batch
+
+    Returns:
+        list: IDs of the stored chunks
+
+    Raises:
+        Exception: If embedding or inserting fails; no chunk is left stored
+    """
+    texts = [text for _, text in result["chunks"]]
+    metadatas = chunk_metadatas(result)
+    with profiled("ingest_write", path=result["path"]), \
+            timed("ingest_write", path=result["path"], chunks=len(texts)):
+        return vector_store.add_documents(texts, metadatas, batch_size=batch_size, raise_errors=True)
+
+
+def chunk_metadatas(result):
+    """
+    Build the metadata stored with each chunk of an extracted file
+
+    Besides the source, every chunk records hashes of its own text and of
+    its page, which reingest() uses to find what changed between revisions.
+
+    Args:
+        result (dict): Output of extract_file
+
+    Returns:
+        list: Metadata dict per chunk
+    """
+    page_hashes = {}
+    for page_number, text in result["chunks"]:
+        page_hashes.setdefault(page_number, hashlib.sha256())
+        page_hashes[page_number].update(text.encode("utf-8"))
+
+    return [
+        {
+            "filename": os.path.basename(result["path"]),
+            "source_path": result["path"],
+            "relative_path": result.get("relative_path") or os.path.basename(result["path"]),
+            "content_hash": result["hash"],
+            "page": page_number,
+            "page_hash": page_hashes[page_number].hexdigest(),
+            "chunk": index,
+            "chunk_hash": content_hash(text.encode("utf-8")),
+        }
+        for index, (page_number, text) in enumerate(result["chunks"])
+    ]
+
+
+def reingest(vector_store, result, match_key="relative_path", batch_size=256):
+    """
+    Replace the stored chunks of an earlier revision of a file
+
+    Chunks are matched to the previous revision (found by its path relative
+    to the ingested directory, or another metadata key) by the hash of their
+    text. Unchanged chunks keep their embeddings and only get their metadata
+    refreshed, changed chunks are embedded and added, and chunks no longer
+    present are deleted, all through one VectorStore.replace_documents call.
+
+    Args:
+        vector_store (VectorStore): Store holding the previous revision
+        result (dict): Output of extract_file for the new revision
+        match_key (str): Metadata key identifying the document across revisions
+        batch_size (int): Chunks per embedding and insert batch
+
+    Returns:
+        dict: Counts of added, kept and deleted chunks and changed pages, and
+            the IDs of all chunks of the new revision
+    """
+    metadatas = chunk_metadatas(result)
+    previous = vector_store.find_documents(**{match_key: metadatas[0][match_key]}) if metadatas else {}
+
+    # Chunk hash -> IDs of previous chunks with that text
+    reusable = {}
+    previous_pages = set()
+    for doc_id, metadata in previous.items():
+        reusable.setdefault(metadata.get("chunk_hash"), []).append(doc_id)
+        previous_pages.add(metadata.get("page_hash"))
+
+    add_texts, add_metadatas, updates, kept_ids = [], [], {}, []
+    for (_, text), metadata in zip(result["chunks"], metadatas):
+        candidates = reusable.get(metadata["chunk_hash"])
+        if candidates:
+            doc_id = candidates.pop()
+            updates[doc_id] = metadata
+            kept_ids.append(doc_id)
+        else:
+            add_texts.append(text)
+            add_metadatas.append(metadata)
+
+    stale_ids = [doc_id for doc_ids in reusable.values() for doc_id in doc_ids]
+
+    with profiled("ingest_reingest", path=result["path"]), \
+            timed("ingest_reingest", path=result["path"], added=len(add_texts), deleted=len(stale_ids)):
+        added_ids = vector_store.replace_documents(add_texts, add_metadatas, stale_ids, updates, raise_errors=True)
+
+    return {
+        "added": len(added_ids),
+        "kept": len(kept_ids),
+        "deleted": len(stale_ids),
+        "pages_changed": len({m["page_hash"] for m in metadatas} - previous_pages),
+        "doc_ids": kept_ids + added_ids,
+    }
+
+
+def reingest_file(vector_store, path, match_key="relative_path", chunk_size=1000, chunk_overlap=200, root=None):
+    """
+    Extract a new revision of a PDF and re-embed only what changed
+
+    Args:
+        vector_store (VectorStore): Store holding the previous revision
+        path (str): Path of the new revision
+        match_key (str): Metadata key identifying the document across revisions
+        chunk_size (int): Maximum size of each chunk
+        chunk_overlap (int): Overlap between chunks
+        root (str, optional): Directory the file was ingested from, which
+            its relative_path is relative to
+
+    Returns:
+        dict: See reingest()
+    """
+    result = extract_file(path, chunk_size, chunk_overlap)
+    if root is not None:
+        result["relative_path"] = os.path.relpath(path, root)
+    return reingest(vector_store, result, match_key)
+
+
+def ingest_directory(root, vector_store, checkpoint, workers=None, chunk_size=1000, chunk_overlap=200,
+                     batch_size=256, progress=None, match_key="relative_path"):
+    """
+    Ingest every PDF below a directory, skipping files unchanged since their
+    latest ingested revision
+
+    A file whose revision key (by default its path relative to root) was
+    ingested before with different content, including content of an older
+    revision, is treated as a new revision and goes through reingest().
+    Copies of one file under several paths are each stored with their own
+    metadata.
+
+    Args:
+        root (str): Directory to ingest
+        vector_store (VectorStore): Destination store
+        checkpoint (Checkpoint): Record of ingested files
+        workers (int, optional): Extraction processes, defaults to the CPU count
+        chunk_size (int): Maximum size of each chunk
+        chunk_overlap (int): Overlap between chunks
+        batch_size (int): Chunks per embedding and insert batch
+        progress (callable, optional): Called with (done, total, stats) after each file
+        match_key (str): Metadata key identifying a file across revisions,
+            one of REVISION_KEYS
+
+    Returns:
+        dict: Counts of ingested, skipped and failed files, pages and chunks
+    """
+    paths = find_pdfs(root)
+    stats = {"files": len(paths), "ingested": 0, "updated": 0, "skipped": 0, "failed": 0, "pages": 0, "chunks": 0}
+    # Revision key -> content hash of its latest ingested revision
+    latest = checkpoint.latest(root, match_key)
+    workers = workers or os.cpu_count() or 1
+
+    # Workers profile extraction with the settings of this process
+    profiling = PROFILER.settings() if PROFILER.enabled else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(profiling,)) as pool:
+        pending = {}
+        remaining = iter(paths)
+        done = 0
+
+        def submit_next():
+            path = next(remaining, None)
+            if path is not None:
+                skip_hash = latest.get(revision_key(path, root, match_key))
+                pending[pool.submit(extract_file, path, chunk_size, chunk_overlap, skip_hash)] = path
+
+        # Keep a bounded number of files in flight so extracted text does
+        # not pile up in memory faster than it can be written
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = pending.pop(future)
+                submit_next()
+                done += 1
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error extracting {path}: {e}")
+                    stats["failed"] += 1
+                    continue
+
+                key = revision_key(path, root, match_key)
+                # Unchanged, or recorded for this key earlier in the run (match_key="filename")
+                if result["chunks"] is None or latest.get(key) == result["hash"]:
+                    stats["skipped"] += 1
+                elif not result["chunks"]:
+                    logger.warning(f"No text extracted from {path}")
+                    stats["failed"] += 1
+                else:
+                    result["relative_path"] = os.path.relpath(path, root)
+                    try:
+                        if key in latest:
+                            doc_ids = reingest(vector_store, result, match_key, batch_size)["doc_ids"]
+                            stats["updated"] += 1
+                        else:
+                            doc_ids = write_chunks(vector_store, result, batch_size)
+                            stats["ingested"] += 1
+                    except Exception as e:
+                        # Not checkpointed, so the next run retries the file
+                        logger.error(f"Error writing {path}: {e}")
+                        stats["failed"] += 1
+                        if progress is not None:
+                            progress(done, len(paths), stats)
+                        continue
+                    checkpoint.record({
+                        "hash": result["hash"],
+                        "path": path,
+                        "pages": result["pages"],
+                        "doc_ids": doc_ids,
+                        "time": time.time(),
+                    })
+                    latest[key] = result["hash"]
+                    stats["pages"] += result["pages"]
+                    stats["chunks"] += len(doc_ids)
+
+                if progress is not None:
+                    progress(done, len(paths), stats)
+
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Ingest a directory tree of PDFs into the vector store")
+    parser.add_argument("directory", help="directory to search for PDFs")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--checkpoint", default="ingest_checkpoint.jsonl",
+                        help="file recording ingested files, used to resume (default: %(default)s)")
+    parser.add_argument("--persist-directory", default="./chroma_db", help="ChromaDB directory")
+    parser.add_argument("--collection", default="pdf_documents", help="ChromaDB collection name")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="maximum characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="characters shared by adjacent chunks")
+    parser.add_argument("--batch-size", type=int, default=256, help="chunks per embedding and insert batch")
+    parser.add_argument("--match-key", choices=REVISION_KEYS, default="relative_path",
+                        help="metadata identifying a file across revisions (default: %(default)s)")
+    parser.add_argument("--export-snapshot", metavar="DIRECTORY",
+                        help="write a snapshot of the ingested documents for bootstrapping replicas")
+    parser.add_argument("--profile-dir", metavar="DIRECTORY",
+                        help="profile files whose extraction or writing exceeds --profile-threshold")
+    parser.add_argument("--profile-threshold", type=float, default=5.0,
+                        help="seconds a file may take before it is profiled (default: %(default)s)")
+    parser.add_argument("--profile-mode", choices=("sample", "cprofile"), default="sample",
+                        help="write sampled collapsed stacks or cProfile pstats (default: %(default)s)")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="minimum level of the JSON log lines written to stderr (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level)
+    if args.profile_dir:
+        PROFILER.configure(enabled=True, threshold=args.profile_threshold, mode=args.profile_mode,
+                           directory=args.profile_dir)
+
+    from vector_store import VectorStore
+    vector_store = VectorStore(collection_name=args.collection, persist_directory=args.persist_directory)
+    checkpoint = Checkpoint(args.checkpoint)
+
+    start = time.perf_counter()
+
+    def progress(done, total, stats):
+        elapsed = time.perf_counter() - start
+        print(f"\r{done}/{total} files, {stats['ingested']} ingested, {stats['updated']} updated, "
+              f"{stats['skipped']} skipped, "
+              f"{stats['failed']} failed, {stats['chunks']} chunks, {done / elapsed:.1f} files/s",
+              end="", flush=True)
+
+    stats = ingest_directory(
+        args.directory,
+        vector_store,
+        checkpoint,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        progress=progress,
+        match_key=args.match_key
+    )
+    print()
+    print(json.dumps(stats))
+
+    if args.export_snapshot:
+        from snapshot import export_snapshot
+        manifest = export_snapshot(vector_store, args.export_snapshot)
+        print(f"Snapshot written to {args.export_snapshot}: {manifest['documents']} documents")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
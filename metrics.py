@@ -0,0 +1,334 @@
+import bisect
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("rag.metrics")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """Monotonic counter with optional labels, exported in Prometheus format"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        # Unlabeled counters are exported as 0 before the first increment
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, exported in Prometheus format"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        entry = self._values.get(key)
+        return entry[2] if entry else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames + ("le",), key + (str(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each pipeline stage",
+    labelnames=("stage",)
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "rag_stage_errors_total",
+    "Pipeline stage executions that raised an exception",
+    labelnames=("stage",)
+))
+PAGES_EXTRACTED = REGISTRY.register(Counter(
+    "rag_pages_extracted_total",
+    "PDF pages run through text extraction"
+))
+CHUNKS_CREATED = REGISTRY.register(Counter(
+    "rag_chunks_created_total",
+    "Text chunks produced by chunking"
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "rag_cache_lookups_total",
+    "Cache lookups, by cache and whether they hit",
+    labelnames=("cache", "result")
+))
+ROUTE_SECONDS = REGISTRY.register(Histogram(
+    "rag_answer_duration_seconds",
+    "Time to answer a question, by the route that answered it",
+    labelnames=("route",)
+))
+
+
+@contextmanager
+def timed(stage, **fields):
+    """
+    Time a pipeline stage, record it in STAGE_SECONDS and log it
+
+    Args:
+        stage (str): Stage name, e.g. "extraction" or "retrieval"
+        **fields: Extra fields added to the structured log record
+
+    Yields:
+        dict: Mutable dict whose entries are added to the log record, so the
+            timed block can report results such as counts
+    """
+    extra = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield extra
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        extra["error"] = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        logger.info("stage", extra={"fields": dict(extra, stage=stage, seconds=round(seconds, 6))})
+
+
+def observe(stage, seconds, **fields):
+    """
+    Record a duration measured outside of timed(), e.g. time to first token
+
+    Args:
+        stage (str): Stage name
+        seconds (float): Measured duration
+        **fields: Extra fields added to the structured log record
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    logger.info("stage", extra={"fields": dict(fields, stage=stage, seconds=round(seconds, 6))})
+
+
+def render_prometheus():
+    """
+    Render every registered metric in the Prometheus text exposition format
+
+    Returns:
+        str: Metrics text
+    """
+    return REGISTRY.render()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Send all log records to stderr as structured JSON lines
+
+    Args:
+        level (int or str): Minimum level to log, e.g. logging.INFO or "INFO"
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves render_prometheus() on /metrics, and the profiler settings on
+    /admin/profiling: GET returns them, POST changes those given as query
+    parameters (enabled, threshold, mode, interval, max_profiles)
+
+    Admin requests must send "Authorization: Bearer <ADMIN_TOKEN>" when the
+    ADMIN_TOKEN environment variable is set; without it they are only
+    accepted from the loopback interface.
+    """
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/admin/profiling":
+            if not self._authorized():
+                return
+            from profiler import PROFILER
+            self._send(200, json.dumps(PROFILER.settings()), "application/json")
+            return
+        if path != "/metrics":
+            self.send_error(404)
+            return
+        self._send(200, render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/admin/profiling":
+            self.send_error(404)
+            return
+        if not self._authorized():
+            return
+
+        from profiler import PROFILER
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            settings = PROFILER.configure(
+                enabled=params["enabled"].lower() in ("1", "true", "yes", "on") if "enabled" in params else None,
+                threshold=float(params["threshold"]) if "threshold" in params else None,
+                mode=params.get("mode"),
+                interval=float(params["interval"]) if "interval" in params else None,
+                max_profiles=int(params["max_profiles"]) if "max_profiles" in params else None
+            )
+        except (ValueError, OSError) as e:
+            self._send(400, json.dumps({"error": str(e)}), "application/json")
+            return
+        self._send(200, json.dumps(settings), "application/json")
+
+    def _authorized(self):
+        """Check access to an admin endpoint, sending the error response if denied"""
+        token = os.environ.get("ADMIN_TOKEN")
+        if token:
+            expected = f"Bearer {token}".encode("utf-8")
+            given = self.headers.get("Authorization", "").encode("utf-8")
+            if hmac.compare_digest(given, expected):
+                return True
+            self._send(401, json.dumps({"error": "invalid or missing admin token"}), "application/json")
+            return False
+
+        try:
+            if ipaddress.ip_address(self.client_address[0]).is_loopback:
+                return True
+        except ValueError:
+            pass
+        self._send(403, json.dumps({"error": "set ADMIN_TOKEN to allow admin requests from other hosts"}),
+                   "application/json")
+        return False
+
+    def _send(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=9100, host="0.0.0.0"):
+    """
+    Serve /metrics and /admin/profiling from a background thread
+
+    /metrics is served on every interface given by host; see MetricsHandler
+    for who may use /admin/profiling.
+
+    Calling it again returns the server that is already running, so it is
+    safe to call from code that runs more than once, like a Streamlit script.
+
+    Args:
+        port (int): Port to listen on
+        host (str): Interface to bind
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+            thread.start()
+        return _server
@@ -1,24 +1,76 @@
 import os
 import requests
 import json
+import logging
+import time
+from collections import OrderedDict
+
+from metrics import observe, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant that accurately answers questions based only on the provided context."
 
 class OllamaClient:
     """
     Client for interacting with the Ollama API to use Llama 3.1 model
     """
     
-    def __init__(self, base_url="http://localhost:11434", model="llama3.1:latest"):
+    def __init__(self, base_url="http://localhost:11434", model="llama3.1:latest", embedding_model=None,
+                 keep_alive="30m", max_conversations=1000):
         """
         Initialize the Ollama client
         
         Args:
             base_url (str): Ollama API base URL
             model (str): Model name to use
+            embedding_model (str, optional): Model used for embeddings,
+                defaults to the generation model
+            keep_alive (str or int): How long Ollama keeps the model loaded
+                after a request, e.g. "30m", or -1 to keep it loaded
+            max_conversations (int): Maximum number of conversations whose
+                context tokens are remembered
         """
         self.base_url = base_url
         self.model = model
+        self.embedding_model = embedding_model or model
+        self.keep_alive = keep_alive
+        self.max_conversations = max_conversations
+        
+        # Conversation ID -> context tokens returned by the last generate call
+        self.conversations = OrderedDict()
+        
+    def preload(self, model=None):
+        """
+        Load a model into memory ahead of the first question
+        
+        A generate request without a prompt makes Ollama load the model and
+        keep it for keep_alive, so the first user does not pay the cold load.
+        
+        Args:
+            model (str, optional): Model to load, defaults to the generation model
+            
+        Returns:
+            bool: True if the model was loaded
+        """
+        url = f"{self.base_url}/api/generate"
+        payload = {
+            "model": model or self.model,
+            "keep_alive": self.keep_alive,
+            "stream": False,
+        }
         
-    def generate(self, prompt, context=None, system_prompt=None, temperature=0.7, max_tokens=2048):
+        try:
+            with timed("model_load", model=payload["model"]):
+                response = requests.post(url, json=payload)
+                response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error preloading Ollama model: {e}")
+            return False
+        
+    def generate(self, prompt, context=None, system_prompt=None, temperature=0.7, max_tokens=2048,
+                 conversation_id=None):
         """
         Generate a response from the Ollama model
         
@@ -28,9 +80,13 @@ class OllamaClient:
             system_prompt (str, optional): System prompt for the model
             temperature (float): Temperature for generation (0.0 to 1.0)
             max_tokens (int): Maximum tokens to generate
+            conversation_id (str, optional): Conversation to continue; its
+                context tokens are sent when context is not given and replaced
+                by the ones Ollama returns, so earlier turns are not
+                re-processed
             
         Returns:
-            dict: Response from the model
+            dict: Response from the model, including the new "context" tokens
         """
         url = f"{self.base_url}/api/generate"
         
@@ -38,10 +94,16 @@ class OllamaClient:
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            },
         }
         
+        if context is None and conversation_id is not None:
+            context = self.conversations.get(conversation_id)
+        
         # Add optional parameters if provided
         if context:
             payload["context"] = context
@@ -51,12 +113,14 @@ class OllamaClient:
         
         try:
             # Make the API request
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            
-            return response.json()
+            result, text = self._stream(url, payload)
+            if "error" not in result:
+                result["response"] = text
+                if conversation_id is not None and result.get("context"):
+                    self._remember_context(conversation_id, result["context"])
+            return result
         except requests.exceptions.RequestException as e:
-            print(f"Error calling Ollama API: {e}")
+            logger.error(f"Error calling Ollama API: {e}")
             return {"error": str(e)}
     
     def chat(self, messages, temperature=0.7, max_tokens=2048):
@@ -77,8 +141,99 @@ class OllamaClient:
         payload = {
             "model": self.model,
             "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            },
+        }
+        
+        try:
+            # Make the API request
+            result, text = self._stream(url, payload)
+            if "error" not in result:
+                result["message"] = {"role": "assistant", "content": text}
+            return result
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Ollama chat API: {e}")
+            return {"error": str(e)}
+    
+    def forget_conversation(self, conversation_id):
+        """
+        Drop the context tokens kept for a conversation
+        
+        Args:
+            conversation_id (str): Conversation to forget
+        """
+        self.conversations.pop(conversation_id, None)
+    
+    def _remember_context(self, conversation_id, context):
+        self.conversations[conversation_id] = context
+        self.conversations.move_to_end(conversation_id)
+        while len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
+    
+    def _stream(self, url, payload):
+        """
+        Send a streaming request and assemble the streamed chunks
+        
+        Streaming lets us record the time to the first token separately from
+        the total generation time.
+        
+        Args:
+            url (str): Endpoint URL
+            payload (dict): Request payload
+            
+        Returns:
+            tuple: (final response chunk, concatenated generated text)
+        """
+        payload = dict(payload, stream=True)
+        start = time.perf_counter()
+        parts = []
+        result = {}
+        
+        with timed("generation", model=self.model) as log:
+            # Closing the response releases the connection on every return
+            with requests.post(url, json=payload, stream=True) as response:
+                response.raise_for_status()
+                
+                # chunk_size=None yields data as soon as it arrives
+                for line in response.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except ValueError as e:
+                        logger.error(f"Invalid streamed response from Ollama: {e}")
+                        log["error"] = True
+                        return {"error": f"Invalid streamed response from Ollama: {e}"}, ""
+                    if "error" in chunk:
+                        return chunk, ""
+                    if not parts:
+                        observe("time_to_first_token", time.perf_counter() - start, model=self.model)
+                    parts.append(chunk.get("response") or chunk.get("message", {}).get("content", ""))
+                    result = chunk
+            
+            log["eval_count"] = result.get("eval_count")
+        
+        return result, "".join(parts)
+    
+    def embed(self, texts):
+        """
+        Compute embeddings for a batch of texts in a single request
+        
+        Args:
+            texts (list): Texts to embed
+            
+        Returns:
+            dict: Response from the model, with one vector per text under "embeddings"
+        """
+        url = f"{self.base_url}/api/embed"
+        
+        payload = {
+            "model": self.embedding_model,
+            "input": list(texts),
+            "keep_alive": self.keep_alive,
         }
         
         try:
@@ -88,10 +243,10 @@ class OllamaClient:
             
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error calling Ollama chat API: {e}")
+            logger.error(f"Error calling Ollama embed API: {e}")
             return {"error": str(e)}
     
-    def answer_with_context(self, question, context, system_prompt=None):
+    def answer_with_context(self, question, context, system_prompt=None, conversation_id=None):
         """
         Generate an answer to a question using provided context
         
@@ -99,30 +254,21 @@ class OllamaClient:
             question (str): The question to answer
             context (list): List of context strings to inform the answer
             system_prompt (str, optional): System prompt for the model
+            conversation_id (str, optional): Conversation to continue
             
         Returns:
             str: Generated answer
         """
-        # Format context into a single string
-        context_text = "\n\n".join(context)
-        
-        # Create a prompt that includes both context and question
-        prompt = f"""Context information:
-{context_text}
-
-Based on the above context, please answer the following question:
-{question}
-
-If the question cannot be answered based on the provided context, please indicate that.
-"""
+        prompt = self.context_prompt(question, context)
         
         if system_prompt is None:
-            system_prompt = "You are a helpful assistant that accurately answers questions based only on the provided context."
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
         # Generate a response
         response = self.generate(
             prompt=prompt,
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            conversation_id=conversation_id
         )
         
         # Extract and return the answer
@@ -131,6 +277,32 @@ If the question cannot be answered based on the provided context, please indicat
         
         return response.get("response", "No response generated")
     
+    def context_prompt(self, question, context):
+        """
+        Build the prompt answering a question from context strings
+        
+        Args:
+            question (str): The question to answer
+            context (list): List of context strings to inform the answer
+            
+        Returns:
+            str: Prompt text
+        """
+        with timed("prompt_assembly"):
+            # Format context into a single string
+            context_text = "\n\n".join(context)
+            
+            # Static instructions come first so Ollama can reuse the cached
+            # prompt prefix; only the context and question vary per request
+            return f"""If the question cannot be answered based on the provided context, please indicate that.
+
+Context information:
+{context_text}
+
+Based on the above context, please answer the following question:
+{question}
+"""
+    
     def list_models(self):
         """
         List available models in Ollama
@@ -147,5 +319,5 @@ If the question cannot be answered based on the provided context, please indicat
             data = response.json()
             return data.get("models", [])
         except requests.exceptions.RequestException as e:
-            print(f"Error listing Ollama models: {e}")
+            logger.error(f"Error listing Ollama models: {e}")
             return []
\ No newline at end of file
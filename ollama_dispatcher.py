@@ -0,0 +1,358 @@
+import itertools
+import json
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ollama_client import DEFAULT_SYSTEM_PROMPT
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class OverloadedError(Exception):
+    """
+    Raised when the dispatcher queue is full
+
+    Carries the HTTP status and Retry-After value a web handler should
+    return, so callers can translate it directly into a 429 response.
+    """
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Ollama is saturated, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)}
+
+
+class OllamaDispatcher:
+    """
+    Front for OllamaClient that coalesces, batches and rate-limits requests
+
+    - Identical in-flight chat/generate requests share one Ollama call
+      (single-flight); questions differing only in case or whitespace count
+      as identical.
+    - Embedding requests arriving within a short window are sent to Ollama
+      as one batch.
+    - Requests wait in a bounded priority queue served by a fixed number of
+      workers; when it is full, OverloadedError (HTTP 429) is raised with a
+      Retry-After estimated from the queue depth. Embedding texts waiting
+      for their batch count as the queue entries their batches will take.
+
+    The dispatcher has the same chat/generate/embed/answer_with_context
+    methods as OllamaClient and can be passed anywhere a client is expected.
+    """
+
+    def __init__(self, client, workers=2, max_queue=64, batch_window=0.01, max_batch=32):
+        """
+        Initialize the dispatcher and start its worker threads
+
+        Args:
+            client (OllamaClient): Client that performs the actual requests
+            workers (int): Number of concurrent requests sent to Ollama
+            max_queue (int): Maximum number of queued requests before
+                OverloadedError is raised
+            batch_window (float): Seconds to wait for more embedding requests
+                before sending a batch
+            max_batch (int): Maximum number of texts per embedding batch
+        """
+        self.client = client
+        self.workers = workers
+        self.max_queue = max_queue
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Request key -> Future shared by every caller of that request
+        self._inflight = {}
+        # Exponentially weighted average of the time an Ollama call takes
+        self._service_time = 1.0
+
+        # Embedding texts waiting for the current batch window to close
+        self._pending_embeds = []
+        self._embed_ready = threading.Condition(self._lock)
+
+        self.stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "batches": 0}
+
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"ollama-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._threads.append(
+            threading.Thread(target=self._batch_embeddings, name="ollama-embed-batcher", daemon=True)
+        )
+        for thread in self._threads:
+            thread.start()
+
+    def __getattr__(self, name):
+        # Calls that are not queued (list_models, preload, ...) go straight
+        # to the client
+        return getattr(self.client, name)
+
+    def answer_with_context(self, question, context, system_prompt=None, conversation_id=None,
+                            priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Generate an answer to a question using provided context
+
+        Queued like chat(), or like generate() when continuing a
+        conversation, whose context tokens only the generate endpoint keeps.
+
+        Args:
+            question (str): The question to answer
+            context (list): List of context strings to inform the answer
+            system_prompt (str, optional): System prompt for the model
+            conversation_id (str, optional): Conversation to continue
+            priority (int): Queue priority, lower is served first
+            timeout (float, optional): Seconds to wait for the response
+
+        Returns:
+            str: Generated answer
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        prompt = self.client.context_prompt(question, context)
+        if system_prompt is None:
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+
+        if conversation_id is None:
+            response = self.chat(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+                priority=priority,
+                timeout=timeout
+            )
+            text = response.get("message", {}).get("content")
+        else:
+            response = self.generate(
+                prompt,
+                system_prompt=system_prompt,
+                conversation_id=conversation_id,
+                priority=priority,
+                timeout=timeout
+            )
+            text = response.get("response")
+
+        if "error" in response:
+            return f"Error generating response: {response['error']}"
+        return text or "No response generated"
+
+    def chat(self, messages, temperature=0.7, max_tokens=2048, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Generate a response using the Ollama chat endpoint
+
+        Args:
+            messages (list): List of message objects with 'role' and 'content'
+            temperature (float): Temperature for generation (0.0 to 1.0)
+            max_tokens (int): Maximum tokens to generate
+            priority (int): Queue priority, lower is served first
+            timeout (float, optional): Seconds to wait for the response
+
+        Returns:
+            dict: Response from the model
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        key = self._request_key("chat", [
+            [message["role"], message["content"]] for message in messages
+        ], temperature, max_tokens)
+        future = self._submit(
+            key,
+            lambda: self.client.chat(messages, temperature=temperature, max_tokens=max_tokens),
+            priority
+        )
+        return future.result(timeout)
+
+    def generate(self, prompt, context=None, system_prompt=None, temperature=0.7, max_tokens=2048,
+                 conversation_id=None, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Generate a response from the Ollama model
+
+        Args:
+            prompt (str): The prompt to send to the model
+            context (list, optional): Context from previous interactions
+            system_prompt (str, optional): System prompt for the model
+            temperature (float): Temperature for generation (0.0 to 1.0)
+            max_tokens (int): Maximum tokens to generate
+            conversation_id (str, optional): Conversation to continue
+            priority (int): Queue priority, lower is served first
+            timeout (float, optional): Seconds to wait for the response
+
+        Returns:
+            dict: Response from the model
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        key = self._request_key(
+            "generate", prompt, context, system_prompt, temperature, max_tokens, conversation_id
+        )
+        future = self._submit(
+            key,
+            lambda: self.client.generate(
+                prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                conversation_id=conversation_id
+            ),
+            priority
+        )
+        return future.result(timeout)
+
+    def embed(self, texts, timeout=None):
+        """
+        Compute embeddings, batching with other callers' texts
+
+        Args:
+            texts (list): Texts to embed
+            timeout (float, optional): Seconds to wait for the embeddings
+
+        Returns:
+            dict: Response with one vector per text under "embeddings", or
+                an "error" entry if the batch failed
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        with self._lock:
+            # Entries the batches of these texts add to the queue
+            pending = len(self._pending_embeds)
+            self._check_capacity(self._batches(pending + len(texts)) - self._batches(pending))
+            futures = []
+            for text in texts:
+                future = Future()
+                self._pending_embeds.append((text, future))
+                futures.append(future)
+            self._embed_ready.notify()
+
+        try:
+            return {"embeddings": [future.result(timeout) for future in futures]}
+        except RuntimeError as e:
+            return {"error": str(e)}
+
+    def queue_depth(self):
+        """
+        Get the number of requests waiting for a worker
+
+        Returns:
+            int: Queued request count
+        """
+        return self._queue.qsize()
+
+    def close(self):
+        """Stop the worker threads once the queued requests are done"""
+        with self._lock:
+            self._closed = True
+            self._embed_ready.notify()
+        for _ in range(self.workers):
+            self._queue.put((math.inf, next(self._sequence), None))
+
+    def _request_key(self, kind, *parts):
+        """Build the single-flight key; case and whitespace are ignored in text"""
+        def normalize(value):
+            if isinstance(value, str):
+                return " ".join(value.lower().split())
+            if isinstance(value, (list, tuple)):
+                return [normalize(item) for item in value]
+            return value
+
+        return kind + json.dumps(normalize(list(parts)), default=str)
+
+    def _batches(self, texts):
+        return math.ceil(texts / self.max_batch)
+
+    def _backlog(self):
+        """Queued requests plus the embedding batches still being collected"""
+        return self._queue.qsize() + self._batches(len(self._pending_embeds))
+
+    def _retry_after(self):
+        depth = self._backlog() + 1
+        return max(1, math.ceil(depth * self._service_time / self.workers))
+
+    def _check_capacity(self, entries=1):
+        """Raise OverloadedError if entries more requests cannot be queued; lock must be held"""
+        if self._backlog() + entries > self.max_queue:
+            self.stats["rejected"] += 1
+            raise OverloadedError(self._retry_after())
+
+    def _submit(self, key, call, priority):
+        """Queue a call, or join an identical call that is already in flight"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+
+            self._check_capacity()
+            future = Future()
+            self._inflight[key] = future
+            self.stats["submitted"] += 1
+
+        self._queue.put((priority, next(self._sequence), (key, call, future)))
+        return future
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            key, call, future = job
+
+            start = time.perf_counter()
+            try:
+                future.set_result(call())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+                    if key is not None:
+                        self._inflight.pop(key, None)
+
+    def _batch_embeddings(self):
+        while True:
+            with self._lock:
+                while not self._pending_embeds and not self._closed:
+                    self._embed_ready.wait()
+                if self._closed and not self._pending_embeds:
+                    return
+
+            # Give other callers a short window to join this batch
+            time.sleep(self.batch_window)
+
+            with self._lock:
+                batch = self._pending_embeds[:self.max_batch]
+                del self._pending_embeds[:self.max_batch]
+                self.stats["batches"] += 1
+                # Queued under the lock so the backlog never misses the batch
+                self._queue.put((PRIORITY_NORMAL, next(self._sequence), (None, lambda: self._run_embed_batch(batch), Future())))
+
+    def _run_embed_batch(self, batch):
+        # Identical texts in the batch are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            response = self.client.embed(texts)
+        except Exception as e:
+            response = {"error": str(e)}
+
+        if "error" in response:
+            for _, future in batch:
+                future.set_exception(RuntimeError(response["error"]))
+            return
+
+        vectors = dict(zip(texts, response.get("embeddings", [])))
+        for text, future in batch:
+            future.set_result(vectors.get(text))
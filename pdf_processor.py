@@ -1,6 +1,11 @@
+import logging
 import os
 import tempfile
 
+from metrics import CHUNKS_CREATED, PAGES_EXTRACTED, timed
+
+logger = logging.getLogger(__name__)
+
 class PDFProcessor:
     """
     Class to handle PDF operations including text extraction and chunking
@@ -16,7 +21,19 @@ class PDFProcessor:
         Returns:
             str: Extracted text content
         """
-        text = ""
+        return "".join(page + "\n\n" for page in self.extract_pages(pdf_file))
+    
+    def extract_pages(self, pdf_file):
+        """
+        Extract the text of each page of a PDF file
+        
+        Args:
+            pdf_file: File object (can be from FastAPI UploadFile)
+            
+        Returns:
+            list: Extracted text of each page, in page order
+        """
+        pages = []
         
         # Create a temporary file to store the PDF
         temp_dir = tempfile.mkdtemp()
@@ -32,15 +49,18 @@ class PDFProcessor:
                 import PyPDF2
                 
                 # Extract text from the saved PDF
-                with open(temp_path, 'rb') as file:
+                with open(temp_path, 'rb') as file, timed("extraction") as log:
                     reader = PyPDF2.PdfReader(file)
                     num_pages = len(reader.pages)
+                    log["pages"] = num_pages
                     
                     for page_num in range(num_pages):
-                        page = reader.pages[page_num]
-                        text += page.extract_text() + "\n\n"
+                        with timed("extract_page", page=page_num + 1):
+                            page = reader.pages[page_num]
+                            pages.append(page.extract_text())
+                        PAGES_EXTRACTED.inc()
             except ImportError:
-                print("PyPDF2 not available, trying alternative method...")
+                logger.warning("PyPDF2 not available, trying alternative method...")
                 
                 # If PyPDF2 is not available, store file info instead
                 file_stats = os.stat(temp_path)
@@ -48,11 +68,12 @@ class PDFProcessor:
                 text = f"PDF Document uploaded (size: {file_size} bytes)\n\n"
                 text += "The PDF content would be displayed here if PyPDF2 was available.\n"
                 text += "This is a demonstration of the application's structure."
+                pages = [text]
                 
-            return text
+            return pages
         except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
-            return ""
+            logger.error(f"Error extracting text from PDF: {e}")
+            return []
         finally:
             # Clean up temporary file
             if os.path.exists(temp_path):
@@ -73,7 +94,15 @@ class PDFProcessor:
         """
         if not text:
             return []
-            
+        
+        with timed("chunking") as log:
+            chunks = self._chunk(text, chunk_size, chunk_overlap)
+            log["chunks"] = len(chunks)
+        CHUNKS_CREATED.inc(len(chunks))
+        return chunks
+    
+    def _chunk(self, text, chunk_size, chunk_overlap):
+        """Split text into overlapping chunks without breaking words"""
         chunks = []
         start = 0
         text_length = len(text)
@@ -0,0 +1,311 @@
+"""
+Opt-in profiling of slow requests
+
+While enabled, every profiled request (a question being answered, a PDF
+being ingested) is profiled, and the profile of a request that takes
+longer than the threshold is written to the profile directory; faster ones
+are discarded. Only the newest max_profiles profiles are kept.
+
+Two modes are supported:
+
+    sample    a background thread samples the stacks of the threads serving
+              requests; written as collapsed stacks (.collapsed) that
+              flamegraph.pl, speedscope or py-spy's viewers can render
+    cprofile  deterministic cProfile of the request's thread, written as
+              pstats (.pstats); precise, but slows the request down
+
+Profiling is configured with the PROFILE_DIR (enables it at startup),
+PROFILE_THRESHOLD and PROFILE_MODE environment variables, and can be
+switched at runtime through the metrics server, from the same host or
+with the ADMIN_TOKEN the server was started with:
+
+    curl localhost:9100/admin/profiling
+    curl -X POST 'localhost:9100/admin/profiling?enabled=1&threshold=0.5&mode=sample'
+    curl -X POST -H "Authorization: Bearer $ADMIN_TOKEN" 'host:9100/admin/profiling?enabled=0'
+"""
+import cProfile
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+
+PROFILES_WRITTEN = REGISTRY.register(Counter(
+    "rag_profiles_written_total",
+    "Profiles of requests slower than the profiling threshold",
+    labelnames=("name",)
+))
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class _Request:
+    """A request being profiled"""
+
+    __slots__ = ("name", "labels", "start", "stacks", "profile")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.stacks = StackCounter()
+        self.profile = None
+
+
+class Profiler:
+    """
+    Profiles requests and keeps the profiles of slow ones
+
+    Requests nested in a request already profiled on the same thread are
+    part of the outer profile rather than profiled on their own.
+    """
+
+    def __init__(self, directory="profiles", threshold=1.0, mode="sample", interval=0.005,
+                 max_profiles=100, max_depth=128, enabled=False):
+        """
+        Initialize the profiler
+
+        Args:
+            directory (str): Directory profiles are written to
+            threshold (float): Seconds a request must take for its profile
+                to be written
+            mode (str): "sample" or "cprofile"
+            interval (float): Seconds between stack samples in sample mode
+            max_profiles (int): Profiles kept in the directory; the oldest
+                are deleted
+            max_depth (int): Innermost frames kept per sampled stack
+            enabled (bool): Profile requests from now on
+        """
+        self.directory = directory
+        self.max_depth = max_depth
+        self.enabled = bool(enabled)
+        self.threshold = threshold
+        self.mode = mode
+        self.interval = interval
+        self.max_profiles = max_profiles
+
+        # Thread ID -> request being profiled on that thread
+        self._active = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        self._sequence = itertools.count()
+
+    def configure(self, enabled=None, threshold=None, mode=None, interval=None, max_profiles=None,
+                  directory=None):
+        """
+        Change profiling settings; None leaves a setting unchanged
+
+        Requests already running keep the mode they started with.
+
+        Args:
+            enabled (bool, optional): Profile requests from now on
+            threshold (float, optional): Seconds a request must take for its
+                profile to be written
+            mode (str, optional): "sample" or "cprofile"
+            interval (float, optional): Seconds between stack samples
+            max_profiles (int, optional): Profiles kept in the directory
+            directory (str, optional): Directory profiles are written to
+
+        Returns:
+            dict: The resulting settings
+        """
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {', '.join(PROFILE_MODES)}")
+        if threshold is not None and threshold < 0:
+            raise ValueError("threshold must not be negative")
+        if interval is not None and interval <= 0:
+            raise ValueError("interval must be positive")
+        if max_profiles is not None and max_profiles < 1:
+            raise ValueError("max_profiles must be at least 1")
+
+        if threshold is not None:
+            self.threshold = threshold
+        if mode is not None:
+            self.mode = mode
+        if interval is not None:
+            self.interval = interval
+        if max_profiles is not None:
+            self.max_profiles = max_profiles
+        if directory is not None:
+            self.directory = directory
+        if enabled is not None:
+            if enabled:
+                os.makedirs(self.directory, exist_ok=True)
+            self.enabled = bool(enabled)
+
+        settings = self.settings()
+        logger.info("profiling", extra={"fields": settings})
+        return settings
+
+    def settings(self):
+        """
+        Current settings, in the form configure() accepts
+
+        Returns:
+            dict: enabled, threshold, mode, interval, max_profiles and directory
+        """
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "mode": self.mode,
+            "interval": self.interval,
+            "max_profiles": self.max_profiles,
+            "directory": self.directory,
+        }
+
+    @contextmanager
+    def profile(self, name, **labels):
+        """
+        Profile the enclosed block as one request
+
+        Args:
+            name (str): Request type, e.g. "answer_question"
+            **labels: Values identifying the request, e.g. path="manual.pdf";
+                they appear in the profile's file name and log record
+        """
+        thread_id = threading.get_ident()
+        if not self.enabled or thread_id in self._active:
+            yield
+            return
+
+        request = _Request(name, labels)
+        mode = self.mode
+        if mode == "cprofile":
+            request.profile = cProfile.Profile()
+            try:
+                request.profile.enable()
+            except ValueError:
+                # Python 3.12+ allows one active cProfile per process
+                request.profile = None
+                mode = "sample"
+
+        with self._lock:
+            self._active[thread_id] = request
+        if mode == "sample":
+            self._start_sampler()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - request.start
+            if request.profile is not None:
+                request.profile.disable()
+            with self._lock:
+                del self._active[thread_id]
+            if seconds >= self.threshold:
+                try:
+                    self._write(request, seconds)
+                except OSError as e:
+                    logger.error(f"Error writing profile of {name}: {e}")
+
+    def _start_sampler(self):
+        with self._lock:
+            self._wake.set()
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        """Sample the stacks of every thread with a request in flight; sleep while there are none"""
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.items())
+                if not active:
+                    self._wake.clear()
+                    continue
+            for thread_id, request in active:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id and request.profile is None:
+                    request.stacks[self._stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _stack(self, frame):
+        """Collapsed-stack line for a frame: callers first, separated by semicolons"""
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _write(self, request, seconds):
+        """Write the profile of a slow request and rotate the directory"""
+        if request.profile is None and not request.stacks:
+            return
+
+        label = "-".join(
+            _UNSAFE_RE.sub("_", os.path.basename(str(value)))[:60] for value in request.labels.values()
+        )
+        # Ingestion workers in other processes may share the directory
+        stem = (f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._sequence):06d}-"
+                f"{int(seconds * 1000)}ms-{request.name}")
+        if label:
+            stem = f"{stem}-{label}"
+
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if request.profile is not None:
+                path = os.path.join(self.directory, f"{stem}.pstats")
+                request.profile.dump_stats(path)
+            else:
+                path = os.path.join(self.directory, f"{stem}.collapsed")
+                with open(path, "w", encoding="utf-8") as f:
+                    for stack, count in request.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            self._rotate()
+
+        PROFILES_WRITTEN.inc(name=request.name)
+        logger.info("profile", extra={"fields": dict(
+            request.labels, name=request.name, seconds=round(seconds, 6), path=path,
+            samples=sum(request.stacks.values())
+        )})
+
+    def _rotate(self):
+        """Delete the oldest profiles beyond max_profiles; names start with their timestamp"""
+        profiles = sorted(
+            entry for entry in os.listdir(self.directory)
+            if entry.endswith((".collapsed", ".pstats"))
+        )
+        for entry in profiles[:-self.max_profiles]:
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except OSError:
+                pass
+
+
+PROFILER = Profiler(
+    directory=os.environ.get("PROFILE_DIR") or "profiles",
+    threshold=float(os.environ.get("PROFILE_THRESHOLD", 1.0)),
+    mode=os.environ.get("PROFILE_MODE", "sample"),
+    enabled=bool(os.environ.get("PROFILE_DIR"))
+)
+
+
+def profiled(name, **labels):
+    """
+    Profile a request with the process-wide PROFILER
+
+    Args:
+        name (str): Request type, e.g. "answer_question"
+        **labels: Values identifying the request
+
+    Returns:
+        Context manager profiling the enclosed block
+    """
+    return PROFILER.profile(name, **labels)
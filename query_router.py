@@ -0,0 +1,225 @@
+import re
+import time
+from collections import deque
+
+from cache import LRUCache
+from extractive_qa import query_terms, tokenize
+from metrics import ROUTE_SECONDS
+
+ROUTE_CACHE = "cache"
+ROUTE_EXTRACTIVE = "extractive"
+ROUTE_GENERATIVE = "generative"
+ROUTE_FALLBACK = "fallback"
+
+# Questions that ask for reasoning or synthesis rather than a fact lookup
+GENERATIVE_QUERY_RE = re.compile(
+    r"\b(why|explain|summari[sz]e|summary|compare|comparison|difference|differences|"
+    r"describe|discuss|analy[sz]e|pros|cons|advantages|disadvantages|implications|"
+    r"how (do|does|did|can|could|should|would))\b"
+)
+
+
+class RouteDecision:
+    """Outcome of QueryRouter.decide"""
+
+    __slots__ = ("route", "reason", "answer", "version")
+
+    def __init__(self, route, reason, answer=None, version=None):
+        self.route = route
+        self.reason = reason
+        # Cached answer text, or ExtractiveAnswer computed while deciding
+        self.answer = answer
+        # Sentence index version the decision was made against
+        self.version = version
+
+
+class RouteStats:
+    """Latency statistics for one route"""
+
+    def __init__(self, window=1000):
+        """
+        Initialize the statistics
+
+        Args:
+            window (int): Number of recent latencies kept for percentiles
+        """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Return the q-th percentile (0-100) of the recent latencies
+
+        Args:
+            q (float): Percentile to compute
+
+        Returns:
+            float: Latency in seconds, 0.0 when nothing was recorded
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+        }
+
+
+class QueryRouter:
+    """
+    Chooses how to answer each question: from the answer cache, with an
+    instant extractive answer, or with full LLM generation
+
+    The decision only uses cheap signals: a cache lookup, the shape of the
+    question, and how clearly the best sentence in the sentence index beats
+    the runner-up. Lookup questions with a clear winner never reach the LLM.
+    """
+
+    def __init__(self, sentence_index, cache_size=256, max_lookup_terms=8,
+                 min_coverage=0.6, min_margin=0.2):
+        """
+        Initialize the router
+
+        Args:
+            sentence_index (SentenceIndex or None): Index used for extractive
+                answers; without one every question is generated and no
+                answer is cached, as there is no version to invalidate it by
+            cache_size (int): Maximum number of cached answers
+            max_lookup_terms (int): Questions with more content terms are
+                always generated
+            min_coverage (float): Minimum fraction of the question's terms that
+                the best sentence must contain to answer extractively
+            min_margin (float): Minimum relative score gap between the best and
+                second best sentence to answer extractively
+        """
+        self.sentence_index = sentence_index
+        self.cache_size = cache_size
+        self.max_lookup_terms = max_lookup_terms
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+
+        # Normalized question -> answer text, tagged with the index version
+        self.cache = LRUCache(cache_size, name="answers")
+        self.route_stats = {}
+
+    def decide(self, question):
+        """
+        Decide which route should answer a question
+
+        Args:
+            question (str): User question
+
+        Returns:
+            RouteDecision: Chosen route and the reason for it
+        """
+        # Read before anything else: documents added while the answer is
+        # generated bump the version, so it is never cached as current
+        if self.sentence_index is None:
+            return RouteDecision(ROUTE_GENERATIVE, "no sentence index")
+        version = self.sentence_index.version
+        cached = self.cache.get(self._cache_key(question), version)
+        if cached is not None:
+            return RouteDecision(ROUTE_CACHE, "cache hit", cached, version)
+
+        if GENERATIVE_QUERY_RE.search(question.lower()):
+            return RouteDecision(ROUTE_GENERATIVE, "question asks for reasoning", version=version)
+
+        terms = query_terms(question)
+        if len(terms) > self.max_lookup_terms:
+            return RouteDecision(ROUTE_GENERATIVE, "question is long", version=version)
+
+        answer = self.sentence_index.answer(question)
+        if not answer:
+            return RouteDecision(ROUTE_GENERATIVE, "no matching sentence", version=version)
+        if answer.coverage < self.min_coverage:
+            return RouteDecision(ROUTE_GENERATIVE, "best sentence misses query terms", answer, version)
+        if answer.margin < self.min_margin:
+            return RouteDecision(ROUTE_GENERATIVE, "no clear best sentence", answer, version)
+
+        return RouteDecision(ROUTE_EXTRACTIVE, "clear sentence match", answer, version)
+
+    def answer(self, question, generate):
+        """
+        Answer a question on the route chosen by decide
+
+        Generated answers are cached under the sentence index version seen
+        by decide, before generation started. If generation raises, the extractive
+        answer is returned instead when one exists, so an overloaded LLM
+        degrades to quoting the documents.
+
+        Args:
+            question (str): User question
+            generate (callable): Called with no arguments to produce an
+                answer on the generative route
+
+        Returns:
+            tuple: (answer text, route name)
+        """
+        start = time.perf_counter()
+        decision = self.decide(question)
+
+        if decision.route == ROUTE_CACHE:
+            text = decision.answer
+        elif decision.route == ROUTE_EXTRACTIVE:
+            text = decision.answer.format()
+        else:
+            try:
+                text = generate()
+                if self.sentence_index is not None:
+                    self.cache.put(self._cache_key(question), text, decision.version)
+            except Exception:
+                answer = decision.answer
+                if answer is None and self.sentence_index is not None:
+                    answer = self.sentence_index.answer(question)
+                if not answer:
+                    raise
+                decision.route = ROUTE_FALLBACK
+                text = answer.format()
+
+        self.record(decision.route, time.perf_counter() - start)
+        return text, decision.route
+
+    def record(self, route, seconds):
+        """
+        Record the latency of an answer
+
+        Args:
+            route (str): Route that produced the answer
+            seconds (float): Time taken
+        """
+        stats = self.route_stats.get(route)
+        if stats is None:
+            stats = self.route_stats[route] = RouteStats()
+        stats.record(seconds)
+        ROUTE_SECONDS.observe(seconds, route=route)
+
+    def stats(self):
+        """
+        Get per-route latency metrics
+
+        Returns:
+            dict: Route name -> count, mean, p50, p95 and max latency in seconds
+        """
+        return {route: stats.to_dict() for route, stats in self.route_stats.items()}
+
+    def clear_cache(self):
+        """Drop all cached answers"""
+        self.cache.clear()
+
+    def _cache_key(self, question):
+        return " ".join(tokenize(question))
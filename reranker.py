@@ -0,0 +1,249 @@
+import logging
+import math
+import os
+import time
+
+from extractive_qa import SentenceIndex, query_terms, tokenize
+from metrics import timed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def hit_text(item):
+    """Text of a search result, whether a SearchHit, a dict or a string"""
+    if isinstance(item, str):
+        return item
+    if "document" in item:
+        return item["document"] or ""
+    return item.get("text", "") if hasattr(item, "get") else str(item)
+
+
+class CrossEncoder:
+    """
+    Small ONNX cross-encoder (e.g. an exported MiniLM reranker) scoring
+    (query, passage) pairs on the CPU
+
+    Requires onnxruntime and tokenizers; the model directory holds
+    model.onnx and tokenizer.json.
+    """
+
+    def __init__(self, model_dir, max_length=256, threads=None):
+        """
+        Load the model
+
+        Args:
+            model_dir (str): Directory containing model.onnx and tokenizer.json
+            max_length (int): Maximum tokens per (query, passage) pair
+            threads (int, optional): Intra-op threads for onnxruntime
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if np is None:
+            raise ImportError("CrossEncoder requires NumPy")
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+    def score(self, query, texts):
+        """
+        Score passages against a query
+
+        Args:
+            query (str): Query text
+            texts (list): Passages
+
+        Returns:
+            list: Relevance logit per passage, higher is better
+        """
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        # Single-logit models score directly; two-class models use the positive class
+        return logits.reshape(len(texts), -1)[:, -1].tolist()
+
+
+def load_cross_encoder(model_dir=None):
+    """
+    Load a CrossEncoder if a model and its dependencies are available
+
+    Args:
+        model_dir (str, optional): Model directory; defaults to the
+            RERANKER_MODEL_DIR environment variable
+
+    Returns:
+        CrossEncoder: Loaded model, or None
+    """
+    model_dir = model_dir or os.environ.get("RERANKER_MODEL_DIR")
+    if not model_dir:
+        return None
+    try:
+        return CrossEncoder(model_dir)
+    except ImportError:
+        logger.warning("onnxruntime or tokenizers not available, cross-encoder reranking disabled")
+    except Exception as e:
+        logger.error(f"Error loading cross-encoder from {model_dir}: {e}")
+    return None
+
+
+class Reranker:
+    """
+    Second-stage reranker for over-fetched search results
+
+    Every candidate gets a cheap score combining BM25 over the candidate
+    set, the proximity of the query terms and its first-stage rank. If a
+    cross-encoder is configured, the lexically best candidates are then
+    scored by it in batches until the time budget runs out; candidates it
+    scored are ranked first by its score, the rest keep the cheap order.
+    """
+
+    def __init__(self, candidates=50, k1=1.2, b=0.75, lexical_weight=0.5, proximity_weight=0.2,
+                 retrieval_weight=0.3, min_relative_score=0.25, cross_encoder=None, batch_size=16,
+                 time_budget=0.1):
+        """
+        Initialize the reranker
+
+        Args:
+            candidates (int): Results to fetch from first-stage retrieval
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalization
+            lexical_weight (float): Weight of the normalized BM25 score
+            proximity_weight (float): Weight of the query term proximity score
+            retrieval_weight (float): Weight of the first-stage rank
+            min_relative_score (float): Drop candidates scoring below this
+                fraction of the best cheap score
+            cross_encoder (CrossEncoder, optional): Model for the final pass
+            batch_size (int): Pairs per cross-encoder call
+            time_budget (float): Seconds the cross-encoder may spend per query
+        """
+        self.candidates = candidates
+        self.k1 = k1
+        self.b = b
+        self.lexical_weight = lexical_weight
+        self.proximity_weight = proximity_weight
+        self.retrieval_weight = retrieval_weight
+        self.min_relative_score = min_relative_score
+        self.cross_encoder = cross_encoder
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+
+    def rerank(self, query, hits, k=5):
+        """
+        Reorder search results by relevance to the query
+
+        Args:
+            query (str): Query text
+            hits (list): First-stage results, best first
+            k (int): Maximum number of results to keep
+
+        Returns:
+            list: At most k of the given results, best first
+        """
+        if not hits:
+            return []
+
+        with timed("rerank", candidates=len(hits)) as log:
+            texts = [hit_text(hit) for hit in hits]
+            scores = self.score(query, texts)
+
+            order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)
+            best = scores[order[0]]
+            order = [i for i in order if scores[i] >= self.min_relative_score * best]
+
+            if self.cross_encoder is not None:
+                order, log["cross_encoded"] = self._cross_encode(query, texts, order)
+
+            log["results"] = min(k, len(order))
+        return [hits[i] for i in order[:k]]
+
+    def score(self, query, texts):
+        """
+        Cheap CPU relevance scores
+
+        Args:
+            query (str): Query text
+            texts (list): Candidate texts in first-stage order
+
+        Returns:
+            list: Score per text, roughly in [0, 1]
+        """
+        terms = query_terms(query)
+        term_set = set(terms)
+        count = len(texts)
+
+        frequencies = []
+        lengths = []
+        document_frequency = dict.fromkeys(terms, 0)
+        for text in texts:
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            tf = {}
+            for token in tokens:
+                if token in term_set:
+                    tf[token] = tf.get(token, 0) + 1
+            for term in tf:
+                document_frequency[term] += 1
+            frequencies.append(tf)
+
+        average_length = sum(lengths) / count or 1.0
+        lexical = []
+        for tf, length in zip(frequencies, lengths):
+            score = 0.0
+            for term, frequency in tf.items():
+                # IDF within the candidate set: terms every candidate shares do not discriminate
+                idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                score += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            lexical.append(score)
+        top_lexical = max(lexical) or 1.0
+
+        scores = []
+        for rank, (text, lexical_score) in enumerate(zip(texts, lexical)):
+            proximity = 0.0
+            if lexical_score and len(terms) > 1:
+                _, positions = SentenceIndex._match_terms(text, term_set)
+                proximity = SentenceIndex._proximity(positions)
+            scores.append(
+                self.lexical_weight * lexical_score / top_lexical
+                + self.proximity_weight * proximity
+                + self.retrieval_weight * (1 - rank / count)
+            )
+        return scores
+
+    def _cross_encode(self, query, texts, order):
+        """Score candidates in order with the cross-encoder until the time budget is spent"""
+        deadline = time.perf_counter() + self.time_budget
+        scored = []
+        position = 0
+        while position < len(order) and time.perf_counter() < deadline:
+            batch = order[position:position + self.batch_size]
+            try:
+                logits = self.cross_encoder.score(query, [texts[i] for i in batch])
+            except Exception as e:
+                logger.error(f"Error scoring with cross-encoder: {e}")
+                break
+            scored.extend(zip(logits, batch))
+            position += len(batch)
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [i for _, i in scored] + order[position:], position
@@ -0,0 +1,404 @@
+"""
+Snapshot export and import for bootstrapping VectorStore replicas
+
+A snapshot is a directory holding everything a VectorStore needs to serve
+queries without extracting or embedding anything again:
+
+    manifest.json     format version, counts and a sha256 per file
+    chunks.text       chunk text in one UTF-8 buffer (ChunkStore)
+    chunks.index      chunk offsets, lengths and tombstones
+    documents.jsonl   one line per document: ID, chunk, metadata, embedding row
+    embeddings.npy    float32 embedding per indexed document
+    lexical.json      the sentence index used for extractive answers, if the
+                      store keeps one
+
+Loading memory-maps the chunk text and the embeddings, so a replica is
+ready once the checksums are verified and the files are mapped:
+
+    python snapshot.py verify /snapshots/manuals-2024-06-01
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from chunk_store import ChunkStore, DocumentRecord, DocumentSnapshot
+from metrics import timed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+MANIFEST = "manifest.json"
+CHUNKS = "chunks"
+DOCUMENTS = "documents.jsonl"
+EMBEDDINGS = "embeddings.npy"
+LEXICAL = "lexical.json"
+
+
+class SnapshotError(Exception):
+    """Raised for a snapshot that is incomplete, corrupt or of an unsupported version"""
+
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    Hash a file without reading it into memory at once
+
+    Args:
+        path (str): File path
+        block_size (int): Bytes read per step
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_snapshot(vector_store, directory):
+    """
+    Write the contents of a VectorStore to a new snapshot directory
+
+    Writers are blocked while the snapshot is taken; searches are not. The
+    files are written to <directory>.partial and renamed when complete, so
+    a reader never sees a half-written snapshot. Documents ChromaDB
+    persisted in earlier sessions, which are not in memory, are read from
+    ChromaDB and exported too.
+
+    Args:
+        vector_store (VectorStore): Store to export
+        directory (str): Snapshot directory; must not exist yet
+
+    Returns:
+        dict: The snapshot manifest
+    """
+    if os.path.exists(directory):
+        raise SnapshotError(f"{directory} already exists")
+    staging = f"{directory}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    with timed("snapshot_export") as log:
+        with vector_store._write_lock:
+            documents = vector_store.documents
+            canonical_ids = dict(vector_store.canonical_ids)
+
+            # Only live chunks are written
+            store, remap = vector_store.chunk_store.compacted()
+            if vector_store.sentence_index is not None:
+                vector_store.sentence_index.save(os.path.join(staging, LEXICAL))
+
+            # (doc_id, chunk in the exported store, metadata)
+            exported = [(doc_id, remap[record.chunk], record.metadata) for doc_id, record in documents.items()]
+            persisted = {}
+            for doc_id, text, metadata, embedding in _persisted_documents(vector_store, documents):
+                exported.append((doc_id, store.append(text), metadata))
+                if embedding is not None:
+                    persisted[doc_id] = embedding
+            store.save(os.path.join(staging, CHUNKS))
+
+            # Duplicates share the embedding of their canonical document
+            vectors = _collect_embeddings(vector_store, [
+                doc_id for doc_id in documents if doc_id not in canonical_ids
+            ])
+            vectors.update(persisted)
+
+        rows = {doc_id: row for row, doc_id in enumerate(vectors)}
+        with open(os.path.join(staging, DOCUMENTS), "w", encoding="utf-8") as f:
+            for doc_id, chunk, metadata in exported:
+                entry = {
+                    "id": doc_id,
+                    "chunk": chunk,
+                    "metadata": metadata,
+                    "row": rows.get(doc_id),
+                    "canonical": canonical_ids.get(doc_id),
+                }
+                f.write(json.dumps(entry) + "\n")
+
+        dim = None
+        if vectors:
+            matrix = np.asarray(list(vectors.values()), dtype=np.float32)
+            dim = matrix.shape[1]
+            np.save(os.path.join(staging, EMBEDDINGS), matrix)
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "created": time.time(),
+            "documents": len(exported),
+            "embeddings": len(vectors),
+            "embedding_dim": dim,
+            "files": {
+                name: {"sha256": file_sha256(os.path.join(staging, name)),
+                       "bytes": os.path.getsize(os.path.join(staging, name))}
+                for name in sorted(os.listdir(staging))
+            },
+        }
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging, directory)
+        log.update(documents=len(exported), persisted=len(exported) - len(documents), embeddings=len(vectors))
+    return manifest
+
+
+def _persisted_documents(vector_store, documents, batch_size=1000):
+    """
+    Page through ChromaDB for documents persisted in earlier sessions
+
+    Args:
+        vector_store (VectorStore): Store being exported
+        documents (Mapping): Documents held in memory, which are skipped
+        batch_size (int): Documents per ChromaDB read
+
+    Yields:
+        tuple: (doc_id, text, metadata, embedding or None)
+    """
+    if not vector_store.using_chromadb:
+        return
+    for name, collection in list(vector_store.collections.items()):
+        # Placeholder collections leave the vectors to the vector index
+        placeholders = vector_store._has_placeholders(name)
+        include = ["documents", "metadatas"]
+        if not placeholders and np is not None:
+            include.append("embeddings")
+        offset = 0
+        while True:
+            stored = collection.get(include=include, limit=batch_size, offset=offset)
+            if not stored["ids"]:
+                break
+            offset += len(stored["ids"])
+            for i, doc_id in enumerate(stored["ids"]):
+                if doc_id in documents:
+                    continue
+                embedding = None
+                if vector_store.vector_indexes is not None:
+                    embedding = vector_store._indexed_vector(doc_id)
+                elif "embeddings" in include:
+                    embedding = stored["embeddings"][i]
+                yield doc_id, stored["documents"][i], stored["metadatas"][i] or {}, embedding
+
+
+def _collect_embeddings(vector_store, doc_ids, batch_size=1000):
+    """Read stored embeddings from the vector index or ChromaDB, keyed by document ID"""
+    if np is None:
+        logger.warning("NumPy not available, snapshot written without embeddings")
+        return {}
+
+    vectors = {}
+    if vector_store.vector_indexes is not None:
+        for doc_id in doc_ids:
+            vector = vector_store._indexed_vector(doc_id)
+            if vector is not None:
+                vectors[doc_id] = vector
+    elif vector_store.using_chromadb:
+        for start in range(0, len(doc_ids), batch_size):
+            stored = vector_store._get(doc_ids[start:start + batch_size], include=["embeddings"])
+            vectors.update(zip(stored["ids"], stored["embeddings"]))
+
+    # Keep document order, so embedding rows follow documents.jsonl
+    return {doc_id: vectors[doc_id] for doc_id in doc_ids if doc_id in vectors}
+
+
+def read_manifest(directory):
+    """
+    Read and check the version of a snapshot manifest
+
+    Args:
+        directory (str): Snapshot directory
+
+    Returns:
+        dict: Manifest
+    """
+    path = os.path.join(directory, MANIFEST)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot read {path}: {e}")
+
+    version = manifest.get("format_version")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format version {version} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def verify_snapshot(directory, manifest=None):
+    """
+    Check every file of a snapshot against the manifest checksums
+
+    Args:
+        directory (str): Snapshot directory
+        manifest (dict, optional): Manifest already read from the directory
+
+    Raises:
+        SnapshotError: If a file is missing or its size or checksum differs
+    """
+    manifest = manifest or read_manifest(directory)
+    with timed("snapshot_verify", files=len(manifest["files"])):
+        for name, expected in manifest["files"].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                raise SnapshotError(f"Missing snapshot file {name}")
+            if os.path.getsize(path) != expected["bytes"]:
+                raise SnapshotError(f"Size mismatch for {name}")
+            if file_sha256(path) != expected["sha256"]:
+                raise SnapshotError(f"Checksum mismatch for {name}")
+
+
+def load_snapshot(directory, vector_store, verify=True, use_mmap=True, add_to_chromadb=True, batch_size=1000):
+    """
+    Load a snapshot into a VectorStore that has no documents yet
+
+    Chunk text and embeddings are memory-mapped. Embeddings go into the
+    in-process vector index, if the store has one, and into ChromaDB for
+    documents it does not already hold, without embedding anything again.
+
+    Args:
+        directory (str): Snapshot directory
+        vector_store (VectorStore): Store to load into
+        verify (bool): Check file checksums before loading
+        use_mmap (bool): Memory-map chunk text and embeddings
+        add_to_chromadb (bool): Insert documents missing from ChromaDB
+        batch_size (int): Documents per ChromaDB insert
+
+    Returns:
+        dict: The snapshot manifest
+    """
+    manifest = read_manifest(directory)
+    if verify:
+        verify_snapshot(directory, manifest)
+
+    with timed("snapshot_load") as log:
+        store = ChunkStore.load(os.path.join(directory, CHUNKS), use_mmap=use_mmap)
+        with open(os.path.join(directory, DOCUMENTS), encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        documents = DocumentSnapshot(
+            (entry["id"], DocumentRecord(store, entry["chunk"], entry["metadata"]))
+            for entry in entries
+        )
+
+        embeddings = None
+        if EMBEDDINGS in manifest["files"]:
+            if np is None:
+                raise SnapshotError("NumPy is required to load snapshot embeddings")
+            embeddings = np.load(os.path.join(directory, EMBEDDINGS), mmap_mode="r" if use_mmap else None)
+        indexed = [entry for entry in entries if entry["row"] is not None]
+
+        with vector_store._write_lock:
+            if vector_store.documents:
+                raise SnapshotError("Snapshots can only be loaded into an empty VectorStore")
+
+            if vector_store.sentence_index is not None:
+                if LEXICAL in manifest["files"]:
+                    vector_store.sentence_index.load(
+                        os.path.join(directory, LEXICAL),
+                        {doc_id: record.metadata for doc_id, record in documents.items()}
+                    )
+                else:
+                    # Exported without one; page numbers are not recoverable
+                    for entry in entries:
+                        if entry["canonical"] is None:
+                            record = documents[entry["id"]]
+                            vector_store.sentence_index.add_document(entry["id"], record.text, record.metadata)
+
+            duplicates = {}
+            for entry in entries:
+                if entry["canonical"] is not None:
+                    duplicates.setdefault(entry["canonical"], []).append(entry["id"])
+            vector_store.duplicates = duplicates
+            vector_store.canonical_ids = {
+                entry["id"]: entry["canonical"] for entry in entries if entry["canonical"] is not None
+            }
+            if vector_store.dedup is not None:
+                for entry in entries:
+                    if entry["canonical"] is None:
+                        dedup = vector_store._dedup_index(documents[entry["id"]].metadata)
+                        dedup.add(entry["id"], dedup.signature(documents[entry["id"]].text))
+
+            # Published before indexing, like add_documents
+            vector_store.chunk_store = store
+            vector_store.documents = documents
+
+            if embeddings is not None and vector_store.vector_indexes is not None:
+                shards = {}
+                for entry in indexed:
+                    name = vector_store.shard_name(entry["id"], documents[entry["id"]].metadata)
+                    shards.setdefault(name, []).append(entry)
+                for name, group in shards.items():
+                    vector_store._vector_index(name).add(
+                        [entry["id"] for entry in group],
+                        embeddings[[entry["row"] for entry in group]]
+                    )
+            if embeddings is not None and add_to_chromadb and vector_store.using_chromadb:
+                log["chromadb_added"] = _add_missing_to_chromadb(
+                    vector_store, indexed, documents, embeddings, batch_size
+                )
+            vector_store.version += 1
+
+        log.update(documents=len(documents), embeddings=len(indexed))
+    return manifest
+
+
+def _add_missing_to_chromadb(vector_store, indexed, documents, embeddings, batch_size):
+    """Insert snapshot documents ChromaDB does not hold yet, with their stored embeddings"""
+    added = 0
+    for start in range(0, len(indexed), batch_size):
+        batch = indexed[start:start + batch_size]
+        present = set(vector_store._get([entry["id"] for entry in batch], include=[])["ids"])
+
+        shards = {}
+        for entry in batch:
+            if entry["id"] not in present:
+                name = vector_store.shard_name(entry["id"], documents[entry["id"]].metadata)
+                shards.setdefault(name, []).append(entry)
+
+        for name, group in shards.items():
+            with timed("index_insert", documents=len(group), shard=name):
+                vector_store._collection(name).add(
+                    ids=[entry["id"] for entry in group],
+                    documents=[documents[entry["id"]].text for entry in group],
+                    metadatas=[documents[entry["id"]].metadata for entry in group],
+                    embeddings=vector_store.chroma_embeddings(
+                        name, np.asarray(embeddings[[entry["row"] for entry in group]])
+                    )
+                )
+            added += len(group)
+    return added
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inspect VectorStore snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify = subparsers.add_parser("verify", help="check a snapshot's version and checksums")
+    verify.add_argument("directory", help="snapshot directory")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        manifest = read_manifest(args.directory)
+        verify_snapshot(args.directory, manifest)
+    except SnapshotError as e:
+        print(f"Invalid snapshot: {e}", file=sys.stderr)
+        return 1
+    print(f"OK: format {manifest['format_version']}, {manifest['documents']} documents, "
+          f"{manifest['embeddings']} embeddings, "
+          f"{sum(entry['bytes'] for entry in manifest['files'].values())} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
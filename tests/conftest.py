@@ -0,0 +1,43 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingEmbedder:
+    """Deterministic embedding function that records every text it embeds"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            vectors.append([byte / 255 - 0.5 for byte in digest[:self.dim]])
+        return vectors
+
+
+@pytest.fixture
+def embedder():
+    return RecordingEmbedder()
+
+
+@pytest.fixture
+def make_store(tmp_path, embedder):
+    """Factory for VectorStores persisting under tmp_path, all sharing one embedder"""
+    from vector_store import VectorStore
+
+    def make(name="store", **kwargs):
+        kwargs.setdefault("embedding_function", embedder)
+        kwargs.setdefault("cache_size", 0)
+        kwargs.setdefault("embedding_cache_size", 0)
+        return VectorStore(persist_directory=str(tmp_path / name), **kwargs)
+
+    return make
@@ -0,0 +1,95 @@
+import threading
+
+from cache import LRUCache
+from metrics import CACHE_LOOKUPS
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_entries_are_only_returned_for_their_version():
+    cache = LRUCache()
+    cache.put("query", "old results", version=1)
+
+    assert cache.get("query", version=1) == "old results"
+    assert cache.get("query") is None
+    # The stale entry was dropped, so going back does not revive it
+    assert cache.get("query", version=1) is None
+    assert len(cache) == 0
+
+    cache.put("query", "new results", version=2)
+    assert cache.get("query", version=2) == "new results"
+
+
+def test_hits_and_misses_are_counted():
+    cache = LRUCache(name="test_counts")
+    hits = CACHE_LOOKUPS.value(cache="test_counts", result="hit")
+    misses = CACHE_LOOKUPS.value(cache="test_counts", result="miss")
+    cache.put("a", 1)
+
+    cache.get("a")
+    cache.get("b")
+    cache.get("a", version=3)
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert CACHE_LOOKUPS.value(cache="test_counts", result="hit") == hits + 1
+    assert CACHE_LOOKUPS.value(cache="test_counts", result="miss") == misses + 2
+
+
+def test_none_and_disabled_caches_store_nothing():
+    cache = LRUCache()
+    cache.put("a", None)
+    assert len(cache) == 0
+
+    disabled = LRUCache(maxsize=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None and len(disabled) == 0
+
+
+def test_clear():
+    cache = LRUCache()
+    cache.put("a", 1, version=1)
+    cache.clear()
+    assert cache.get("a", version=1) is None
+
+
+def test_concurrent_use_keeps_the_size_bound():
+    cache = LRUCache(maxsize=50)
+
+    def work(offset):
+        for i in range(2000):
+            cache.put((offset + i) % 200, i, version=i % 3)
+            cache.get((offset + i * 7) % 200, version=i % 3)
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) <= 50
+    assert cache.hits + cache.misses == 8 * 2000
+
+
+def test_store_writes_invalidate_cached_search_results(make_store, embedder):
+    store = make_store(cache_size=16)
+    first = store.add_document("The pump runs at 1200 rpm.")
+    assert [hit["id"] for hit in store.search("pump", k=5)] == [first]
+    assert [hit["id"] for hit in store.search("pump", k=5)] == [first]
+    assert store.result_cache.hits == 1
+
+    second = store.add_document("The spare pump runs at 900 rpm.")
+
+    assert {hit["id"] for hit in store.search("pump", k=5)} == {first, second}
+    store.delete_document(first)
+    assert [hit["id"] for hit in store.search("pump", k=5)] == [second]
@@ -0,0 +1,149 @@
+import json
+from array import array
+
+import pytest
+
+from chunk_store import ChunkStore, DocumentRecord, DocumentSnapshot, SearchHit
+
+TEXTS = ["first chunk", "zweiter Abschnitt – ünïcode", "", "third chunk"]
+
+
+@pytest.fixture
+def store():
+    store = ChunkStore()
+    for text in TEXTS:
+        store.append(text)
+    return store
+
+
+def test_append_returns_indexes_and_texts_round_trip(store):
+    assert len(store) == len(TEXTS)
+    assert [store.text(i) for i in range(len(store))] == TEXTS
+    assert store.append("more") == len(TEXTS)
+    assert list(store.lengths) == [len(text.encode("utf-8")) for text in TEXTS] + [4]
+    # Text bytes plus two int64 values and a tombstone byte per chunk
+    assert store.nbytes == sum(len(text.encode("utf-8")) for text in TEXTS + ["more"]) + 17 * 5
+
+
+def test_delete_tombstones_and_counts_dead_bytes(store):
+    assert store.delete(0)
+    assert not store.delete(0)
+    assert not store.is_alive(0) and store.is_alive(1)
+    assert store.dead_bytes == len("first chunk")
+    assert not store.should_compact()
+
+    store.delete(1)
+    assert store.should_compact()
+
+
+def test_compacted_copies_live_chunks_and_leaves_the_original(store):
+    store.delete(1)
+
+    compacted, remap = store.compacted()
+
+    assert list(remap) == [0, -1, 1, 2]
+    assert [compacted.text(i) for i in range(len(compacted))] == ["first chunk", "", "third chunk"]
+    assert compacted.dead_bytes == 0
+    # Readers of the old store are unaffected
+    assert store.text(1) == TEXTS[1] and len(store) == len(TEXTS)
+
+
+def test_compact_in_place(store):
+    store.delete(0)
+    store.delete(3)
+
+    remap = store.compact()
+
+    assert list(remap) == [-1, 0, 1, -1]
+    assert [store.text(i) for i in range(len(store))] == TEXTS[1:3]
+    assert store.dead_bytes == 0
+    assert store.append("again") == 2
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_save_and_load(store, tmp_path, use_mmap):
+    store.delete(2)
+    path = str(tmp_path / "chunks")
+    store.save(path)
+
+    loaded = ChunkStore.load(path, use_mmap=use_mmap)
+
+    assert [loaded.text(i) for i in range(len(loaded))] == TEXTS
+    assert not loaded.is_alive(2)
+    assert loaded.dead_bytes == store.dead_bytes
+    # Appending copies a mapped buffer into memory
+    assert loaded.append("new") == len(TEXTS)
+    assert loaded.text(len(TEXTS)) == "new" and loaded.text(1) == TEXTS[1]
+
+
+def test_load_reads_files_with_document_numbers(tmp_path):
+    # Version 1 files hold an owner number per chunk after the lengths
+    data = [text.encode("utf-8") for text in TEXTS]
+    path = str(tmp_path / "chunks")
+    with open(f"{path}.text", "wb") as f:
+        f.write(b"".join(data))
+    with open(f"{path}.index", "wb") as f:
+        f.write(json.dumps({"count": len(data), "dead_bytes": 0}).encode("utf-8") + b"\n")
+        offsets = [sum(len(d) for d in data[:i]) for i in range(len(data))]
+        for values in (offsets, [len(d) for d in data], range(len(data))):
+            array("q", values).tofile(f)
+        f.write(b"\x01\x01\x00\x01")
+
+    loaded = ChunkStore.load(path)
+
+    assert [loaded.text(i) for i in range(len(loaded))] == TEXTS
+    assert [loaded.is_alive(i) for i in range(len(loaded))] == [True, True, False, True]
+
+
+def test_snapshot_copies_do_not_see_each_others_writes():
+    snapshot = DocumentSnapshot({f"doc{i}": i for i in range(100)}, buckets=8)
+    copy = snapshot.copy()
+
+    copy["doc0"] = "changed"
+    copy.pop("doc1")
+    snapshot["new"] = True
+
+    assert snapshot["doc0"] == 0 and "doc1" in snapshot and len(snapshot) == 101
+    assert copy["doc0"] == "changed" and "doc1" not in copy and "new" not in copy and len(copy) == 99
+
+
+class CountingStore(ChunkStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def text(self, index):
+        self.reads += 1
+        return super().text(index)
+
+
+def test_search_hit_decodes_text_only_when_read():
+    store = CountingStore()
+    record = DocumentRecord(store, store.append("lazy text"), {"filename": "a.pdf"})
+
+    hit = SearchHit("doc", record, score=0.25, references=["copy"])
+
+    assert store.reads == 0
+    assert hit["metadata"] == {"filename": "a.pdf"} and hit.get("score") == 0.25
+    assert hit["references"] == ("copy",) and "document" in hit
+    assert store.reads == 0
+    assert hit["document"] == "lazy text"
+    assert store.reads == 1
+    assert hit.to_dict() == {
+        "document": "lazy text", "metadata": {"filename": "a.pdf"}, "id": "doc", "score": 0.25, "references": ("copy",)
+    }
+    with pytest.raises(KeyError):
+        hit["text"]
+
+
+def test_search_hit_keeps_reading_its_store_after_compaction():
+    store = ChunkStore()
+    store.append("deleted")
+    record = DocumentRecord(store, store.append("kept"), {})
+    hit = SearchHit("doc", record)
+    store.delete(0)
+
+    compacted, remap = store.compacted()
+
+    assert hit["document"] == "kept"
+    assert DocumentRecord(compacted, remap[record.chunk], {}).text == "kept"
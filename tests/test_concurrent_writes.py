@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from chunk_store import SearchHit
+
+CHUNKS = 12
+REVISIONS = 8
+
+
+def manual(revision):
+    texts = [f"Revision {revision} of the manual, section {i}: the pump runs at {1000 + revision} rpm." for i in range(CHUNKS)]
+    metadatas = [{"filename": "manual.pdf", "revision": revision} for _ in range(CHUNKS)]
+    return texts, metadatas
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"])
+def test_readers_see_each_replacement_whole(make_store, quantization):
+    store = make_store(quantization=quantization)
+    current = store.add_documents(*manual(0))
+    stop = threading.Event()
+    problems = []
+
+    def check_snapshots():
+        while not stop.is_set():
+            revisions = [
+                record.metadata["revision"]
+                for record in store.documents.values()
+                if record.metadata.get("filename") == "manual.pdf"
+            ]
+            if len(revisions) != CHUNKS or len(set(revisions)) != 1:
+                problems.append(f"snapshot holds manual revisions {sorted(set(revisions))} in {len(revisions)} documents")
+
+    def search():
+        while not stop.is_set():
+            for hit in store.search("pump rpm manual section", k=5):
+                if not isinstance(hit, SearchHit):
+                    problems.append(f"search returned {hit['id']}, which its snapshot lacked")
+                elif "revision" in hit["metadata"] and not hit["document"].startswith(f"Revision {hit['metadata']['revision']} "):
+                    problems.append(f"hit {hit['id']} has the text of another revision")
+
+    def ingest_and_delete():
+        for i in range(REVISIONS * 2):
+            ids = store.add_documents([f"Unrelated note {i} about filters."], [{"filename": f"note{i}.pdf"}])
+            store.delete_documents(ids)
+
+    readers = [threading.Thread(target=check_snapshots), threading.Thread(target=search)]
+    writer = threading.Thread(target=ingest_and_delete)
+    for thread in readers + [writer]:
+        thread.start()
+    try:
+        for revision in range(1, REVISIONS + 1):
+            current = store.replace_documents(*manual(revision), current)
+    finally:
+        writer.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+    assert problems == []
+    assert {record.metadata["revision"] for record in store.documents.values()} == {REVISIONS}
+    assert len(store.documents) == CHUNKS
+    assert {hit["metadata"]["revision"] for hit in store.search("pump rpm", k=CHUNKS)} == {REVISIONS}
@@ -0,0 +1,97 @@
+import pytest
+
+TEXT = (
+    "Before servicing the pump, disconnect the power supply and close both isolation valves. "
+    "Drain the housing through the plug at the bottom and let the motor cool for at least "
+    "thirty minutes before removing the cover."
+)
+OTHER = "The warranty covers manufacturing defects for two years from the date of purchase."
+
+
+@pytest.fixture(params=[None, "int8"], ids=["chromadb", "int8"])
+def store(request, make_store):
+    return make_store(dedup_threshold=0.8, quantization=request.param)
+
+
+def test_duplicates_reference_the_canonical_chunk(store, embedder):
+    canonical, duplicate, other = store.add_documents(
+        [TEXT, TEXT, OTHER], [{"filename": "a.pdf"}, {"filename": "b.pdf"}, {"filename": "c.pdf"}]
+    )
+
+    assert embedder.texts == [TEXT, OTHER]
+    assert store.canonical_ids == {duplicate: canonical}
+    assert store.get_document(duplicate)["text"] == TEXT
+    hit = store.search(TEXT, k=1)[0]
+    assert hit["id"] == canonical
+    assert hit["references"] == (duplicate,)
+
+
+def test_deleting_the_canonical_chunk_promotes_a_duplicate(store, embedder):
+    canonical, first, second = store.add_documents(
+        [TEXT] * 3, [{"filename": name} for name in ("a.pdf", "b.pdf", "c.pdf")]
+    )
+    store.add_document(OTHER, {"filename": "d.pdf"})
+    embedder.texts.clear()
+
+    store.delete_document(canonical)
+
+    # The stored embedding moves to the successor instead of being recomputed
+    assert embedder.texts == []
+    assert store.get_document(canonical) is None
+    assert store.canonical_ids == {second: first}
+    assert store.duplicates == {first: [second]}
+    hit = store.search(TEXT, k=1)[0]
+    assert hit["id"] == first
+    assert hit["document"] == TEXT
+    assert hit["metadata"]["filename"] == "b.pdf"
+    assert hit["references"] == (second,)
+
+
+def test_deleting_every_copy_removes_the_chunk(store):
+    doc_ids = store.add_documents([TEXT] * 3)
+    other = store.add_document(OTHER)
+
+    for doc_id in doc_ids:
+        store.delete_document(doc_id)
+
+    assert store.canonical_ids == {}
+    assert store.duplicates == {}
+    assert [hit["id"] for hit in store.search(TEXT, k=5)] == [other]
+
+
+def test_deleting_a_duplicate_keeps_the_canonical_chunk(store):
+    canonical, duplicate = store.add_documents([TEXT, TEXT])
+
+    store.delete_document(duplicate)
+
+    assert store.canonical_ids == {}
+    assert store.duplicates == {}
+    hit = store.search(TEXT, k=1)[0]
+    assert hit["id"] == canonical
+    assert hit["references"] == ()
+
+
+def test_tenants_do_not_share_chunks(make_store, embedder):
+    store = make_store(dedup_threshold=0.8, shard_key="tenant")
+
+    acme, globex = store.add_documents([TEXT, TEXT], [{"tenant": "acme"}, {"tenant": "globex"}])
+
+    assert embedder.texts == [TEXT, TEXT]
+    assert store.canonical_ids == {}
+    assert store.search(TEXT, k=1, tenant="globex")[0]["id"] == globex
+    store.delete_document(acme)
+    assert store.search(TEXT, k=1, tenant="globex")[0]["id"] == globex
+
+
+def test_replacement_takes_over_the_chunk_it_duplicates(store, embedder):
+    old = store.add_document(TEXT, {"filename": "a.pdf", "revision": 1})
+    embedder.texts.clear()
+
+    new, = store.replace_documents([TEXT], [{"filename": "a.pdf", "revision": 2}], [old])
+
+    assert embedder.texts == []
+    assert store.canonical_ids == {} and store.duplicates == {}
+    assert store.get_document(old) is None
+    hit = store.search(TEXT, k=1)[0]
+    assert hit["id"] == new
+    assert hit["metadata"]["revision"] == 2
@@ -0,0 +1,103 @@
+import pytest
+
+from extractive_qa import ExtractiveAnswer, SentenceIndex, split_sentences
+
+MANUAL_PAGES = [
+    "The pump runs at 1200 rpm under normal load.\nMaintenance is scheduled every six months.",
+    "The warranty covers parts for two years. Replacement filters are sold separately.",
+]
+
+
+@pytest.fixture
+def index():
+    index = SentenceIndex()
+    index.add_document("manual", MANUAL_PAGES, {"filename": "manual.pdf"})
+    index.add_document("notes", "Filters wear out. Filters are cheap.", {"page": 7})
+    return index
+
+
+def test_split_sentences_joins_broken_lines():
+    assert split_sentences("The pump runs\nat 1200 rpm. It is quiet.\n\nNew paragraph") == [
+        "The pump runs at 1200 rpm.", "It is quiet.", "New paragraph"
+    ]
+
+
+def test_clear_match_has_full_margin_and_coverage(index):
+    answer = index.answer("What is the pump rpm?")
+
+    assert [match.text for match in answer.matches] == ["The pump runs at 1200 rpm under normal load."]
+    assert answer.margin == 1.0
+    assert answer.coverage == 1.0
+
+
+def test_tied_sentences_have_no_margin(index):
+    answer = index.answer("filters", k=3)
+
+    assert len(answer.matches) == 3
+    assert answer.margin == pytest.approx(0.0)
+
+
+def test_coverage_counts_query_terms_in_the_best_sentence(index):
+    answer = index.answer("pump voltage")
+
+    assert answer.coverage == 0.5
+
+
+def test_empty_answer_is_falsy():
+    answer = ExtractiveAnswer("anything", [])
+
+    assert not answer
+    assert answer.margin == 0.0 and answer.coverage == 0.0 and answer.top_score == 0.0
+
+
+def test_format_highlights_terms_and_cites_pages(index):
+    assert index.answer("pump rpm").format() == (
+        "The **pump** runs at 1200 **rpm** under normal load. [manual.pdf, p. 1]"
+    )
+    # Without a filename the document ID is cited, with the page from metadata
+    assert index.answer("wear").format(marker="_") == "Filters _wear_ out. [notes, p. 7]"
+
+
+def test_metadata_updates_change_citations(index):
+    index.update_metadata("notes", {"page": 9, "filename": "notes.pdf"})
+
+    assert index.answer("wear").matches[0].citation() == "notes.pdf, p. 9"
+
+
+def test_deleted_documents_are_not_answered(index):
+    version = index.version
+    assert index.delete_document("manual")
+
+    assert not index.answer("pump rpm")
+    assert index.version > version
+    assert not index.delete_document("manual")
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "sentences.json")
+    index.save(path)
+
+    loaded = SentenceIndex()
+    loaded.load(path, {"manual": {"filename": "manual.pdf"}, "notes": {"page": 7}})
+
+    assert len(loaded) == len(index)
+    for question in ("pump rpm", "warranty parts", "filters"):
+        assert loaded.answer(question).format() == index.answer(question).format()
+
+    # Sentences added after loading get fresh IDs
+    loaded.add_document("extra", "The pump is blue.")
+    assert len(loaded) == len(index) + 1
+    assert {match.doc_id for match in loaded.answer("pump", k=5).matches} == {"manual", "extra"}
+
+
+def test_load_replaces_contents_in_place(index, tmp_path):
+    path = str(tmp_path / "sentences.json")
+    empty = SentenceIndex()
+    empty.save(path)
+    version = index.version
+
+    index.load(path)
+
+    assert len(index) == 0
+    assert not index.answer("pump")
+    assert index.version > version
@@ -0,0 +1,101 @@
+import json
+import os
+
+from ingest import Checkpoint, chunk_pages, find_pdfs, ingest_directory
+
+
+def write_manual(path, text):
+    from benchmark import write_pdf
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_pdf(path, [[text, "Replace the intake filter every six months."]])
+
+
+def ingest_run(store, root, checkpoint_path):
+    return ingest_directory(str(root), store, Checkpoint(str(checkpoint_path)), workers=1)
+
+
+def test_checkpoint_reloads_entries_and_ignores_a_cut_line(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.record({"hash": "h1", "path": "/docs/a.pdf", "doc_ids": ["1"]})
+    checkpoint.record({"hash": "h2", "path": "/docs/b.pdf", "doc_ids": ["2"]})
+    checkpoint.record({"hash": "h3", "path": "/docs/a.pdf", "doc_ids": ["3"]})
+    with open(path, "a") as f:
+        f.write('{"hash": "h4", "pa')
+
+    reloaded = Checkpoint(path)
+
+    assert "h1" in reloaded and "h3" in reloaded and "h4" not in reloaded
+    assert reloaded.paths["/docs/a.pdf"]["hash"] == "h3"
+    assert reloaded.latest("/docs") == {"a.pdf": "h3", "b.pdf": "h2"}
+    assert reloaded.latest("/docs", match_key="filename") == {"a.pdf": "h3", "b.pdf": "h2"}
+
+
+def test_chunk_pages_keeps_page_numbers_and_overlap():
+    chunks = chunk_pages(["a" * 25, "", "b" * 10], chunk_size=10, chunk_overlap=2)
+
+    assert [page for page, _ in chunks] == [1, 1, 1, 3]
+    assert all(len(text) <= 10 for _, text in chunks)
+    assert "".join(text for _, text in chunks).count("b") == 10
+
+
+def test_interrupted_run_resumes_with_the_remaining_files(tmp_path, make_store, embedder):
+    store = make_store()
+    root = tmp_path / "docs"
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    write_manual(str(root / "a.pdf"), "The pump is rated at 100 psi.")
+    assert ingest_run(store, root, checkpoint)["ingested"] == 1
+
+    # The run was stopped while recording the next file
+    with open(checkpoint, "a") as f:
+        f.write('{"hash": "')
+    write_manual(str(root / "b.pdf"), "The valve is rated at 50 psi.")
+    write_manual(str(root / "sub" / "c.pdf"), "The hose is rated at 20 psi.")
+    embedder.texts.clear()
+
+    stats = ingest_run(store, root, checkpoint)
+
+    assert (stats["files"], stats["ingested"], stats["skipped"], stats["failed"]) == (3, 2, 1, 0)
+    assert not any("100 psi" in text for text in embedder.texts)
+    assert stats["chunks"] == len(store.find_documents(filename="b.pdf")) + len(store.find_documents(filename="c.pdf"))
+    assert [os.path.basename(path) for path in find_pdfs(str(root))] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert {os.path.basename(entry["path"]) for entry in Checkpoint(str(checkpoint)).paths.values()} == {
+        "a.pdf", "b.pdf", "c.pdf"
+    }
+
+
+def test_failed_files_are_counted_and_retried(tmp_path, make_store):
+    store = make_store()
+    root = tmp_path / "docs"
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    write_manual(str(root / "good.pdf"), "The pump is rated at 100 psi.")
+    with open(root / "corrupt.pdf", "wb") as f:
+        f.write(b"%PDF-1.4 this is not a PDF")
+    from benchmark import write_pdf
+    write_pdf(str(root / "blank.pdf"), [[]])
+
+    stats = ingest_run(store, root, checkpoint)
+
+    assert (stats["ingested"], stats["failed"], stats["skipped"]) == (1, 2, 0)
+    with open(checkpoint) as f:
+        assert [os.path.basename(json.loads(line)["path"]) for line in f] == ["good.pdf"]
+    # Failed files are not checkpointed, so the next run tries them again
+    assert ingest_run(store, root, checkpoint)["failed"] == 2
+
+
+def test_files_that_fail_to_write_are_retried(tmp_path, make_store):
+    def failing(texts):
+        raise RuntimeError("embedding service down")
+
+    root = tmp_path / "docs"
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    write_manual(str(root / "a.pdf"), "The pump is rated at 100 psi.")
+
+    broken = make_store("broken", embedding_function=failing)
+    stats = ingest_run(broken, root, checkpoint)
+    assert (stats["ingested"], stats["failed"], stats["chunks"]) == (0, 1, 0)
+    assert len(broken.documents) == 0
+
+    stats = ingest_run(make_store(), root, checkpoint)
+    assert (stats["ingested"], stats["failed"]) == (1, 0)
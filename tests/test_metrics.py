@@ -0,0 +1,201 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from metrics import (
+    STAGE_ERRORS, STAGE_SECONDS, Counter, Histogram, JsonFormatter, MetricsHandler, Registry, observe,
+    render_prometheus, timed
+)
+from profiler import PROFILER
+
+
+@pytest.fixture
+def server(tmp_path):
+    settings = PROFILER.settings()
+    PROFILER.configure(directory=str(tmp_path / "profiles"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    PROFILER.configure(**settings)
+
+
+def request(url, method="GET", token=None):
+    """Return (status, body) of an HTTP request"""
+    headers = {"Authorization": f"Bearer {token}"} if token is not None else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method, headers=headers), timeout=5) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def test_admin_requests_from_loopback_need_no_token(server, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+
+    status, body = request(f"{server}/admin/profiling")
+    assert status == 200 and json.loads(body) == PROFILER.settings()
+
+    status, body = request(f"{server}/admin/profiling?enabled=1&threshold=0.25&mode=cprofile", method="POST")
+    assert status == 200
+    assert json.loads(body)["threshold"] == 0.25 and PROFILER.enabled and PROFILER.mode == "cprofile"
+
+
+def test_admin_token_is_required_when_set(server, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    threshold = PROFILER.threshold
+
+    for token in (None, "wrong", "s3cret "):
+        status, body = request(f"{server}/admin/profiling?threshold=9", method="POST", token=token)
+        assert status == 401 and "admin token" in json.loads(body)["error"]
+    assert request(f"{server}/admin/profiling", token="wrong")[0] == 401
+    assert PROFILER.threshold == threshold
+
+    assert request(f"{server}/admin/profiling?threshold=9", method="POST", token="s3cret")[0] == 200
+    assert PROFILER.threshold == 9
+
+
+def test_invalid_admin_settings_are_rejected(server, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+
+    for query in ("mode=perf", "threshold=soon", "max_profiles=0"):
+        status, body = request(f"{server}/admin/profiling?{query}", method="POST")
+        assert status == 400 and json.loads(body)["error"]
+
+
+class RecordingHandler(MetricsHandler):
+    """Handler checked without a connection, recording what it would send"""
+
+    def __init__(self, address, headers=None):
+        self.client_address = (address, 40000)
+        self.headers = headers or {}
+        self.sent = []
+
+    def _send(self, status, text, content_type):
+        self.sent.append(status)
+
+
+@pytest.mark.parametrize("address, allowed", [
+    ("127.0.0.1", True), ("::1", True), ("10.0.0.5", False), ("192.168.1.20", False), ("not-an-ip", False),
+])
+def test_without_token_only_loopback_clients_are_admitted(monkeypatch, address, allowed):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    handler = RecordingHandler(address)
+
+    assert handler._authorized() is allowed
+    assert handler.sent == ([] if allowed else [403])
+
+
+def test_with_token_remote_clients_are_admitted(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+
+    assert RecordingHandler("10.0.0.5", {"Authorization": "Bearer s3cret"})._authorized()
+    # The token is required from loopback too
+    handler = RecordingHandler("127.0.0.1")
+    assert not handler._authorized() and handler.sent == [401]
+
+
+def test_counter_renders_labels_and_unlabeled_zero():
+    registry = Registry()
+    plain = registry.register(Counter("test_plain_total", "Plain counter"))
+    labeled = registry.register(Counter("test_labeled_total", "Labeled counter", labelnames=("cache", "result")))
+
+    labeled.inc(cache="answers", result="hit")
+    labeled.inc(2, cache="answers", result="hit")
+    labeled.inc(cache='quo"te\\', result="miss")
+
+    assert labeled.value(cache="answers", result="hit") == 3
+    assert registry.render() == "\n".join([
+        "# HELP test_plain_total Plain counter",
+        "# TYPE test_plain_total counter",
+        "test_plain_total 0",
+        "# HELP test_labeled_total Labeled counter",
+        "# TYPE test_labeled_total counter",
+        'test_labeled_total{cache="answers",result="hit"} 3',
+        'test_labeled_total{cache="quo\\"te\\\\",result="miss"} 1',
+    ]) + "\n"
+    assert plain.value() == 0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test durations", labelnames=("stage",), buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="embed")
+
+    assert histogram.count(stage="embed") == 4 and histogram.count(stage="other") == 0
+    assert histogram.render() == [
+        "# HELP test_seconds Test durations",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="embed",le="0.1"} 2',
+        'test_seconds_bucket{stage="embed",le="1.0"} 3',
+        'test_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'test_seconds_sum{stage="embed"} 3.65',
+        'test_seconds_count{stage="embed"} 4',
+    ]
+
+
+def test_timed_records_duration_and_logs_fields(caplog):
+    count = STAGE_SECONDS.count(stage="test_timed")
+
+    with caplog.at_level(logging.INFO, logger="rag.metrics"):
+        with timed("test_timed", shard="a") as log:
+            log["results"] = 3
+
+    assert STAGE_SECONDS.count(stage="test_timed") == count + 1
+    fields = caplog.records[-1].fields
+    assert fields["stage"] == "test_timed" and fields["shard"] == "a" and fields["results"] == 3
+    assert fields["seconds"] >= 0 and "error" not in fields
+
+
+def test_timed_counts_errors_and_reraises(caplog):
+    errors = STAGE_ERRORS.value(stage="test_failing")
+    count = STAGE_SECONDS.count(stage="test_failing")
+
+    with caplog.at_level(logging.INFO, logger="rag.metrics"), pytest.raises(RuntimeError):
+        with timed("test_failing"):
+            raise RuntimeError("boom")
+
+    assert STAGE_ERRORS.value(stage="test_failing") == errors + 1
+    assert STAGE_SECONDS.count(stage="test_failing") == count + 1
+    assert caplog.records[-1].fields["error"] is True
+
+
+def test_observe_records_an_external_duration(caplog):
+    count = STAGE_SECONDS.count(stage="test_ttft")
+
+    with caplog.at_level(logging.INFO, logger="rag.metrics"):
+        observe("test_ttft", 0.25, model="llama")
+
+    assert STAGE_SECONDS.count(stage="test_ttft") == count + 1
+    assert caplog.records[-1].fields == {"model": "llama", "stage": "test_ttft", "seconds": 0.25}
+    assert 'rag_stage_duration_seconds_bucket{stage="test_ttft",le="0.25"}' in render_prometheus()
+
+
+def test_json_formatter_merges_fields():
+    record = logging.LogRecord("rag.metrics", logging.INFO, __file__, 1, "stage", None, None)
+    record.fields = {"stage": "retrieval", "seconds": 0.5}
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["level"] == "INFO" and entry["message"] == "stage"
+    assert entry["stage"] == "retrieval" and entry["seconds"] == 0.5
+
+
+def test_metrics_endpoint_serves_prometheus_text(server):
+    with timed("test_endpoint"):
+        pass
+
+    with urllib.request.urlopen(f"{server}/metrics", timeout=5) as response:
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        body = response.read().decode("utf-8")
+    assert "# TYPE rag_stage_duration_seconds histogram" in body
+    assert 'rag_stage_duration_seconds_count{stage="test_endpoint"} 1' in body
+    assert request(f"{server}/other")[0] == 404
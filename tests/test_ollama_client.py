@@ -0,0 +1,133 @@
+import json
+
+import pytest
+import requests
+
+import ollama_client
+from metrics import STAGE_SECONDS
+from ollama_client import OllamaClient
+
+
+class FakeResponse:
+    def __init__(self, lines, status=200):
+        self.lines = lines
+        self.status = status
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status} Server Error")
+
+    def iter_lines(self, chunk_size=512):
+        for line in self.lines:
+            yield line if isinstance(line, bytes) else json.dumps(line).encode("utf-8")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Queue of responses served to requests.post, and the payloads it was sent"""
+
+    class Server:
+        responses = []
+        payloads = []
+
+        def reply(self, *lines, status=200):
+            response = FakeResponse(list(lines), status)
+            self.responses.append(response)
+            return response
+
+        def generated(self, text, context):
+            return self.reply({"response": text}, {"response": "", "done": True, "context": context})
+
+    server = Server()
+
+    def post(url, json=None, stream=False):
+        server.payloads.append(json)
+        return server.responses.pop(0)
+
+    monkeypatch.setattr(ollama_client.requests, "post", post)
+    return server
+
+
+def test_streamed_chunks_are_assembled(server):
+    client = OllamaClient()
+    ttft = STAGE_SECONDS.count(stage="time_to_first_token")
+    response = server.reply({"response": "Hel"}, b"", {"response": "lo"}, {"response": "", "done": True, "eval_count": 2})
+
+    result = client.generate("Say hello", system_prompt="Be brief")
+
+    assert result["response"] == "Hello" and result["eval_count"] == 2
+    assert server.payloads[0]["stream"] is True and server.payloads[0]["system"] == "Be brief"
+    assert STAGE_SECONDS.count(stage="time_to_first_token") == ttft + 1
+    assert response.closed
+
+
+def test_chat_assembles_message_content(server):
+    server.reply({"message": {"content": "Hi "}}, {"message": {"content": "there"}, "done": True})
+
+    result = OllamaClient().chat([{"role": "user", "content": "Hello"}])
+
+    assert result["message"] == {"role": "assistant", "content": "Hi there"}
+
+
+def test_conversations_continue_from_their_context(server):
+    client = OllamaClient()
+    server.generated("First answer", [1, 2, 3])
+    server.generated("Second answer", [1, 2, 3, 4, 5])
+    server.generated("Unrelated", [9])
+
+    client.generate("First question", conversation_id="c1")
+    client.generate("Second question", conversation_id="c1")
+    client.generate("Fresh start", context=[7], conversation_id="c1")
+
+    assert "context" not in server.payloads[0]
+    assert server.payloads[1]["context"] == [1, 2, 3]
+    # An explicit context wins over the remembered one
+    assert server.payloads[2]["context"] == [7]
+    assert client.conversations["c1"] == [9]
+
+    client.forget_conversation("c1")
+    assert "c1" not in client.conversations
+
+
+def test_least_recently_continued_conversations_are_forgotten(server):
+    client = OllamaClient(max_conversations=2)
+    for conversation_id, context in (("c1", [1]), ("c2", [2]), ("c1", [1, 1]), ("c3", [3])):
+        server.generated("answer", context)
+        client.generate("question", conversation_id=conversation_id)
+
+    assert list(client.conversations) == ["c1", "c3"]
+    assert client.conversations["c1"] == [1, 1]
+
+
+def test_malformed_stream_lines_return_an_error(server):
+    client = OllamaClient()
+    response = server.reply({"response": "partial"}, b"{not json", {"response": "", "done": True, "context": [1]})
+
+    result = client.generate("question", conversation_id="c1")
+
+    assert result["error"].startswith("Invalid streamed response from Ollama")
+    assert "response" not in result
+    assert "c1" not in client.conversations
+    assert response.closed
+
+    server.reply(b"<html>502 Bad Gateway</html>")
+    assert client.answer_with_context("question", ["context"]).startswith(
+        "Error generating response: Invalid streamed response"
+    )
+
+
+def test_error_chunks_and_http_errors_are_returned(server):
+    client = OllamaClient()
+
+    server.reply({"error": "model 'llama3.1:latest' not found"})
+    assert client.chat([{"role": "user", "content": "Hello"}]) == {"error": "model 'llama3.1:latest' not found"}
+
+    server.reply(status=500)
+    assert client.generate("question")["error"] == "500 Server Error"
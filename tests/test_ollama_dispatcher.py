@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pytest
+
+from ollama_client import OllamaClient
+from ollama_dispatcher import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, OllamaDispatcher, OverloadedError
+
+
+class FakeClient(OllamaClient):
+    """OllamaClient answering locally; calls wait on gate while it is clear"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def chat(self, messages, temperature=0.7, max_tokens=2048):
+        self.calls.append(("chat", messages[-1]["content"]))
+        self.started.set()
+        self.gate.wait(5)
+        return {"message": {"content": f"answer: {messages[-1]['content']}"}}
+
+    def generate(self, prompt, context=None, system_prompt=None, temperature=0.7, max_tokens=2048,
+                 conversation_id=None):
+        self.calls.append(("generate", prompt, conversation_id))
+        return {"response": "generated"}
+
+    def embed(self, texts):
+        self.calls.append(("embed", list(texts)))
+        return {"embeddings": [[float(len(text))] for text in texts]}
+
+
+class Background:
+    """Runs a call on a thread, keeping its result or exception"""
+
+    def __init__(self, call):
+        self.result = self.error = None
+        self.thread = threading.Thread(target=self._run, args=(call,))
+        self.thread.start()
+
+    def _run(self, call):
+        try:
+            self.result = call()
+        except Exception as e:
+            self.error = e
+
+    def join(self):
+        self.thread.join(5)
+        assert not self.thread.is_alive()
+        return self.result
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def make_dispatcher(client):
+    dispatchers = []
+
+    def make(**kwargs):
+        dispatcher = OllamaDispatcher(client, **kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    client.gate.set()
+    for dispatcher in dispatchers:
+        dispatcher.close()
+
+
+def occupy_worker(client, dispatcher):
+    """Hold the only worker in a chat call until client.gate is set"""
+    client.gate.clear()
+    busy = Background(lambda: dispatcher.chat([{"role": "user", "content": "busy"}]))
+    assert client.started.wait(5)
+    return busy
+
+
+def wait_for_queue(dispatcher, depth):
+    deadline = time.monotonic() + 5
+    while dispatcher.queue_depth() < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_identical_requests_share_one_call(client, make_dispatcher):
+    dispatcher = make_dispatcher(workers=1)
+    busy = occupy_worker(client, dispatcher)
+
+    first = Background(lambda: dispatcher.chat([{"role": "user", "content": "What is X?"}]))
+    wait_for_queue(dispatcher, 1)
+    second = Background(lambda: dispatcher.chat([{"role": "user", "content": "  what is   x? "}]))
+    second.thread.join(0.05)
+    client.gate.set()
+
+    assert first.join() == second.join() == {"message": {"content": "answer: What is X?"}}
+    busy.join()
+    assert [call for call in client.calls if call[0] == "chat"] == [("chat", "busy"), ("chat", "What is X?")]
+    assert dispatcher.stats["coalesced"] == 1
+
+
+def test_higher_priority_requests_are_served_first(client, make_dispatcher):
+    dispatcher = make_dispatcher(workers=1)
+    busy = occupy_worker(client, dispatcher)
+
+    waiting = []
+    for content, priority in [("low", PRIORITY_LOW), ("normal", PRIORITY_NORMAL), ("high", PRIORITY_HIGH)]:
+        waiting.append(Background(
+            lambda content=content, priority=priority: dispatcher.chat([{"role": "user", "content": content}], priority=priority)
+        ))
+        wait_for_queue(dispatcher, len(waiting))
+    client.gate.set()
+
+    busy.join()
+    for request in waiting:
+        request.join()
+    assert [call[1] for call in client.calls] == ["busy", "high", "normal", "low"]
+
+
+def test_full_queue_raises_429_with_retry_after(client, make_dispatcher):
+    dispatcher = make_dispatcher(workers=1, max_queue=1)
+    busy = occupy_worker(client, dispatcher)
+    queued = Background(lambda: dispatcher.chat([{"role": "user", "content": "queued"}]))
+    wait_for_queue(dispatcher, 1)
+
+    with pytest.raises(OverloadedError) as raised:
+        dispatcher.chat([{"role": "user", "content": "rejected"}])
+    assert raised.value.status_code == 429
+    assert raised.value.retry_after >= 1
+    assert raised.value.headers == {"Retry-After": str(raised.value.retry_after)}
+    assert dispatcher.stats["rejected"] == 1
+
+    client.gate.set()
+    busy.join()
+    assert queued.join() == {"message": {"content": "answer: queued"}}
+
+
+def test_answer_with_context_goes_through_the_queue(client, make_dispatcher):
+    dispatcher = make_dispatcher(workers=1, max_queue=1)
+    busy = occupy_worker(client, dispatcher)
+    queued = Background(lambda: dispatcher.answer_with_context("What is X?", ["X is 42."]))
+    wait_for_queue(dispatcher, 1)
+
+    with pytest.raises(OverloadedError):
+        dispatcher.answer_with_context("What is Y?", ["Y is 7."])
+
+    client.gate.set()
+    busy.join()
+    answer = queued.join()
+    assert answer.startswith("answer: ") and "X is 42." in answer and answer.endswith("What is X?\n")
+    assert dispatcher.stats["submitted"] == 2
+
+    assert dispatcher.answer_with_context("What is X?", ["X is 42."], conversation_id="c1") == "generated"
+    assert client.calls[-1][0] == "generate" and client.calls[-1][2] == "c1"
+
+
+def test_concurrent_embeddings_are_batched(client, make_dispatcher):
+    dispatcher = make_dispatcher(batch_window=0.1)
+
+    requests = [Background(lambda texts=texts: dispatcher.embed(texts)) for texts in (["a", "bb"], ["bb", "ccc"], ["dddd"])]
+
+    assert [request.join() for request in requests] == [
+        {"embeddings": [[1.0], [2.0]]},
+        {"embeddings": [[2.0], [3.0]]},
+        {"embeddings": [[4.0]]},
+    ]
+    embeds = [call[1] for call in client.calls if call[0] == "embed"]
+    assert len(embeds) == 1 and sorted(embeds[0]) == ["a", "bb", "ccc", "dddd"]
+    assert dispatcher.stats["batches"] == 1
+
+
+def test_pending_embeddings_count_against_capacity(client, make_dispatcher):
+    dispatcher = make_dispatcher(workers=1, max_queue=2, max_batch=2, batch_window=0.2)
+    busy = occupy_worker(client, dispatcher)
+
+    # Three texts need two batches, which fill the queue while still pending
+    pending = Background(lambda: dispatcher.embed(["a", "b", "c"]))
+    deadline = time.monotonic() + 5
+    while len(dispatcher._pending_embeds) < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+    with pytest.raises(OverloadedError):
+        dispatcher.chat([{"role": "user", "content": "rejected"}])
+    with pytest.raises(OverloadedError):
+        dispatcher.embed(["d", "e"])
+    # Joins the second batch, which has room for one more text
+    joined = Background(lambda: dispatcher.embed(["d"]))
+
+    client.gate.set()
+    busy.join()
+    assert pending.join() == {"embeddings": [[1.0], [1.0], [1.0]]}
+    assert joined.join() == {"embeddings": [[1.0]]}
+    assert dispatcher.stats["rejected"] == 2
@@ -0,0 +1,111 @@
+import os
+import pstats
+import time
+
+import pytest
+
+from profiler import PROFILES_WRITTEN, Profiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def make_profiler(tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("directory", str(tmp_path / "profiles"))
+        kwargs.setdefault("interval", 0.001)
+        kwargs.setdefault("enabled", True)
+        return Profiler(**kwargs)
+
+    return make
+
+
+def profiles(profiler):
+    if not os.path.isdir(profiler.directory):
+        return []
+    return sorted(os.listdir(profiler.directory))
+
+
+def test_disabled_profiler_writes_nothing(make_profiler):
+    profiler = make_profiler(enabled=False, threshold=0)
+
+    with profiler.profile("answer_question"):
+        busy(0.02)
+
+    assert profiles(profiler) == []
+
+
+def test_only_requests_over_the_threshold_are_written(make_profiler):
+    profiler = make_profiler(threshold=0.05)
+    written = PROFILES_WRITTEN.value(name="ingest_file")
+
+    with profiler.profile("ingest_file", path="/data/fast.pdf"):
+        busy(0.001)
+    assert profiles(profiler) == []
+
+    with profiler.profile("ingest_file", path="/data/slow manual.pdf"):
+        busy(0.1)
+
+    names = profiles(profiler)
+    assert len(names) == 1
+    assert names[0].endswith("-ingest_file-slow_manual.pdf.collapsed")
+    with open(os.path.join(profiler.directory, names[0]), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    # Collapsed stacks, callers first, with the sample count last
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy (test_profiler.py" in line for line in lines)
+    assert PROFILES_WRITTEN.value(name="ingest_file") == written + 1
+
+
+def test_cprofile_mode_writes_pstats(make_profiler):
+    profiler = make_profiler(threshold=0, mode="cprofile")
+
+    with profiler.profile("answer_question"):
+        busy(0.01)
+
+    names = profiles(profiler)
+    assert len(names) == 1 and names[0].endswith(".pstats")
+    stats = pstats.Stats(os.path.join(profiler.directory, names[0]))
+    assert any(function == "busy" for _, _, function in stats.stats)
+
+
+def test_nested_requests_are_part_of_the_outer_profile(make_profiler):
+    profiler = make_profiler(threshold=0, mode="cprofile")
+
+    with profiler.profile("answer_question"):
+        with profiler.profile("retrieval"):
+            busy(0.01)
+
+    assert [name.split("-")[4].split(".")[0] for name in profiles(profiler)] == ["answer_question"]
+
+
+def test_rotation_keeps_the_newest_profiles(make_profiler):
+    profiler = make_profiler(threshold=0, mode="cprofile", max_profiles=2)
+
+    for i in range(4):
+        with profiler.profile("answer_question", request=f"q{i}"):
+            busy(0.001)
+
+    names = profiles(profiler)
+    assert [name.rsplit("-", 1)[1] for name in names] == ["q2.pstats", "q3.pstats"]
+
+
+def test_configure_validates_and_applies_settings(make_profiler, tmp_path):
+    profiler = make_profiler(enabled=False)
+
+    for bad in ({"mode": "perf"}, {"threshold": -1}, {"interval": 0}, {"max_profiles": 0}):
+        with pytest.raises(ValueError):
+            profiler.configure(**bad)
+
+    directory = str(tmp_path / "elsewhere")
+    settings = profiler.configure(enabled=True, threshold=0.5, mode="cprofile", max_profiles=5, directory=directory)
+
+    assert settings == profiler.settings() == {
+        "enabled": True, "threshold": 0.5, "mode": "cprofile", "interval": 0.001,
+        "max_profiles": 5, "directory": directory,
+    }
+    assert os.path.isdir(directory)
@@ -0,0 +1,118 @@
+import pytest
+
+from chatbot import Chatbot
+from extractive_qa import SentenceIndex
+from query_router import ROUTE_CACHE, ROUTE_EXTRACTIVE, ROUTE_FALLBACK, ROUTE_GENERATIVE, QueryRouter
+
+
+class Generator:
+    """Stand-in for LLM generation that counts its calls"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return f"generated {self.calls}"
+
+
+@pytest.fixture
+def index():
+    index = SentenceIndex()
+    index.add_document("manual", [
+        "The pump runs at 1200 rpm under normal load. Filters wear out.",
+        "Replacement filters are sold separately. Filters are cheap.",
+    ], {"filename": "manual.pdf"})
+    return index
+
+
+@pytest.mark.parametrize("question, route, reason", [
+    ("What is the pump rpm?", ROUTE_EXTRACTIVE, "clear sentence match"),
+    ("Why does the pump run at 1200 rpm?", ROUTE_GENERATIVE, "question asks for reasoning"),
+    ("pump rpm load filters wear replacement cheap separately sold", ROUTE_GENERATIVE, "question is long"),
+    ("What is the voltage?", ROUTE_GENERATIVE, "no matching sentence"),
+    ("pump voltage current", ROUTE_GENERATIVE, "best sentence misses query terms"),
+    ("filters", ROUTE_GENERATIVE, "no clear best sentence"),
+])
+def test_decide(index, question, route, reason):
+    decision = QueryRouter(index).decide(question)
+
+    assert (decision.route, decision.reason) == (route, reason)
+    assert decision.version == index.version
+
+
+def test_extractive_answers_skip_generation(index):
+    router = QueryRouter(index)
+    generate = Generator()
+
+    text, route = router.answer("What is the pump rpm?", generate)
+
+    assert route == ROUTE_EXTRACTIVE
+    assert text == "The **pump** runs at 1200 **rpm** under normal load. [manual.pdf, p. 1]"
+    assert generate.calls == 0
+    assert router.stats()[ROUTE_EXTRACTIVE]["count"] == 1
+
+
+def test_generated_answers_are_cached_until_the_index_changes(index):
+    router = QueryRouter(index)
+    generate = Generator()
+
+    assert router.answer("Why does the pump run?", generate) == ("generated 1", ROUTE_GENERATIVE)
+    # Normalized questions share the cached answer
+    assert router.answer("  why DOES the pump run ", generate) == ("generated 1", ROUTE_CACHE)
+    assert generate.calls == 1
+
+    index.add_document("notes", "The pump was replaced.")
+    assert router.answer("Why does the pump run?", generate) == ("generated 2", ROUTE_GENERATIVE)
+    assert router.stats().keys() == {ROUTE_GENERATIVE, ROUTE_CACHE}
+
+
+def test_failed_generation_falls_back_to_extractive_answer(index):
+    router = QueryRouter(index)
+
+    text, route = router.answer("filters", Generator(RuntimeError("overloaded")))
+    assert route == ROUTE_FALLBACK
+    assert text.startswith("**Filters** wear out. [manual.pdf, p. 1]")
+
+    # Reasoning questions are decided without an answer, which is looked up on failure
+    text, route = router.answer("Why do filters wear out?", Generator(RuntimeError("overloaded")))
+    assert route == ROUTE_FALLBACK
+    assert "**wear** **out**" in text
+
+    # Failures are not cached
+    assert router.answer("filters", Generator()) == ("generated 1", ROUTE_GENERATIVE)
+
+
+def test_failed_generation_without_a_match_raises(index):
+    with pytest.raises(RuntimeError):
+        QueryRouter(index).answer("What is the voltage?", Generator(RuntimeError("overloaded")))
+
+
+def test_without_sentence_index_everything_is_generated():
+    router = QueryRouter(None)
+    generate = Generator()
+
+    assert router.answer("What is the pump rpm?", generate) == ("generated 1", ROUTE_GENERATIVE)
+    assert router.answer("What is the pump rpm?", generate) == ("generated 2", ROUTE_GENERATIVE)
+
+
+def test_chatbot_auto_mode_routes_with_a_sentence_index(make_store):
+    store = make_store(extractive=True)
+    store.add_document("The pump runs at 1200 rpm under normal load.", {"filename": "manual.pdf"})
+    chatbot = Chatbot(store)
+
+    assert chatbot.answer_question("What is the pump rpm?").startswith("The **pump** runs")
+    assert chatbot.router.stats().keys() == {ROUTE_EXTRACTIVE}
+
+
+def test_chatbot_auto_mode_requires_a_sentence_index(make_store):
+    store = make_store()
+    store.add_document("The pump runs at 1200 rpm under normal load.")
+    chatbot = Chatbot(store)
+
+    with pytest.raises(ValueError, match="extractive=True"):
+        chatbot.answer_question("What is the pump rpm?")
+    assert "pump" in chatbot.answer_question("What is the pump rpm?", mode="generative")
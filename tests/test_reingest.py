@@ -0,0 +1,129 @@
+import os
+
+from ingest import Checkpoint, ingest_directory, reingest, write_chunks
+
+CHUNKS = [
+    (1, "The pump is rated for 300 litres per minute at full speed."),
+    (1, "Replace the intake filter every six months of operation."),
+    (2, "The warranty does not cover damage from running the pump dry."),
+]
+
+
+def revision(chunks, relative_path="manuals/pump.pdf", file_hash="rev1"):
+    return {
+        "path": f"/data/{relative_path}",
+        "relative_path": relative_path,
+        "hash": file_hash,
+        "pages": len({page for page, _ in chunks}),
+        "chunks": list(chunks),
+    }
+
+
+def stored_texts(store, relative_path="manuals/pump.pdf"):
+    found = store.find_documents(relative_path=relative_path)
+    return sorted(store.get_document(doc_id)["text"] for doc_id in found)
+
+
+def test_only_changed_chunks_are_embedded(make_store, embedder):
+    store = make_store()
+    first_ids = write_chunks(store, revision(CHUNKS))
+    embedder.texts.clear()
+
+    changed = [
+        CHUNKS[0],
+        (1, "Replace the intake filter every three months of operation."),
+        (3, "Store the pump in a dry place over winter."),
+    ]
+    stats = reingest(store, revision(changed, file_hash="rev2"))
+
+    assert stats["kept"] == 1
+    assert stats["added"] == 2
+    assert stats["deleted"] == 2
+    assert stats["pages_changed"] == 2
+    assert sorted(embedder.texts) == sorted(text for _, text in changed[1:])
+    assert first_ids[0] in stats["doc_ids"]
+    assert stored_texts(store) == sorted(text for _, text in changed)
+
+
+def test_kept_chunks_get_the_new_revision_metadata(make_store):
+    store = make_store()
+    write_chunks(store, revision(CHUNKS))
+
+    # Same text, moved to another page
+    moved = [CHUNKS[0], CHUNKS[1], (3, CHUNKS[2][1])]
+    stats = reingest(store, revision(moved, file_hash="rev2"))
+
+    assert (stats["added"], stats["kept"], stats["deleted"]) == (0, 3, 0)
+    metadata = {doc_id: store.get_document(doc_id)["metadata"] for doc_id in stats["doc_ids"]}
+    assert {m["content_hash"] for m in metadata.values()} == {"rev2"}
+    assert sorted(m["page"] for m in metadata.values()) == [1, 1, 3]
+
+
+def test_files_with_the_same_name_in_different_directories_are_separate(make_store):
+    store = make_store()
+    write_chunks(store, revision(CHUNKS, relative_path="a/manual.pdf"))
+    write_chunks(store, revision(CHUNKS, relative_path="b/manual.pdf"))
+
+    stats = reingest(store, revision(CHUNKS[:1], relative_path="a/manual.pdf", file_hash="rev2"))
+
+    assert (stats["kept"], stats["deleted"]) == (1, 2)
+    assert stored_texts(store, "a/manual.pdf") == [CHUNKS[0][1]]
+    assert stored_texts(store, "b/manual.pdf") == sorted(text for _, text in CHUNKS)
+
+
+def test_first_revision_adds_every_chunk(make_store):
+    store = make_store()
+
+    stats = reingest(store, revision(CHUNKS))
+
+    assert (stats["added"], stats["kept"], stats["deleted"]) == (3, 0, 0)
+    assert stored_texts(store) == sorted(text for _, text in CHUNKS)
+
+
+def write_manual(path, pressure):
+    from benchmark import write_pdf
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_pdf(path, [[f"The pump is rated at {pressure} psi.", "Replace the intake filter every six months."]])
+
+
+def ingest_run(store, root, checkpoint_path):
+    return ingest_directory(str(root), store, Checkpoint(str(checkpoint_path)), workers=1)
+
+
+def test_reverting_a_file_reingests_the_older_revision(tmp_path, make_store):
+    store = make_store()
+    root = tmp_path / "docs"
+    manual = str(root / "manuals" / "pump.pdf")
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    write_manual(manual, 100)
+    assert ingest_run(store, root, checkpoint)["ingested"] == 1
+    write_manual(manual, 200)
+    assert ingest_run(store, root, checkpoint)["updated"] == 1
+    write_manual(manual, 100)
+    stats = ingest_run(store, root, checkpoint)
+
+    assert (stats["updated"], stats["skipped"]) == (1, 0)
+    texts = stored_texts(store, os.path.join("manuals", "pump.pdf"))
+    assert any("100 psi" in text for text in texts)
+    assert not any("200 psi" in text for text in texts)
+    # A resumed run with nothing changed skips the file
+    assert ingest_run(store, root, checkpoint)["skipped"] == 1
+
+
+def test_copies_under_other_paths_are_stored_for_each_path(tmp_path, make_store):
+    store = make_store()
+    root = tmp_path / "docs"
+    first, second = str(root / "a" / "pump.pdf"), str(root / "b" / "pump.pdf")
+    write_manual(first, 100)
+    write_manual(second, 100)
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    assert ingest_run(store, root, checkpoint)["ingested"] == 2
+
+    # Revising one copy leaves the other one searchable
+    write_manual(first, 200)
+    assert ingest_run(store, root, checkpoint)["updated"] == 1
+    assert all("100 psi" in text for text in stored_texts(store, os.path.join("b", "pump.pdf")))
+    assert all("200 psi" in text for text in stored_texts(store, os.path.join("a", "pump.pdf")))
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from reranker import Reranker, hit_text
+
+RELEVANT = "Replace the pump filter every 500 hours of operation."
+PARTIAL = "The filter housing is made of stainless steel and sits behind the motor."
+UNRELATED = "The warranty covers manufacturing defects for two years."
+
+
+def hits(*texts):
+    return [{"document": text, "id": f"doc{i}"} for i, text in enumerate(texts)]
+
+
+class FakeCrossEncoder:
+    """Scores passages by a fixed table, recording the batches it was given"""
+
+    def __init__(self, scores, delay=0.0, error=None):
+        self.scores = scores
+        self.delay = delay
+        self.error = error
+        self.batches = []
+
+    def score(self, query, texts):
+        self.batches.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        time.sleep(self.delay)
+        return [self.scores[text] for text in texts]
+
+
+def test_hit_text_reads_every_result_shape():
+    assert hit_text("plain") == "plain"
+    assert hit_text({"document": "from search"}) == "from search"
+    assert hit_text({"text": "from documents"}) == "from documents"
+    assert hit_text({"document": None}) == ""
+
+
+def test_lexical_match_beats_first_stage_rank():
+    reranker = Reranker(min_relative_score=0)
+
+    ranked = reranker.rerank("how often to replace the pump filter", hits(UNRELATED, PARTIAL, RELEVANT), k=3)
+
+    assert ranked[0]["document"] == RELEVANT
+
+
+def test_first_stage_rank_breaks_ties():
+    reranker = Reranker(min_relative_score=0)
+
+    ranked = reranker.rerank("voltage", hits(UNRELATED, PARTIAL), k=2)
+
+    assert [hit["id"] for hit in ranked] == ["doc0", "doc1"]
+
+
+def test_min_relative_score_drops_weak_candidates():
+    candidates = hits(UNRELATED, PARTIAL, RELEVANT)
+    query = "pump filter replace hours"
+    scores = Reranker().score(query, [hit["document"] for hit in candidates])
+    best = max(scores)
+
+    kept = Reranker(min_relative_score=0.5).rerank(query, candidates, k=3)
+
+    assert [hit["document"] for hit in kept] == [
+        candidates[i]["document"]
+        for i in sorted(range(3), key=lambda i: scores[i], reverse=True)
+        if scores[i] >= 0.5 * best
+    ]
+    assert UNRELATED not in [hit["document"] for hit in kept]
+    assert len(Reranker(min_relative_score=0).rerank(query, candidates, k=3)) == 3
+    # The best candidate always survives
+    assert len(Reranker(min_relative_score=1.0).rerank(query, candidates, k=3)) >= 1
+
+
+def test_k_limits_results_and_empty_input():
+    reranker = Reranker()
+    assert reranker.rerank("pump", [], k=3) == []
+    assert len(reranker.rerank("pump filter", hits(RELEVANT, PARTIAL, RELEVANT + " Again."), k=2)) == 2
+
+
+def test_cross_encoder_orders_the_candidates_it_scored():
+    encoder = FakeCrossEncoder({RELEVANT: 0.1, PARTIAL: 0.9, UNRELATED: 0.5})
+    reranker = Reranker(min_relative_score=0, cross_encoder=encoder, batch_size=2)
+
+    ranked = reranker.rerank("pump filter", hits(RELEVANT, PARTIAL, UNRELATED), k=3)
+
+    assert [hit["document"] for hit in ranked] == [PARTIAL, UNRELATED, RELEVANT]
+    assert [len(batch) for batch in encoder.batches] == [2, 1]
+
+
+def test_cross_encoder_stops_at_the_time_budget():
+    encoder = FakeCrossEncoder({RELEVANT: 0.1, PARTIAL: 0.9, UNRELATED: 0.5}, delay=0.05)
+    reranker = Reranker(min_relative_score=0, cross_encoder=encoder, batch_size=1, time_budget=0.01)
+
+    ranked = reranker.rerank("pump filter", hits(UNRELATED, PARTIAL, RELEVANT), k=3)
+
+    # Only the lexically best candidate was scored; the rest keep the cheap order
+    assert len(encoder.batches) == 1
+    assert ranked[0]["document"] == encoder.batches[0][0]
+    assert len(ranked) == 3
+
+
+def test_cross_encoder_errors_keep_the_cheap_order():
+    encoder = FakeCrossEncoder({}, error=RuntimeError("model failed"))
+    cheap = Reranker(min_relative_score=0).rerank("pump filter", hits(UNRELATED, PARTIAL, RELEVANT), k=3)
+
+    ranked = Reranker(min_relative_score=0, cross_encoder=encoder).rerank(
+        "pump filter", hits(UNRELATED, PARTIAL, RELEVANT), k=3
+    )
+
+    assert [hit["id"] for hit in ranked] == [hit["id"] for hit in cheap]
@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+from vector_store import MAX_COLLECTION_NAME
+
+TEXTS = [f"Maintenance note {i}: replace filter {i} after {i * 100} hours." for i in range(12)]
+LONG_TENANT = "Department of Very Long Names / Facilities & Maintenance " * 4
+
+
+def test_hash_shards_spread_documents_and_survive_a_reopen(make_store):
+    store = make_store(shards=3)
+    doc_ids = store.add_documents(TEXTS)
+
+    assert set(store.collections) == {"pdf_documents-0", "pdf_documents-1", "pdf_documents-2"}
+    assert sum(collection.count() for collection in store.collections.values()) == len(TEXTS)
+    assert all(collection.count() for collection in store.collections.values())
+    assert store.search(TEXTS[5], k=1)[0]["id"] == doc_ids[5]
+
+    reopened = make_store(shards=3)
+    hit = reopened.search(TEXTS[7], k=1)[0]
+    assert hit["id"] == doc_ids[7] and hit["document"] == TEXTS[7]
+
+    # Documents of the earlier session are found in their shard by ID
+    reopened.delete_documents(doc_ids[:6])
+    assert sum(collection.count() for collection in reopened.collections.values()) == 6
+    assert {hit["id"] for hit in reopened.search(TEXTS[0], k=12)} == set(doc_ids[6:])
+
+
+@pytest.mark.parametrize("tenant", ["acme", "Globex Corp.", "a..b", LONG_TENANT])
+def test_tenant_shard_names_are_valid_collection_names(make_store, tenant):
+    store = make_store(shard_key="tenant")
+    name = store.tenant_shard_name(tenant)
+
+    assert 3 <= len(name) <= MAX_COLLECTION_NAME
+    assert re.fullmatch(r"[a-zA-Z0-9][a-zA-Z0-9._-]*[a-zA-Z0-9]", name) and ".." not in name
+    assert name != store.tenant_shard_name(tenant + "x")
+
+    store.add_document("The pump runs at 1200 rpm.", {"tenant": tenant})
+    assert store.collections[name].metadata["tenant"] == tenant
+
+
+def test_tenant_shards_are_searched_alone_and_rediscovered(make_store):
+    store = make_store(shard_key="tenant")
+    tenants = ["acme", "globex", LONG_TENANT]
+    doc_ids = store.add_documents(TEXTS, [{"tenant": tenants[i % 3]} for i in range(len(TEXTS))])
+    untagged = store.add_document("A note without a tenant.")
+
+    hits = store.search(TEXTS[0], k=12, tenant="acme")
+    assert {hit["metadata"]["tenant"] for hit in hits} == {"acme"} and len(hits) == 4
+    assert [hit["id"] for hit in store.search("A note without a tenant.", k=1)] == [untagged]
+
+    # Another store whose name extends this one's, and an unrelated collection
+    make_store(collection_name="pdf_documents-archive").add_document("Archived.")
+    store.client.get_or_create_collection("pdf_documents-scratch")
+
+    reopened = make_store(shard_key="tenant")
+    assert set(reopened.collections) == {"pdf_documents"} | {store.tenant_shard_name(tenant) for tenant in tenants}
+    hit = reopened.search(TEXTS[2], k=1, tenant=LONG_TENANT)[0]
+    assert hit["id"] == doc_ids[2]
+
+    reopened.delete_documents([doc_ids[2], doc_ids[5]])
+    assert reopened.collections[store.tenant_shard_name(LONG_TENANT)].count() == 2
+    assert doc_ids[2] not in {hit["id"] for hit in reopened.search(TEXTS[2], k=12)}
+
+
+def test_tenant_shards_without_recorded_tenant_are_checked_by_content(make_store):
+    store = make_store(shard_key="tenant")
+    name = store.tenant_shard_name("acme")
+    # As created before the tenant was recorded in the collection metadata
+    legacy = store.client.get_or_create_collection(name, metadata={"hnsw:space": "cosine"})
+    legacy.add(ids=["old"], documents=["Legacy note."], embeddings=store.embedding_function(["Legacy note."]),
+               metadatas=[{"tenant": "acme"}])
+    store.client.get_or_create_collection(store.tenant_shard_name("globex"), metadata={"hnsw:space": "cosine"}).add(
+        ids=["other"], documents=["Other note."], embeddings=store.embedding_function(["Other note."]),
+        metadatas=[{"tenant": "someone else"}]
+    )
+
+    reopened = make_store(shard_key="tenant")
+
+    assert set(reopened.collections) == {"pdf_documents", name}
+    assert [hit["id"] for hit in reopened.search("Legacy note.", k=1, tenant="acme")] == ["old"]
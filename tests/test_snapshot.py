@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from snapshot import SnapshotError, export_snapshot, load_snapshot, read_manifest, verify_snapshot
+
+TEXT = (
+    "Before servicing the pump, disconnect the power supply and close both isolation valves. "
+    "Drain the housing through the plug at the bottom and let the motor cool for at least "
+    "thirty minutes before removing the cover."
+)
+OTHER = "The warranty covers manufacturing defects for two years from the date of purchase."
+THIRD = "Spare impellers can be ordered from the service portal using the serial number."
+
+
+@pytest.fixture
+def source(make_store):
+    store = make_store("source", dedup_threshold=0.8, extractive=True)
+    doc_ids = store.add_documents(
+        [TEXT, OTHER, TEXT, THIRD],
+        [{"filename": name} for name in ("a.pdf", "b.pdf", "c.pdf", "d.pdf")]
+    )
+    # Leaves a deleted chunk behind that the export must not carry over
+    store.delete_document(doc_ids[3])
+    return store, doc_ids
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"], ids=["chromadb", "int8"])
+def test_round_trip_keeps_documents_and_duplicates(tmp_path, make_store, embedder, source, quantization):
+    store, (canonical, other, duplicate, deleted) = source
+    export_snapshot(store, str(tmp_path / "snapshot"))
+    embedder.texts.clear()
+
+    replica = make_store("replica", dedup_threshold=0.8, extractive=True, quantization=quantization)
+    manifest = load_snapshot(str(tmp_path / "snapshot"), replica)
+
+    assert embedder.texts == []
+    assert manifest["documents"] == 3
+    assert manifest["embeddings"] == 2
+    assert sorted(replica.documents) == sorted([canonical, other, duplicate])
+    assert replica.get_document(deleted) is None
+    for doc_id in (canonical, other, duplicate):
+        assert replica.get_document(doc_id) == store.get_document(doc_id)
+    assert replica.canonical_ids == {duplicate: canonical}
+    assert replica.duplicates == {canonical: [duplicate]}
+
+    hit = replica.search(TEXT, k=1)[0]
+    assert (hit["id"], hit["references"]) == (canonical, (duplicate,))
+    assert replica.sentence_index.answer("When do warranty defects get covered?")
+
+
+def test_loaded_store_keeps_deduplicating(tmp_path, make_store, embedder, source):
+    store, (canonical, _, duplicate, _) = source
+    export_snapshot(store, str(tmp_path / "snapshot"))
+    replica = make_store("replica", dedup_threshold=0.8)
+    load_snapshot(str(tmp_path / "snapshot"), replica)
+    embedder.texts.clear()
+
+    added = replica.add_document(TEXT, {"filename": "e.pdf"})
+    assert embedder.texts == []
+    assert replica.canonical_ids[added] == canonical
+
+    # Promotion works on the loaded chunk store and embeddings
+    replica.delete_document(canonical)
+    assert embedder.texts == []
+    assert replica.canonical_ids == {added: duplicate}
+    assert replica.search(TEXT, k=1)[0]["id"] == duplicate
+
+
+def test_verify_detects_a_modified_file(tmp_path, source):
+    store, _ = source
+    directory = str(tmp_path / "snapshot")
+    export_snapshot(store, directory)
+    verify_snapshot(directory)
+
+    path = os.path.join(directory, "documents.jsonl")
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    entry = json.loads(lines[0])
+    entry["metadata"]["filename"] = "tampered.pdf"
+    lines[0] = json.dumps(entry) + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    with pytest.raises(SnapshotError):
+        verify_snapshot(directory)
+
+
+def test_export_refuses_an_existing_directory(tmp_path, source):
+    store, _ = source
+    directory = str(tmp_path / "snapshot")
+    export_snapshot(store, directory)
+
+    with pytest.raises(SnapshotError):
+        export_snapshot(store, directory)
+    assert read_manifest(directory)["documents"] == 3
+
+
+def test_load_requires_an_empty_store(tmp_path, source):
+    store, _ = source
+    export_snapshot(store, str(tmp_path / "snapshot"))
+
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(tmp_path / "snapshot"), store)
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"], ids=["chromadb", "int8"])
+def test_export_includes_documents_persisted_in_earlier_sessions(tmp_path, make_store, embedder, quantization):
+    first = make_store("source", quantization=quantization)
+    persisted = first.add_documents([TEXT, OTHER], [{"filename": "a.pdf"}, {"filename": "b.pdf"}])
+    del first
+
+    reopened = make_store("source", quantization=quantization)
+    assert len(reopened.documents) == 0
+    added = reopened.add_document(THIRD, {"filename": "c.pdf"})
+    manifest = export_snapshot(reopened, str(tmp_path / "snapshot"))
+    embedder.texts.clear()
+
+    assert manifest["documents"] == 3
+    assert manifest["embeddings"] == 3
+    replica = make_store("replica", quantization=quantization)
+    load_snapshot(str(tmp_path / "snapshot"), replica)
+    assert embedder.texts == []
+    assert sorted(replica.documents) == sorted(persisted + [added])
+    assert replica.get_document(persisted[0]) == {"text": TEXT, "metadata": {"filename": "a.pdf", "doc_id": persisted[0]}}
+    assert replica.search(OTHER, k=1)[0]["id"] == persisted[1]
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_index import VectorIndex
+
+
+def vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "pq"])
+def test_search_finds_the_stored_vector(quantization):
+    data = vectors(500)
+    index = VectorIndex(quantization=quantization, pq_train_size=200)
+    index.add([f"doc{i}" for i in range(500)], data)
+
+    assert index.search(data[42], k=1)[0][0] == "doc42"
+    index.delete(["doc42"])
+    assert index.search(data[42], k=1)[0][0] != "doc42"
+    assert len(index) == 499
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "pq"])
+def test_compacted_drops_deleted_rows_from_the_files(tmp_path, quantization):
+    data = vectors(1000)
+    ids = [f"doc{i}" for i in range(1000)]
+    path = str(tmp_path / "index")
+    index = VectorIndex(quantization=quantization, pq_train_size=200, path=path)
+    index.add(ids, data)
+    index.delete(ids[:600])
+    size = os.path.getsize(f"{path}.f32")
+
+    assert index.should_compact()
+    compacted = index.compacted()
+
+    assert compacted.count == len(compacted) == 400
+    assert compacted.dead_rows == 0
+    assert os.path.getsize(f"{path}.f32") == size * 400 // 1000
+    for i in (600, 777, 999):
+        assert compacted.search(data[i], k=1)[0][0] == ids[i]
+    # Searches still running on the old index read its own rows
+    assert index.search(data[777], k=1)[0][0] == ids[777]
+
+    # Writes continue on the compacted files and survive a restart
+    compacted.add(["new"], data[:1])
+    compacted.delete([ids[999]])
+    reopened = VectorIndex(quantization=quantization, pq_train_size=200, path=path)
+    assert len(reopened) == 400
+    assert reopened.search(data[0], k=1)[0][0] == "new"
+    assert reopened.search(data[777], k=1)[0][0] == ids[777]
+    assert ids[999] not in reopened
+
+
+def test_compact_in_place(tmp_path):
+    data = vectors(100)
+    index = VectorIndex(quantization="int8", path=str(tmp_path / "index"))
+    index.add([f"doc{i}" for i in range(100)], data)
+    index.delete([f"doc{i}" for i in range(0, 100, 2)])
+
+    index.compact()
+
+    assert (index.count, len(index)) == (50, 50)
+    assert index.search(data[51], k=1)[0][0] == "doc51"
+
+
+def test_deletes_compact_the_store_indexes(tmp_path, make_store):
+    store = make_store(quantization="int8")
+    texts = [f"Section {i} of the pump manual covers maintenance step {i}." for i in range(40)]
+    doc_ids = store.add_documents(texts)
+    (name, index), = store.vector_indexes.items()
+    size = os.path.getsize(f"{index.path}.f32")
+
+    store.delete_documents(doc_ids[:30])
+
+    compacted = store.vector_indexes[name]
+    assert compacted is not index
+    assert compacted.count == 10
+    assert os.path.getsize(f"{compacted.path}.f32") == size // 4
+    assert store.search(texts[35], k=1)[0]["id"] == doc_ids[35]
+    assert doc_ids[5] not in {hit["id"] for hit in store.search(texts[5], k=10)}
+
+    reopened = make_store(quantization="int8")
+    assert len(reopened.vector_indexes[name]) == 10
+    assert reopened.search(texts[35], k=1)[0]["id"] == doc_ids[35]
@@ -0,0 +1,569 @@
+import gc
+import json
+import os
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+QUANTIZATION_MODES = ("none", "int8", "pq")
+
+
+class VectorIndex:
+    """
+    In-process cosine similarity index with optional quantized storage
+
+    Modes:
+        none: float32 vectors in memory, exact scan
+        int8: one int8 code per dimension plus a float32 scale per vector
+              (about 4x smaller than float32)
+        pq:   product quantization, one byte per subvector (16x or more
+              smaller); codebooks are trained with k-means once enough
+              vectors have been added
+
+    In the quantized modes the candidates of the approximate scan are
+    rescored against the exact float32 vectors, which are kept in a file
+    rather than in process memory; only the rows being rescored are read.
+
+    Given a path, the index persists itself: <path>.f32 holds the float32
+    vectors, <path>.ids a log of added and deleted IDs and <path>.pq.npy the
+    PQ codebooks. An index already at the path is loaded on construction,
+    its codes recomputed from the stored vectors.
+
+    One writer may add and delete while other threads search: rows become
+    visible only once fully written, and storage is grown by copying.
+    Deleted rows stay in storage until the index is compacted.
+    """
+
+    def __init__(self, quantization="none", rescore_factor=8, pq_subvectors=None, pq_train_size=10000,
+                 float_path=None, path=None):
+        """
+        Initialize an empty index
+
+        Args:
+            quantization (str): "none", "int8" or "pq"
+            rescore_factor (int): Candidates rescored exactly per requested result
+            pq_subvectors (int, optional): Number of PQ subvectors; defaults to
+                one per 8 dimensions
+            pq_train_size (int): Vectors collected before PQ codebooks are trained
+            float_path (str, optional): File backing the float32 vectors in the
+                quantized modes; a temporary file is used when not given
+            path (str, optional): Base path of the files persisting the index;
+                overrides float_path
+        """
+        if np is None:
+            raise ImportError("VectorIndex requires NumPy")
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.pq_subvectors = pq_subvectors
+        self.pq_train_size = pq_train_size
+        self.path = path
+        self.float_path = f"{path}.f32" if path is not None else float_path
+
+        self.dim = None
+        self.count = 0
+        self.ids = []
+        self.rows = {}
+        self._alive = np.zeros(0, dtype=bool)
+
+        self._floats = None
+        self._codes = None
+        self._scales = None
+        self._codebooks = None
+        self._temp_file = None
+        # Descriptor of the float file, kept open so this index keeps reading
+        # its own file after compacted() moves a new one over the path
+        self._float_fd = None
+
+        if path is not None and os.path.exists(f"{path}.ids"):
+            self._load()
+
+    def __del__(self):
+        if getattr(self, "_float_fd", None) is not None:
+            os.close(self._float_fd)
+            self._float_fd = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.rows
+
+    @property
+    def nbytes(self):
+        """Bytes of vector data held on the heap (excludes the float vectors kept in a file)"""
+        total = self._alive.nbytes
+        if self.quantization == "none":
+            total += self._floats.nbytes if self._floats is not None else 0
+        if self._codes is not None:
+            total += self._codes.nbytes
+        if self._scales is not None:
+            total += self._scales.nbytes
+        if self._codebooks is not None:
+            total += self._codebooks.nbytes
+        return total
+
+    def add(self, ids, vectors):
+        """
+        Add vectors; an ID that is already present is replaced
+
+        Args:
+            ids (list): Document IDs
+            vectors (list): One vector per ID
+        """
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if self.dim is None:
+            self._allocate(vectors.shape[1])
+
+        self.delete([doc_id for doc_id in ids if doc_id in self.rows])
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        start, end = self.count, self.count + len(vectors)
+        self._reserve(end)
+        if self.quantization == "none":
+            self._floats[start:end] = vectors
+        if self._float_fd is not None:
+            os.pwrite(self._float_fd, vectors.tobytes(), start * self.dim * 4)
+        self._alive[start:end] = True
+        self.ids.extend(ids)
+
+        if self.quantization == "int8":
+            self._codes[start:end], self._scales[start:end] = self._encode_int8(vectors)
+        elif self.quantization == "pq":
+            if self._codebooks is None and end >= self.pq_train_size:
+                self._train_pq(end)
+            elif self._codebooks is not None:
+                self._codes[start:end] = self._encode_pq(vectors)
+
+        # Searches only see rows below count, so publish the rows last
+        self.count = end
+        for offset, doc_id in enumerate(ids):
+            self.rows[doc_id] = start + offset
+        self._log(["add", start, list(ids)])
+
+    def delete(self, ids):
+        """
+        Remove vectors by document ID
+
+        Args:
+            ids (list): Document IDs; unknown IDs are ignored
+        """
+        deleted = []
+        for doc_id in ids:
+            row = self.rows.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+                deleted.append(doc_id)
+        if deleted:
+            self._log(["delete", deleted])
+
+    def vector(self, doc_id):
+        """
+        Get the stored (normalized) float32 vector of a document
+
+        Args:
+            doc_id (str): Document ID
+
+        Returns:
+            numpy.ndarray: Vector copy, or None if the ID is not indexed
+        """
+        row = self.rows.get(doc_id)
+        return None if row is None else np.array(self._read_rows([row])[0])
+
+    def search(self, query_vector, k=5, candidates=None):
+        """
+        Find the vectors most similar to a query
+
+        Args:
+            query_vector (list): Query embedding
+            k (int): Number of results
+            candidates (int, optional): Candidates rescored exactly in the
+                quantized modes, defaults to k * rescore_factor
+
+        Returns:
+            list: (document ID, cosine similarity) tuples, best first
+        """
+        if not self.rows:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        count = self.count
+        alive = self._alive[:count]
+
+        if self.quantization == "none" or (self.quantization == "pq" and self._codebooks is None):
+            scores = self._read_floats(0, count) @ query
+            return self._top(scores, alive, k)
+
+        if self.quantization == "int8":
+            approximate = self._scan_int8(query, count)
+        else:
+            approximate = self._scan_pq(query, count)
+
+        # Rescore the best approximate candidates against the exact vectors
+        candidates = candidates or k * self.rescore_factor
+        rows = [row for row, _ in self._top_rows(approximate, alive, candidates)]
+        rows = np.sort(rows)
+        exact = self._read_rows(rows) @ query
+        ranked = sorted(zip(rows, exact), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[row], float(score)) for row, score in ranked]
+
+    @property
+    def dead_rows(self):
+        """Rows of deleted vectors still in storage until the next compaction"""
+        return self.count - len(self.rows)
+
+    def should_compact(self, ratio=0.5):
+        """Whether deleted vectors hold more than ratio of the rows"""
+        return self.dead_rows > ratio * self.count
+
+    def compact(self):
+        """Drop deleted rows in place; not safe while other threads search"""
+        index = self.compacted()
+        if self._float_fd is not None:
+            os.close(self._float_fd)
+        self.__dict__.update(index.__dict__)
+        # The descriptor and temporary file now belong to this index only
+        index._float_fd = None
+        index._temp_file = None
+
+    def compacted(self, block=65536):
+        """
+        Copy the live vectors into a new index, leaving this one as it is
+
+        A persisted index is rebuilt at <path>.compact and its files are
+        then moved over those at path. This index keeps its open descriptor
+        of the replaced float file, so searches still running on it finish
+        correctly; it must not be written to afterwards.
+
+        Args:
+            block (int): Vectors copied at a time
+
+        Returns:
+            VectorIndex: The compacted index
+        """
+        path = None if self.path is None else f"{self.path}.compact"
+        if path is not None:
+            for suffix in (".f32", ".ids", ".pq.npy"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+        index = VectorIndex(self.quantization, self.rescore_factor, self.pq_subvectors, self.pq_train_size,
+                            path=path)
+        if self.dim is not None:
+            index._allocate(self.dim)
+        if self._codebooks is not None:
+            index._codebooks = self._codebooks
+            index._save_codebooks()
+
+        live = np.flatnonzero(self._alive[:self.count])
+        for start in range(0, len(live), block):
+            rows = live[start:start + block]
+            index.add([self.ids[row] for row in rows], np.array(self._read_rows(rows)))
+
+        if path is not None:
+            # The log last: its presence marks a complete index when loading
+            for suffix in (".f32", ".pq.npy", ".ids"):
+                if os.path.exists(path + suffix):
+                    os.replace(path + suffix, self.path + suffix)
+            index.path = self.path
+            index.float_path = f"{self.path}.f32"
+        return index
+
+    def _allocate(self, dim):
+        self.dim = dim
+        if self.path is not None and not os.path.exists(f"{self.path}.ids"):
+            with open(self.float_path, "wb"):
+                pass
+            with open(f"{self.path}.ids", "w", encoding="utf-8") as f:
+                f.write(json.dumps({"dim": dim, "quantization": self.quantization}) + "\n")
+        if self.float_path is not None:
+            self._float_fd = os.open(self.float_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if self.quantization == "int8":
+            self._codes = np.zeros((0, dim), dtype=np.int8)
+            self._scales = np.zeros(0, dtype=np.float32)
+        elif self.quantization == "pq":
+            subvectors = self.pq_subvectors or max(1, dim // 8)
+            if dim % subvectors:
+                raise ValueError(f"{dim} dimensions cannot be split into {subvectors} PQ subvectors")
+            self.pq_subvectors = subvectors
+            self._codes = np.zeros((0, subvectors), dtype=np.uint8)
+        self._floats = np.zeros((0, dim), dtype=np.float32)
+
+    def _reserve(self, size):
+        """Grow storage geometrically so appends are amortized O(1)"""
+        capacity = len(self._alive)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+
+        grown = np.zeros(capacity, dtype=bool)
+        grown[:self.count] = self._alive[:self.count]
+        self._alive = grown
+
+        if self._codes is not None:
+            codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+            codes[:self.count] = self._codes[:self.count]
+            self._codes = codes
+        if self._scales is not None:
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:self.count] = self._scales[:self.count]
+            self._scales = scales
+
+        if self.quantization == "none":
+            floats = np.zeros((capacity, self.dim), dtype=np.float32)
+            floats[:self.count] = self._floats[:self.count]
+            self._floats = floats
+        elif self.float_path is None:
+            self._temp_file = tempfile.NamedTemporaryFile(prefix="vectors-", suffix=".f32")
+            self.float_path = self._temp_file.name
+            self._float_fd = os.open(self.float_path, os.O_RDWR)
+
+    def _read_floats(self, start, end):
+        """Read a range of float32 vectors"""
+        if self.quantization == "none":
+            return self._floats[start:end]
+        data = os.pread(self._float_fd, (end - start) * self.dim * 4, start * self.dim * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(end - start, self.dim)
+
+    def _read_rows(self, rows):
+        """Read float32 vectors by row"""
+        if self.quantization == "none":
+            return self._floats[rows]
+        size = self.dim * 4
+        data = b"".join(os.pread(self._float_fd, size, int(row) * size) for row in rows)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), self.dim)
+
+    def _log(self, event):
+        if self.path is not None:
+            with open(f"{self.path}.ids", "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+
+    def _save_codebooks(self):
+        if self.path is not None:
+            # np.save would add .npy to a temporary name, so write through a file object
+            with open(f"{self.path}.pq.npy.tmp", "wb") as f:
+                np.save(f, self._codebooks)
+            os.replace(f"{self.path}.pq.npy.tmp", f"{self.path}.pq.npy")
+
+    def _load(self, block=65536):
+        """Load the index persisted at path, recomputing codes from the stored vectors"""
+        with open(f"{self.path}.ids", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header["quantization"] != self.quantization:
+                raise ValueError(f"{self.path} holds a {header['quantization']} index, not {self.quantization}")
+            ids = []
+            rows = {}
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted write
+                    continue
+                if event[0] == "add":
+                    _, start, added = event
+                    del ids[start:]
+                    for doc_id in added:
+                        rows[doc_id] = len(ids)
+                        ids.append(doc_id)
+                else:
+                    for doc_id in event[1]:
+                        rows.pop(doc_id, None)
+
+        # Rows logged as added always reached the float file first
+        count = len(ids)
+        self._allocate(header["dim"])
+        self._reserve(count)
+        self._alive[list(rows.values())] = True
+        if self.quantization == "pq" and os.path.exists(f"{self.path}.pq.npy"):
+            self._codebooks = np.load(f"{self.path}.pq.npy")
+
+        for start in range(0, count, block):
+            end = min(start + block, count)
+            if self.quantization == "none":
+                data = os.pread(self._float_fd, (end - start) * self.dim * 4, start * self.dim * 4)
+                self._floats[start:end] = np.frombuffer(data, dtype=np.float32).reshape(end - start, self.dim)
+            elif self.quantization == "int8":
+                self._codes[start:end], self._scales[start:end] = self._encode_int8(self._read_floats(start, end))
+            elif self._codebooks is not None:
+                self._codes[start:end] = self._encode_pq(self._read_floats(start, end))
+
+        self.ids = ids
+        self.rows = rows
+        self.count = count
+        if self.quantization == "pq" and self._codebooks is None and count >= self.pq_train_size:
+            self._train_pq(count)
+
+    @staticmethod
+    def _encode_int8(vectors):
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _scan_int8(self, query, count, block=65536):
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, block):
+            end = min(start + block, count)
+            scores[start:end] = (self._codes[start:end].astype(np.float32) @ query) * self._scales[start:end]
+        return scores
+
+    def _train_pq(self, count=None, iterations=15, seed=0):
+        """Train one 256-centroid k-means codebook per subvector and encode the first count rows"""
+        count = self.count if count is None else count
+        rng = np.random.default_rng(seed)
+        live = np.flatnonzero(self._alive[:count])
+        sample = live if len(live) <= self.pq_train_size else rng.choice(live, self.pq_train_size, replace=False)
+        data = np.array(self._read_rows(np.sort(sample)))
+
+        width = self.dim // self.pq_subvectors
+        centroids = min(256, len(data))
+        codebooks = np.zeros((self.pq_subvectors, 256, width), dtype=np.float32)
+        for m in range(self.pq_subvectors):
+            part = data[:, m * width:(m + 1) * width]
+            book = part[rng.choice(len(part), centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = self._nearest(part, book)
+                for c in range(centroids):
+                    members = part[assignment == c]
+                    if len(members):
+                        book[c] = members.mean(axis=0)
+            codebooks[m, :centroids] = book
+            if centroids < 256:
+                # Unused centroids are never chosen
+                codebooks[m, centroids:] = np.inf
+
+        # Encode before publishing the codebooks, which switches search to the codes
+        codes = np.zeros_like(self._codes)
+        for start in range(0, count, 65536):
+            end = min(start + 65536, count)
+            codes[start:end] = self._encode_pq(self._read_floats(start, end), codebooks)
+        self._codes = codes
+        self._codebooks = codebooks
+        self._save_codebooks()
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        distances = (
+            (vectors ** 2).sum(axis=1)[:, None]
+            - 2 * vectors @ centroids.T
+            + (centroids ** 2).sum(axis=1)[None, :]
+        )
+        return np.nan_to_num(distances, nan=np.inf).argmin(axis=1)
+
+    def _encode_pq(self, vectors, codebooks=None):
+        codebooks = self._codebooks if codebooks is None else codebooks
+        width = self.dim // self.pq_subvectors
+        codes = np.empty((len(vectors), self.pq_subvectors), dtype=np.uint8)
+        for m in range(self.pq_subvectors):
+            book = codebooks[m]
+            finite = np.isfinite(book).all(axis=1)
+            codes[:, m] = np.flatnonzero(finite)[self._nearest(vectors[:, m * width:(m + 1) * width], book[finite])]
+        return codes
+
+    def _scan_pq(self, query, count):
+        width = self.dim // self.pq_subvectors
+        # Inner product of each query subvector with every centroid
+        books = np.where(np.isfinite(self._codebooks), self._codebooks, 0)
+        tables = np.einsum("mcw,mw->mc", books, query.reshape(self.pq_subvectors, width))
+        codes = self._codes[:count]
+        scores = np.zeros(count, dtype=np.float32)
+        for m in range(self.pq_subvectors):
+            scores += tables[m, codes[:, m]]
+        return scores
+
+    def _top_rows(self, scores, alive, k):
+        scores = np.where(alive, scores, -np.inf)
+        k = min(k, int(alive.sum()))
+        if k <= 0:
+            return []
+        rows = np.argpartition(-scores, k - 1)[:k]
+        rows = rows[np.argsort(-scores[rows])]
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def _top(self, scores, alive, k):
+        return [(self.ids[row], score) for row, score in self._top_rows(scores, alive, k)]
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def benchmark_recall(count=50000, dim=384, k=10, queries=200, clusters=100, modes=QUANTIZATION_MODES, seed=0):
+    """
+    Measure memory and recall@k of each storage mode against exact search
+
+    Vectors are drawn around random cluster centres so the neighbour
+    structure resembles real embeddings more than uniform noise does.
+
+    Args:
+        count (int): Number of indexed vectors
+        dim (int): Vector dimensions
+        k (int): Neighbours per query
+        queries (int): Number of queries
+        clusters (int): Number of cluster centres
+        modes (tuple): Quantization modes to measure
+        seed (int): Random seed
+
+    Returns:
+        list: One dict per mode with heap bytes per vector, the growth of the
+            process RSS while the index was built and queried (including the
+            resident part of the mapped float vectors), the size of the float
+            file, recall@k and mean query latency
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+    query_vectors = centres[rng.integers(clusters, size=queries)] + 0.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+    ids = [str(i) for i in range(count)]
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = []
+    for query in query_vectors:
+        scores = normalized @ (query / np.linalg.norm(query))
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+
+    results = []
+    for mode in modes:
+        gc.collect()
+        rss_before = _rss_bytes()
+        index = VectorIndex(quantization=mode, pq_train_size=min(count, 20000))
+        index.add(ids, vectors)
+        if mode == "pq" and index._codebooks is None:
+            index._train_pq()
+
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(query_vectors, truth):
+            found = {int(doc_id) for doc_id, _ in index.search(query, k)}
+            hits += len(found & expected)
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        results.append({
+            "mode": mode,
+            "heap_mb": round(index.nbytes / 2 ** 20, 2),
+            "rss_mb": None if rss_before is None else round((rss_after - rss_before) / 2 ** 20, 2),
+            "disk_mb": round(os.path.getsize(index.float_path) / 2 ** 20, 2) if index.float_path else 0.0,
+            "bytes_per_vector": round(index.nbytes / count, 1),
+            "recall_at_k": round(hits / (k * queries), 4),
+            "query_ms": round(elapsed / queries * 1000, 3),
+        })
+        del index
+    return results
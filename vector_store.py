@@ -1,24 +1,130 @@
+import logging
 import os
+import re
+import threading
 import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import LRUCache
+from chunk_store import ChunkStore, DocumentRecord, DocumentSnapshot, SearchHit
+from dedup import NearDuplicateIndex
+from extractive_qa import SentenceIndex
+from metrics import timed
+from vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Stored in ChromaDB in place of embeddings when the vector index holds them
+PLACEHOLDER_EMBEDDING = [0.0]
+
+# Longest collection name ChromaDB 0.4 accepts
+MAX_COLLECTION_NAME = 63
 
 class VectorStore:
     """
     Class for creating and managing vector embeddings and search functionality
     with a fallback to simple text search if ChromaDB is not available
+    
+    Safe to use from several threads. Readers take no lock: documents is an
+    immutable snapshot that writers replace with a new dict in one
+    assignment. Writers are serialized by a lock and publish new documents
+    before indexing them and delete from the indexes before unpublishing,
+    so a search never returns an ID the snapshot it reads lacks (other
+    than documents ChromaDB persisted in an earlier session).
+    
+    Documents can be sharded over several ChromaDB collections, either by a
+    hash of the document ID or with one collection per value of a metadata
+    key such as "tenant". Searches query the shards concurrently and merge
+    the results by distance; a search for one tenant only queries its shard.
+    
+    Query embeddings and search results are cached. Every write bumps
+    version once the indexes are updated, and cached results are only
+    returned for the version they were computed at.
     """
     
-    def __init__(self, collection_name="pdf_documents", persist_directory="./chroma_db"):
-        """Initialize the vector store"""
-        # Dictionary to track documents by ID
-        self.documents = {}
+    def __init__(self, collection_name="pdf_documents", persist_directory="./chroma_db", embedding_function=None,
+                 quantization=None, dedup_threshold=None, shards=1, shard_key=None, fanout_workers=8,
+                 cache_size=256, embedding_cache_size=1024, extractive=False):
+        """
+        Initialize the vector store
+        
+        Args:
+            collection_name (str): ChromaDB collection name
+            persist_directory (str): Directory where ChromaDB persists data
+            embedding_function (callable, optional): Maps a list of texts to a
+                list of vectors; defaults to ChromaDB's default embedding model
+            quantization (str, optional): "none", "int8" or "pq" to serve vector
+                search from in-process VectorIndexes (one per shard) with that
+                storage mode instead of ChromaDB's float32 index. The indexes
+                persist themselves under persist_directory; ChromaDB persists
+                the documents with a placeholder embedding
+            dedup_threshold (float, optional): Estimated Jaccard similarity at
+                which an added chunk counts as a near-duplicate of a stored one
+                (of the same tenant, with a shard_key); duplicates reference
+                the stored chunk instead of being embedded and indexed again.
+                Disabled when None
+            shards (int): Number of collections documents are spread over by
+                a hash of their ID
+            shard_key (str, optional): Metadata key, e.g. "tenant", giving each
+                of its values its own collection; overrides shards. Documents
+                without the key go to collection_name
+            fanout_workers (int): Threads querying shards concurrently
+            cache_size (int): Search results cached by (query, k, tenant);
+                0 disables the cache
+            embedding_cache_size (int): Query embeddings cached by query text;
+                0 disables the cache
+            extractive (bool): Keep a SentenceIndex of every document for
+                extractive answers and query routing. It holds a copy of each
+                sentence plus postings, several times the size of the text
+        """
+        # Snapshot of documents by ID, never mutated once published; their
+        # text lives in the append-only chunk_store. Writers modify a
+        # copy(), which only duplicates the buckets they touch
+        self.documents = DocumentSnapshot()
+        self.chunk_store = ChunkStore()
+        self._write_lock = threading.RLock()
+        
+        # Bumped by every write once the indexes reflect it
+        self.version = 0
+        self.result_cache = LRUCache(cache_size, name="search_results")
+        self.embedding_cache = LRUCache(embedding_cache_size, name="query_embedding")
+        
+        # Sentence-level index for extractive answers, when enabled
+        self.sentence_index = SentenceIndex() if extractive else None
+        
+        # Near-duplicate chunks: canonical ID -> IDs of documents sharing its
+        # chunk, and the reverse mapping. Only canonical chunks are embedded.
+        # One index per tenant (see _dedup_index), so no tenant's document
+        # ever refers to another tenant's chunk
+        self.dedup_threshold = dedup_threshold
+        self.dedup = {} if dedup_threshold else None
+        self.duplicates = {}
+        self.canonical_ids = {}
         
         # Flag to determine if we're using ChromaDB or fallback
         self.using_chromadb = False
+        self.embedding_function = embedding_function
+        
+        # In-process vector indexes by shard name, when quantization is set
+        self.quantization = quantization
+        self.vector_indexes = None
+        self.persist_directory = persist_directory
+        
+        # Shard collections by name; collection is the default shard
+        self.collection_name = collection_name
+        self.shards = shards if shard_key is None else 1
+        self.shard_key = shard_key
+        self.collections = {}
+        self.fanout_workers = fanout_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
         
         # Try to initialize ChromaDB
         try:
             import chromadb
             from chromadb.config import Settings
+            from chromadb.utils import embedding_functions
             
             # Ensure the persist directory exists
             os.makedirs(persist_directory, exist_ok=True)
@@ -26,106 +132,536 @@ class VectorStore:
             # Initialize ChromaDB client
             self.client = chromadb.PersistentClient(path=persist_directory)
             
-            # Get or create collection
-            self.collection = self.client.get_or_create_collection(
-                name=collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+            # Get or create the shard collections
+            if self.shards > 1:
+                for shard in range(self.shards):
+                    self._collection(f"{collection_name}-{shard}")
+                self.collection = self.collections[f"{collection_name}-0"]
+            else:
+                self.collection = self._collection(collection_name)
+            if shard_key is not None:
+                # Tenant shards created in earlier sessions
+                for existing in self.client.list_collections():
+                    name = getattr(existing, "name", existing)
+                    if name not in self.collections and self._is_tenant_shard(existing):
+                        self._collection(name)
+            
+            # Embeddings are computed here rather than inside ChromaDB so
+            # embedding and index time can be measured separately
+            self.embedding_function = embedding_function or embedding_functions.DefaultEmbeddingFunction()
             
             self.using_chromadb = True
-            print("Using ChromaDB for vector search")
+            logger.info("Using ChromaDB for vector search")
         except ImportError:
-            print("ChromaDB not available, using simple text search fallback")
+            logger.warning("ChromaDB not available, using simple text search fallback")
+        
+        if quantization and self.embedding_function is not None:
+            try:
+                # Fails early for an unknown mode or without NumPy
+                VectorIndex(quantization=quantization)
+                self.vector_indexes = {}
+                self._load_vector_index()
+                logger.info(f"Using in-process vector index ({quantization})")
+            except ImportError:
+                logger.warning("NumPy not available, quantized vector index disabled")
+    
+    def _load_vector_index(self, batch_size=1000):
+        """
+        Open the persisted vector index of every shard
+        
+        Shards created before quantization was enabled hold their vectors in
+        ChromaDB; their index is filled from ChromaDB the first time.
+        """
+        if not self.using_chromadb:
+            return
+        
+        with timed("index_load") as log:
+            loaded = 0
+            for name, collection in list(self.collections.items()):
+                index = self._vector_index(name)
+                if os.path.exists(f"{index.path}.ids") or self._has_placeholders(name):
+                    loaded += len(index)
+                    continue
+                offset = 0
+                while True:
+                    stored = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+                    if not stored["ids"]:
+                        break
+                    self._vector_index(name).add(stored["ids"], stored["embeddings"])
+                    offset += len(stored["ids"])
+                loaded += offset
+            log["documents"] = loaded
+    
+    def _vector_index(self, name):
+        """In-process vector index of a shard, created on first use"""
+        index = self.vector_indexes.get(name)
+        if index is None:
+            path = None
+            if self.using_chromadb:
+                directory = os.path.join(self.persist_directory, "vector_index")
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, name)
+            index = self.vector_indexes[name] = VectorIndex(quantization=self.quantization, path=path)
+        return index
+    
+    def _indexed_vector(self, doc_id):
+        """Stored vector of a document from the in-process indexes, or None"""
+        for index in list(self.vector_indexes.values()):
+            vector = index.vector(doc_id)
+            if vector is not None:
+                return vector
+        return None
+    
+    def _collection(self, name, tenant=None):
+        """Get or create the collection of a shard, recording the tenant of a new tenant shard"""
+        collection = self.collections.get(name)
+        if collection is None:
+            metadata = {"hnsw:space": "cosine"}
+            if tenant is not None:
+                # Lets later sessions tell this store's tenant shards from
+                # other collections sharing the name prefix
+                metadata["shard_of"] = self.collection_name
+                metadata["tenant"] = str(tenant)
+            if self.quantization:
+                # Only applies to new collections; see _has_placeholders
+                metadata["embeddings"] = "placeholder"
+            collection = self.client.get_or_create_collection(name=name, metadata=metadata)
+            self.collections[name] = collection
+            if self._has_placeholders(name) and not self.quantization:
+                logger.warning(f"Collection {name} holds no vectors; open it with quantization enabled")
+        return collection
+    
+    def _is_tenant_shard(self, existing):
+        """
+        Whether an existing collection is a tenant shard of this store
+        
+        Args:
+            existing: Collection, or collection name, from list_collections
+        
+        Returns:
+            bool: True if the collection should be opened as a tenant shard
+        """
+        try:
+            if isinstance(existing, str):
+                existing = self.client.get_collection(existing)
+            metadata = existing.metadata or {}
+            if "shard_of" in metadata:
+                return metadata["shard_of"] == self.collection_name and "tenant" in metadata
+            
+            # Shards created before their tenant was recorded: the tenant of a
+            # stored document must map to the collection's name
+            if not existing.name.startswith(f"{self.collection_name}-"):
+                return False
+            stored = existing.get(limit=1, include=["metadatas"])
+            if not stored["ids"]:
+                return False
+            tenant = (stored["metadatas"][0] or {}).get(self.shard_key)
+            return tenant is not None and self.tenant_shard_name(tenant) == existing.name
+        except Exception as e:
+            logger.error(f"Error reading collection metadata from ChromaDB: {e}")
+            return False
+    
+    def _has_placeholders(self, name):
+        """Whether a shard's collection stores placeholders instead of embeddings"""
+        return (self.collections[name].metadata or {}).get("embeddings") == "placeholder"
+    
+    def chroma_embeddings(self, name, embeddings):
+        """
+        Embeddings to insert into a shard's collection
+        
+        Args:
+            name (str): Collection name
+            embeddings (list): Embedding per document
+        
+        Returns:
+            list: The embeddings, or placeholders if the vector index holds them
+        """
+        if self._has_placeholders(name):
+            return [PLACEHOLDER_EMBEDDING] * len(embeddings)
+        return embeddings
+    
+    def shard_name(self, doc_id, metadata=None):
+        """
+        Name of the collection a document belongs in
+        
+        Args:
+            doc_id (str): Document ID
+            metadata (dict, optional): Document metadata, needed with a shard_key
+        
+        Returns:
+            str: Collection name
+        """
+        if self.shard_key is not None:
+            value = (metadata or {}).get(self.shard_key)
+            return self.collection_name if value is None else self.tenant_shard_name(value)
+        if self.shards > 1:
+            return f"{self.collection_name}-{zlib.crc32(doc_id.encode('utf-8')) % self.shards}"
+        return self.collection_name
+    
+    def tenant_shard_name(self, tenant):
+        """Collection name for a shard_key value, valid for ChromaDB whatever the value"""
+        tenant = str(tenant)
+        safe = re.sub(r"\.{2,}", "_", re.sub(r"[^a-zA-Z0-9._-]", "_", tenant))[:48]
+        # The checksum keeps names unique after sanitizing and cutting, and
+        # ends them with an alphanumeric
+        checksum = f"-{zlib.crc32(tenant.encode('utf-8')):08x}"
+        prefix = f"{self.collection_name}-{safe}"[:MAX_COLLECTION_NAME - len(checksum)]
+        return prefix + checksum
+    
+    def _dedup_index(self, metadata):
+        """Near-duplicate index of the tenant a document's metadata names"""
+        scope = self.shard_name(None, metadata) if self.shard_key is not None else self.collection_name
+        index = self.dedup.get(scope)
+        if index is None:
+            index = self.dedup[scope] = NearDuplicateIndex(threshold=self.dedup_threshold)
+        return index
+    
+    def _shards_for(self, doc_ids, documents=None):
+        """Group document IDs by shard; IDs of unknown documents go to every shard"""
+        documents = self.documents if documents is None else documents
+        groups = {}
+        for doc_id in doc_ids:
+            record = documents.get(doc_id)
+            if record is None and self.shard_key is not None:
+                names = list(self.collections)
+            else:
+                names = [self.shard_name(doc_id, record.metadata if record is not None else None)]
+            for name in names:
+                groups.setdefault(name, []).append(doc_id)
+        return groups
+    
+    def _fan_out(self, function, names):
+        """
+        Call function(collection_name) for each existing shard, concurrently
+        when there are several
+        
+        Returns:
+            list: Results in the order of the shards called
+        """
+        names = [name for name in names if name in self.collections]
+        if len(names) <= 1:
+            return [function(name) for name in names]
+        if self._executor is None:
+            # Searches fan out concurrently; only one of them creates the pool
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.fanout_workers, thread_name_prefix="shard")
+        return list(self._executor.map(function, names))
+    
+    def _get(self, ids, include):
+        """collection.get() across the shards that may hold the IDs, merged into one result"""
+        groups = self._shards_for(ids)
+        merged = {"ids": []}
+        merged.update((key, []) for key in include)
+        for results in self._fan_out(lambda name: self.collections[name].get(ids=groups[name], include=include), groups):
+            merged["ids"].extend(results["ids"])
+            for key in include:
+                merged[key].extend(results[key])
+        return merged
     
-    def add_document(self, text, metadata=None):
+    def add_document(self, text, metadata=None, pages=None):
         """
         Add a document to the vector store
         
+        Every call publishes a new snapshot, copying the snapshot's bucket
+        list and one bucket (about len(documents) / 1024 entries); prefer
+        add_documents for many documents.
+        
         Args:
             text (str): Document text
             metadata (dict, optional): Document metadata
+            pages (list, optional): Text of each page, used for page citations
         
         Returns:
             str: Document ID
         """
         if not text:
             return None
-            
-        # Generate a unique document ID
-        doc_id = str(uuid.uuid4())
         
-        # Add metadata if provided, or create empty dict
-        doc_metadata = metadata or {}
-        doc_metadata['doc_id'] = doc_id
+        return self.add_documents([text], [metadata], [pages])[0]
+    
+    def add_documents(self, texts, metadatas=None, pages=None, batch_size=256, raise_errors=False):
+        """
+        Add several documents, embedding and inserting them in batches
+        
+        Args:
+            texts (list): Document texts
+            metadatas (list, optional): Metadata dict (or None) per document
+            pages (list, optional): Page texts (or None) per document
+            batch_size (int): Documents per embedding call and ChromaDB insert
+            raise_errors (bool): Raise if embedding or inserting fails, after
+                removing the documents of this call again, instead of logging
+                the error and keeping them searchable by text only
         
-        # Store document in our tracking dictionary
-        self.documents[doc_id] = {
-            'text': text,
-            'metadata': doc_metadata
-        }
+        Returns:
+            list: Document ID per text, None for empty texts
+        """
+        metadatas = metadatas or [None] * len(texts)
+        pages = pages or [None] * len(texts)
         
-        # Add document to ChromaDB if available
-        if self.using_chromadb:
+        with self._write_lock:
+            documents = self.documents
+            doc_ids = []
             try:
-                self.collection.add(
-                    documents=[text],
-                    metadatas=[doc_metadata],
-                    ids=[doc_id]
-                )
-            except Exception as e:
-                print(f"Error adding document to ChromaDB: {e}")
+                for start in range(0, len(texts), batch_size):
+                    end = start + batch_size
+                    documents = documents.copy()
+                    batch = self._stage_documents(texts[start:end], metadatas[start:end], pages[start:end], documents, doc_ids)
+                    # Publish before indexing, so every ID search can return is in the snapshot
+                    self.documents = documents
+                    self._add_to_chromadb(batch, raise_errors=raise_errors)
+            except Exception:
+                # Leave no document of this call half indexed
+                self.documents = documents
+                self.delete_documents([doc_id for doc_id in doc_ids if doc_id is not None])
+                raise
+            finally:
+                self.version += 1
+        
+        return doc_ids
+    
+    def _stage_documents(self, texts, metadatas, pages, documents, doc_ids):
+        """
+        Put new documents into the next snapshot, ahead of indexing them
+        
+        Args:
+            texts (list): Document texts
+            metadatas (list): Metadata dict (or None) per document
+            pages (list): Page texts (or None) per document
+            documents (DocumentSnapshot): Next snapshot, modified in place
+            doc_ids (list): Receives the ID per text, None for empty texts
+        
+        Returns:
+            list: (doc_id, text, metadata) of the documents to embed and
+                index; near-duplicates share a stored chunk and are left out
+        """
+        batch = []
+        for text, metadata, doc_pages in zip(texts, metadatas, pages):
+            if not text:
+                doc_ids.append(None)
+                continue
+            
+            # Generate a unique document ID
+            doc_id = str(uuid.uuid4())
+            
+            # Add metadata if provided, or create empty dict
+            doc_metadata = metadata or {}
+            doc_metadata['doc_id'] = doc_id
+            
+            signature = None
+            if self.dedup is not None:
+                dedup = self._dedup_index(doc_metadata)
+                signature = dedup.signature(text)
+                duplicate = dedup.find(signature)
+                if duplicate is not None:
+                    # Share the stored chunk rather than embedding a copy
+                    canonical_id = duplicate[0]
+                    documents[doc_id] = DocumentRecord(
+                        self.chunk_store, documents[canonical_id].chunk, doc_metadata
+                    )
+                    self.duplicates[canonical_id] = self.duplicates.get(canonical_id, []) + [doc_id]
+                    self.canonical_ids[doc_id] = canonical_id
+                    doc_ids.append(doc_id)
+                    continue
+                dedup.add(doc_id, signature)
+            
+            # Store document in the next snapshot
+            chunk = self.chunk_store.append(text)
+            documents[doc_id] = DocumentRecord(self.chunk_store, chunk, doc_metadata)
+            
+            # Index sentences for extractive answers
+            if self.sentence_index is not None:
+                self.sentence_index.add_document(doc_id, doc_pages or text, doc_metadata)
+            
+            doc_ids.append(doc_id)
+            batch.append((doc_id, text, doc_metadata))
+        return batch
+    
+    def _add_to_chromadb(self, batch, embeddings=None, raise_errors=False):
+        """Embed and insert a batch of (doc_id, text, metadata) into ChromaDB and the vector index"""
+        if not self.using_chromadb and self.vector_indexes is None:
+            return
         
-        return doc_id
+        try:
+            if embeddings is None:
+                with timed("embedding", documents=len(batch)):
+                    embeddings = self.embedding_function([text for _, text, _ in batch])
+            groups = {}
+            for item, embedding in zip(batch, embeddings):
+                groups.setdefault(self.shard_name(item[0], item[2]), []).append((item, embedding))
+            if self.vector_indexes is not None:
+                for name, group in groups.items():
+                    with timed("index_insert", documents=len(group), index="local", shard=name):
+                        self._vector_index(name).add(
+                            [doc_id for (doc_id, _, _), _ in group],
+                            [embedding for _, embedding in group]
+                        )
+            if not self.using_chromadb:
+                return
+            for name, group in groups.items():
+                # Documents of a group share their shard_key value
+                tenant = group[0][0][2].get(self.shard_key) if self.shard_key is not None else None
+                with timed("index_insert", documents=len(group), shard=name):
+                    self._collection(name, tenant).add(
+                        documents=[text for (_, text, _), _ in group],
+                        embeddings=self.chroma_embeddings(name, [embedding for _, embedding in group]),
+                        metadatas=[metadata for (_, _, metadata), _ in group],
+                        ids=[doc_id for (doc_id, _, _), _ in group]
+                    )
+        except Exception as e:
+            logger.error(f"Error adding documents to ChromaDB: {e}")
+            if raise_errors:
+                raise
     
-    def search(self, query, k=5):
+    def search(self, query, k=5, tenant=None):
         """
         Search for documents similar to the query
         
         Args:
             query (str): Query text
             k (int): Number of results to return
+            tenant (optional): Only search documents whose shard_key metadata
+                has this value; other shards are not queried
             
         Returns:
-            list: List of dicts containing matched documents and metadata
+            list: SearchHit objects; hit['document'], hit['metadata'] and
+                hit['id'] work as with plain dicts
         """
-        if self.using_chromadb:
+        if tenant is not None and self.shard_key is None:
+            raise ValueError("Searching by tenant requires a VectorStore with a shard_key")
+        
+        with timed("retrieval") as log:
+            # Read before searching: a write finishing meanwhile bumps the
+            # version, so results missing it are never served for the new one
+            version = self.version
+            key = (query, k, tenant)
+            matches = self.result_cache.get(key, version)
+            if matches is not None:
+                log["cache"] = "hit"
+            else:
+                matches = self._search(query, k, tenant, log)
+                # Results of the text fallback after an index error are not kept
+                if not log.get("fallback"):
+                    self.result_cache.put(key, tuple(matches), version)
+            log["results"] = len(matches)
+        return list(matches)
+    
+    def _embed_query(self, query):
+        """Embed a query, reusing the embedding of an identical earlier query"""
+        embedding = self.embedding_cache.get(query)
+        if embedding is None:
+            with timed("query_embedding"):
+                embedding = self.embedding_function([query])[0]
+            self.embedding_cache.put(query, embedding)
+        return embedding
+    
+    def _search(self, query, k, tenant=None, log=None):
+        """Run a search against the vector index, ChromaDB, or the text fallback"""
+        log = {} if log is None else log
+        if self.vector_indexes is not None:
             try:
-                results = self.collection.query(
-                    query_texts=[query],
-                    n_results=k
-                )
+                query_embedding = self._embed_query(query)
+                if tenant is not None:
+                    names = [self.tenant_shard_name(tenant)]
+                else:
+                    names = list(self.vector_indexes)
+                # Merge the best k of every shard by similarity
+                found = []
+                for name in names:
+                    if name in self.vector_indexes:
+                        found.extend(self.vector_indexes[name].search(query_embedding, k))
+                found.sort(key=lambda item: item[1], reverse=True)
+                found = found[:k]
+                # Reported as cosine distance, like ChromaDB
+                return self._hits([doc_id for doc_id, _ in found], [1 - score for _, score in found])
+            except Exception as e:
+                logger.error(f"Error searching the vector index: {e}")
+                log["fallback"] = True
+        
+        if self.using_chromadb and self.vector_indexes is None:
+            try:
+                query_embeddings = [self._embed_query(query)]
                 
-                matches = []
-                if results and results['documents']:
-                    for i, doc_id in enumerate(results['ids'][0]):
-                        matches.append({
-                            'document': results['documents'][0][i],
-                            'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                            'id': doc_id
-                        })
-                        
-                return matches
+                if tenant is not None:
+                    names = [self.tenant_shard_name(tenant)]
+                else:
+                    names = list(self.collections)
+                
+                def query_shard(name):
+                    with timed("shard_query", shard=name):
+                        # Text is read from the chunk store, so ChromaDB does
+                        # not need to return a copy of every matched document
+                        return self.collections[name].query(
+                            query_embeddings=query_embeddings,
+                            n_results=k,
+                            include=["metadatas", "distances"]
+                        )
+                
+                # Merge the best k of every shard by distance
+                ranked = []
+                for results in self._fan_out(query_shard, names):
+                    if results and results['ids'] and results['ids'][0]:
+                        ranked.extend(zip(results['distances'][0], results['ids'][0]))
+                ranked.sort(key=lambda item: item[0])
+                ranked = ranked[:k]
+                return self._hits([doc_id for _, doc_id in ranked], [distance for distance, _ in ranked])
             except Exception as e:
-                print(f"Error searching with ChromaDB: {e}")
+                logger.error(f"Error searching with ChromaDB: {e}")
                 # Fall back to simple search if ChromaDB search fails
+                log["fallback"] = True
         
         # Simple search fallback - search for the query in the document text
         matches = []
         query = query.lower()
         
-        for doc_id, doc_data in self.documents.items():
-            if query in doc_data['text'].lower():
-                matches.append({
-                    'document': doc_data['text'],
-                    'metadata': doc_data['metadata'],
-                    'id': doc_id
-                })
+        for doc_id, record in self.documents.items():
+            if doc_id in self.canonical_ids:
+                continue
+            if tenant is not None and record.metadata.get(self.shard_key) != tenant:
+                continue
+            if query in record.text.lower():
+                matches.append(SearchHit(doc_id, record, references=self.duplicates.get(doc_id, ())))
                 
                 if len(matches) >= k:
                     break
         
         return matches
     
+    def _hits(self, doc_ids, distances):
+        """Turn ranked IDs into SearchHits, fetching documents only ChromaDB knows"""
+        # Read after the index was queried: documents are published before
+        # they are indexed, so every ID the query saw added is in it
+        documents = self.documents
+        matches = []
+        missing = []
+        for i, doc_id in enumerate(doc_ids):
+            record = documents.get(doc_id)
+            if record is None:
+                # Persisted by ChromaDB in an earlier session
+                missing.append(i)
+                matches.append(None)
+                continue
+            matches.append(SearchHit(doc_id, record, score=distances[i], references=self.duplicates.get(doc_id, ())))
+        
+        if missing and self.using_chromadb:
+            stored = self._get([doc_ids[i] for i in missing], include=["documents", "metadatas"])
+            found = {
+                doc_id: (document, metadata)
+                for doc_id, document, metadata in zip(stored['ids'], stored['documents'], stored['metadatas'])
+            }
+            for i in missing:
+                if doc_ids[i] not in found:
+                    # Deleted since the query ran
+                    continue
+                document, metadata = found[doc_ids[i]]
+                matches[i] = {
+                    'document': document,
+                    'metadata': metadata,
+                    'id': doc_ids[i]
+                }
+        
+        return [match for match in matches if match is not None]
+    
     def get_document(self, doc_id):
         """
         Get a document by ID
@@ -136,25 +672,368 @@ class VectorStore:
         Returns:
             dict: Document data or None if not found
         """
-        return self.documents.get(doc_id)
+        record = self.documents.get(doc_id)
+        return record.to_dict() if record is not None else None
     
     def delete_document(self, doc_id):
         """
         Delete a document from the vector store
         
+        Like add_document, every call publishes a new snapshot; prefer
+        delete_documents for many documents.
+        
         Args:
             doc_id (str): Document ID
         """
         if doc_id in self.documents:
-            if self.using_chromadb:
+            self.delete_documents([doc_id])
+            return True
+        return False
+    
+    def delete_documents(self, doc_ids):
+        """
+        Delete several documents with one ChromaDB call per shard
+        
+        IDs only known to ChromaDB (persisted in an earlier session) are
+        deleted from ChromaDB as well.
+        
+        Args:
+            doc_ids (list): Document IDs
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        
+        with self._write_lock:
+            documents = self.documents.copy()
+            doc_ids, promoted = self._unindex(doc_ids, documents)
+            self._drop_documents(doc_ids, promoted, documents)
+            documents, compacted = self._compact_chunks(documents)
+            
+            self.documents = documents
+            self.version += 1
+            if compacted:
+                # Cached hits reference the old store and would keep it alive
+                self.result_cache.clear()
+    
+    def _unindex(self, doc_ids, documents, deferred=None):
+        """
+        Remove documents from the indexes ahead of publishing a snapshot without them
+        
+        Indexes are updated before the snapshot, so search never returns an
+        ID the snapshot no longer has.
+        
+        Args:
+            doc_ids (list): IDs being deleted
+            documents (DocumentSnapshot): Next snapshot, modified in place
+            deferred (list, optional): Receives the successors of promoted
+                chunks instead of indexing them now, see _promote
+        
+        Returns:
+            tuple: (IDs to drop from the snapshot, IDs of canonical documents
+                whose chunk lives on in a successor)
+        """
+        promoted = set()
+        if self.dedup is not None:
+            doc_ids, promoted = self._release_duplicates(doc_ids, documents, deferred)
+        
+        if self.using_chromadb and doc_ids:
+            try:
+                groups = self._shards_for(doc_ids, documents)
+                self._fan_out(lambda name: self.collections[name].delete(ids=groups[name]), groups)
+            except Exception as e:
+                logger.error(f"Error deleting documents from ChromaDB: {e}")
+        
+        if self.vector_indexes is not None:
+            for name, index in list(self.vector_indexes.items()):
+                index.delete(doc_ids)
+                # Like the chunk store: searches already running keep
+                # the old index, which still reads its own rows
+                if index.should_compact():
+                    with timed("index_compaction", shard=name, rows=index.count):
+                        self.vector_indexes[name] = index.compacted()
+        return doc_ids, promoted
+    
+    def _drop_documents(self, doc_ids, promoted, documents):
+        """Remove documents from the next snapshot, the chunk store and the lexical indexes"""
+        for doc_id in doc_ids:
+            record = documents.pop(doc_id, None)
+            if record is None:
+                continue
+            if self.dedup is not None:
+                self._dedup_index(record.metadata).remove(doc_id)
+            if doc_id not in promoted:
+                self.chunk_store.delete(record.chunk)
+            if self.sentence_index is not None:
+                self.sentence_index.delete_document(doc_id)
+    
+    def _compact_chunks(self, documents):
+        """
+        Reclaim the text of deleted documents once it dominates the buffer
+        
+        Readers of older snapshots keep using the old store.
+        
+        Args:
+            documents (DocumentSnapshot): Next snapshot
+        
+        Returns:
+            tuple: (snapshot to publish, rebuilt on the new store if the
+                chunk store was compacted; whether it was)
+        """
+        if not self.chunk_store.should_compact():
+            return documents, False
+        store, remap = self.chunk_store.compacted()
+        documents = DocumentSnapshot(
+            (doc_id, DocumentRecord(store, remap[record.chunk], record.metadata))
+            for doc_id, record in documents.items()
+        )
+        self.chunk_store = store
+        return documents, True
+    
+    def _release_duplicates(self, doc_ids, documents, deferred=None):
+        """
+        Drop references to shared chunks ahead of a delete
+        
+        Deleting a duplicate only removes its reference. Deleting a canonical
+        chunk that other documents still reference hands it, with its
+        embedding, to the first of them.
+        
+        Args:
+            doc_ids (list): IDs being deleted
+            documents (dict): Next snapshot, modified in place
+            deferred (list, optional): Passed on to _promote
+        
+        Returns:
+            tuple: (IDs still to delete from the indexes, IDs of canonical
+                documents whose chunk lives on in a successor)
+        """
+        remaining = []
+        for doc_id in doc_ids:
+            canonical_id = self.canonical_ids.pop(doc_id, None)
+            if canonical_id is None:
+                remaining.append(doc_id)
+                continue
+            documents.pop(doc_id, None)
+            references = [other for other in self.duplicates[canonical_id] if other != doc_id]
+            if references:
+                self.duplicates[canonical_id] = references
+            else:
+                del self.duplicates[canonical_id]
+        
+        promoted = set()
+        for doc_id in remaining:
+            successors = self.duplicates.pop(doc_id, None)
+            if successors:
+                self._promote(doc_id, successors, documents, deferred)
+                promoted.add(doc_id)
+        return remaining, promoted
+    
+    def _promote(self, canonical_id, successors, documents, deferred=None):
+        """
+        Make the first successor the canonical holder of a shared chunk
+        
+        The successor is indexed right away, unless deferred is given: it
+        then receives ((doc_id, text, metadata), embedding or None) for the
+        caller to index once a snapshot holding the successor is published.
+        """
+        successor, others = successors[0], successors[1:]
+        record = documents[successor]
+        text = record.text
+        
+        del self.canonical_ids[successor]
+        for doc_id in others:
+            self.canonical_ids[doc_id] = successor
+        if others:
+            self.duplicates[successor] = others
+        
+        dedup = self._dedup_index(record.metadata)
+        dedup.add(successor, dedup.signatures[canonical_id])
+        if self.sentence_index is not None:
+            self.sentence_index.add_document(successor, text, record.metadata)
+        
+        # Reuse the stored embedding; only re-embed if none can be found
+        embedding = None
+        if self.vector_indexes is not None:
+            embedding = self._indexed_vector(canonical_id)
+        if embedding is None and self.using_chromadb and self.vector_indexes is None:
+            try:
+                stored = self._get([canonical_id], include=["embeddings"])
+                if len(stored["embeddings"]):
+                    embedding = stored["embeddings"][0]
+            except Exception as e:
+                logger.error(f"Error reading embedding from ChromaDB: {e}")
+        if deferred is not None:
+            deferred.append(((successor, text, record.metadata), embedding))
+            return
+        self._add_to_chromadb(
+            [(successor, text, record.metadata)],
+            embeddings=None if embedding is None else [embedding]
+        )
+    
+    def find_documents(self, **where):
+        """
+        Find documents whose metadata matches all the given values
+        
+        Includes documents persisted by ChromaDB in an earlier session.
+        
+        Args:
+            **where: Metadata keys and values to match, e.g. filename="manual.pdf"
+            
+        Returns:
+            dict: Document ID -> metadata
+        """
+        found = {
+            doc_id: record.metadata
+            for doc_id, record in self.documents.items()
+            if all(record.metadata.get(key) == value for key, value in where.items())
+        }
+        
+        if self.using_chromadb and where:
+            try:
+                if len(where) == 1:
+                    chroma_where = dict(where)
+                else:
+                    chroma_where = {"$and": [{key: value} for key, value in where.items()]}
+                if self.shard_key in where:
+                    names = [self.tenant_shard_name(where[self.shard_key])]
+                else:
+                    names = list(self.collections)
+                for stored in self._fan_out(
+                    lambda name: self.collections[name].get(where=chroma_where, include=["metadatas"]), names
+                ):
+                    for doc_id, metadata in zip(stored["ids"], stored["metadatas"]):
+                        found.setdefault(doc_id, metadata)
+            except Exception as e:
+                logger.error(f"Error querying ChromaDB metadata: {e}")
+        
+        return found
+    
+    def update_metadata(self, updates):
+        """
+        Change document metadata without re-embedding
+        
+        A document stays in its shard, so the shard_key value should not be
+        changed this way.
+        
+        Args:
+            updates (dict): Document ID -> metadata values to set
+        """
+        if not updates:
+            return
+        
+        with self._write_lock:
+            previous = self.documents
+            documents = previous.copy()
+            self._stage_updates(updates, documents)
+            self.documents = documents
+            self._update_chromadb(updates, previous, documents)
+            
+            # Cached hits carry the old metadata
+            self.version += 1
+    
+    def _stage_updates(self, updates, documents):
+        """Apply metadata updates to the next snapshot"""
+        for doc_id, values in updates.items():
+            record = documents.get(doc_id)
+            if record is not None:
+                metadata = {**record.metadata, **values}
+                documents[doc_id] = DocumentRecord(record.store, record.chunk, metadata)
+                # Cite the new values in extractive answers
+                if self.sentence_index is not None:
+                    self.sentence_index.update_metadata(doc_id, metadata)
+    
+    def _update_chromadb(self, updates, previous, documents):
+        """Write metadata updates to ChromaDB, finding shards by the metadata in previous"""
+        # Duplicates are not stored in ChromaDB
+        indexed = [doc_id for doc_id in updates if doc_id not in self.canonical_ids]
+        if not self.using_chromadb or not indexed:
+            return
+        try:
+            for name, ids in self._shards_for(indexed, previous).items():
+                if name not in self.collections:
+                    continue
+                self.collections[name].update(
+                    ids=ids,
+                    metadatas=[
+                        documents[doc_id].metadata if doc_id in documents else updates[doc_id]
+                        for doc_id in ids
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"Error updating metadata in ChromaDB: {e}")
+    
+    def replace_documents(self, texts, metadatas, delete_ids, updates=None, raise_errors=False):
+        """
+        Swap one set of documents for another, e.g. for a new revision of a PDF
+        
+        Additions, metadata updates and deletions are published as one
+        snapshot, so readers see either the old or the new set of documents,
+        never a mix. The new documents are embedded first; stale IDs leave
+        the vector indexes just before the snapshot is published and new ones
+        are inserted right after it, so only those two steps separate them.
+        
+        Args:
+            texts (list): Texts of documents to add
+            metadatas (list): Metadata per added document
+            delete_ids (list): IDs of documents to delete
+            updates (dict, optional): Document ID -> metadata values to set on
+                documents that are kept
+            raise_errors (bool): Raise if embedding the new documents fails,
+                leaving the store unchanged, or if inserting them fails, after
+                removing them again
+            
+        Returns:
+            list: IDs of the added documents
+        """
+        metadatas = metadatas or [None] * len(texts)
+        updates = updates or {}
+        with self._write_lock:
+            previous = self.documents
+            documents = previous.copy()
+            doc_ids = []
+            batch = self._stage_documents(texts, metadatas, [None] * len(texts), documents, doc_ids)
+            
+            embeddings = None
+            if batch and (self.using_chromadb or self.vector_indexes is not None):
                 try:
-                    self.collection.delete(ids=[doc_id])
+                    with timed("embedding", documents=len(batch)):
+                        embeddings = self.embedding_function([text for _, text, _ in batch])
                 except Exception as e:
-                    print(f"Error deleting document from ChromaDB: {e}")
+                    logger.error(f"Error embedding documents: {e}")
+                    if raise_errors:
+                        # Nothing was published; undo the staged additions
+                        added = [doc_id for doc_id in doc_ids if doc_id is not None]
+                        promoted = set()
+                        if self.dedup is not None:
+                            added, promoted = self._release_duplicates(added, documents)
+                        self._drop_documents(added, promoted, documents)
+                        raise
+                    # Kept searchable by text only, like add_documents
+                    batch = []
             
-            del self.documents[doc_id]
-            return True
-        return False
+            self._stage_updates(updates, documents)
+            # A new document may take over the chunk of a deleted one; it
+            # can only be indexed once published
+            deferred = []
+            delete_ids, promoted = self._unindex(list(delete_ids), documents, deferred)
+            self._drop_documents(delete_ids, promoted, documents)
+            documents, compacted = self._compact_chunks(documents)
+            
+            self.documents = documents
+            self.version += 1
+            if compacted:
+                self.result_cache.clear()
+            
+            self._update_chromadb(updates, previous, documents)
+            for item, embedding in deferred:
+                self._add_to_chromadb([item], embeddings=None if embedding is None else [embedding])
+            try:
+                if batch:
+                    self._add_to_chromadb(batch, embeddings, raise_errors=raise_errors)
+            except Exception:
+                self.delete_documents([doc_id for doc_id in doc_ids if doc_id is not None])
+                raise
+        return doc_ids
     
     def get_all_documents(self):
         """
@@ -163,4 +1042,4 @@ class VectorStore:
         Returns:
             list: List of document data
         """
-        return list(self.documents.values())
\ No newline at end of file
+        return [record.to_dict() for record in self.documents.values()]
\ No newline at end of file